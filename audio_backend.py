@@ -0,0 +1,154 @@
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+from gi.repository import GLib
+
+# Slider drags are flushed at most once per frame
+FLUSH_INTERVAL_MS = 16
+SUBSCRIBE_RETRY_SECONDS = 5
+PA_VOLUME_NORM = 65536
+
+
+def _c_locale_env():
+    env = os.environ.copy()
+    env["LANG"] = "C"
+    return env
+
+
+def read_server_info():
+    # Returns (default sink name, server name); either may be None
+    result = subprocess.run(["pactl", "info"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, env=_c_locale_env())
+    if result.returncode != 0: return None, None
+    default_sink_name = server_name = None
+    for line in result.stdout.splitlines():
+        if line.startswith("Default Sink: "): default_sink_name = line.split("Default Sink: ")[1]
+        elif line.startswith("Server Name: "): server_name = line.split("Server Name: ")[1]
+    return default_sink_name, server_name
+
+
+def read_sink_volume(sink_name):
+    result = subprocess.run(["pactl", "list", "sinks"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, env=_c_locale_env())
+    if result.returncode != 0: return None
+    for sink in result.stdout.split('Sink #'):
+        if sink_name in sink:
+            for line in sink.split('\n'):
+                if 'Volume:' in line and '%' in line:
+                    percent_str = line.split('%')[0].split('/')[-1].strip()
+                    if percent_str.isdigit(): return int(percent_str)
+    return None
+
+
+def write_sink_volume(sink_name, value):
+    subprocess.run(["pactl", "set-sink-volume", sink_name, f"{value}%"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class AudioBackend:
+    def __init__(self, tasks, on_volume):
+        # on_volume(value) runs on the main thread with the sink volume in percent, or None if unavailable.
+        self.tasks = tasks
+        self.on_volume = on_volume
+        self.default_sink = None
+        self.server_name = None
+        self._pending_value = None
+        self._last_written = None
+        self._flush_id = None
+        self._read_again = False
+        self._shell = None
+        self._shell_lock = threading.Lock()
+        self._subscriber = None
+        self._stopped = False
+
+    def start(self):
+        self._request_read()
+        threading.Thread(target=self._watch, name="pactl-subscribe", daemon=True).start()
+
+    def stop(self):
+        self._stopped = True
+        for proc in (self._subscriber, self._shell):
+            if proc is not None and proc.poll() is None: proc.terminate()
+
+    def set_volume(self, value):
+        # Main thread: remember the latest value and write it on the next frame
+        self._pending_value = value
+        if self._flush_id is None: self._flush_id = GLib.timeout_add(FLUSH_INTERVAL_MS, self._flush)
+
+    def _flush(self):
+        self._flush_id = None
+        if self._pending_value is None: return False
+        value = self._pending_value
+        if self.tasks.submit(self._write, value, key="volume-write", on_done=self._on_written):
+            self._pending_value = None; self._last_written = value
+        return False
+
+    def _on_written(self, result):
+        if self._pending_value is not None and self._flush_id is None: self._flush_id = GLib.timeout_add(FLUSH_INTERVAL_MS, self._flush)
+
+    def _write(self, value):
+        # Worker thread
+        try:
+            if self.default_sink is None: self.default_sink, self.server_name = read_server_info()
+            if not self.default_sink: return
+            if self._write_through_shell(value): return
+            write_sink_volume(self.default_sink, value)
+        except FileNotFoundError:
+            print("pactl command not found. Please ensure pulseaudio-utils is installed.", file=sys.stderr)
+        except Exception as e:
+            print(f"Error changing volume with pactl: {e}", file=sys.stderr)
+
+    def _write_through_shell(self, value):
+        # A long-lived pacmd shell avoids a fork per update; PipeWire has no pacmd and falls back to pactl.
+        with self._shell_lock:
+            if self._shell is None or self._shell.poll() is not None:
+                if self._shell is not None or "pulseaudio" not in (self.server_name or "").lower() or shutil.which("pacmd") is None: return False
+                self._shell = subprocess.Popen(["pacmd"], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                               universal_newlines=True, env=_c_locale_env())
+            try:
+                self._shell.stdin.write(f"set-sink-volume {self.default_sink} {int(value * PA_VOLUME_NORM / 100)}\n")
+                self._shell.stdin.flush()
+                return True
+            except (BrokenPipeError, OSError):
+                return False
+
+    def _request_read(self):
+        # Main thread
+        if not self.tasks.submit(self._read, key="volume-read", on_done=self._on_read): self._read_again = True
+        return False
+
+    def _read(self):
+        try:
+            if self.default_sink is None: self.default_sink, self.server_name = read_server_info()
+            if not self.default_sink: return None
+            return read_sink_volume(self.default_sink)
+        except Exception as e:
+            print(f"Could not get volume with pactl: {e}", file=sys.stderr)
+            return None
+
+    def _on_read(self, value):
+        if self._read_again:
+            self._read_again = False; self._request_read(); return
+        # Ignore echoes of our own writes and readings taken mid-drag
+        if self._pending_value is not None or self.tasks.is_running("volume-write"): return
+        if value is not None and value == self._last_written:
+            self._last_written = None; return
+        self.on_volume(value)
+
+    def _watch(self):
+        # Reflect volume changes made by other clients (keyboard keys, guests, pavucontrol)
+        while not self._stopped:
+            try:
+                self._subscriber = subprocess.Popen(["pactl", "subscribe"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                                    universal_newlines=True, env=_c_locale_env())
+            except FileNotFoundError:
+                return
+            for line in self._subscriber.stdout:
+                if "'change' on server" in line:
+                    self.default_sink = None
+                    GLib.idle_add(self._request_read)
+                elif "'change' on sink #" in line:
+                    GLib.idle_add(self._request_read)
+            self._subscriber.wait()
+            if not self._stopped: time.sleep(SUBSCRIBE_RETRY_SECONDS)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# Headless benchmarks of the launcher's model layer against the libvirt test driver.
+# Usage: benchmark.py [--sizes 10,100,1000] [--iterations 20] [--output results.json] [--uri test:///default]
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid as uuidlib
+
+import libvirt
+
+import connection_manager
+import domain_model
+import search_index
+
+DEFAULT_SIZES = (10, 100, 1000)
+DEFAULT_ITERATIONS = 20
+# Same as vmlauncher.SEARCH_RESULT_LIMIT
+SEARCH_RESULT_LIMIT = 50
+SEARCH_QUERY = "win10-office-0042"
+# Every fifth domain passes through a GPU, every third of the rest is headless, the others alternate SPICE/VNC
+PASSTHROUGH_EVERY = 5
+HEADLESS_EVERY = 3
+
+
+class RpcCounter:
+    # Counts libvirt API calls by wrapping the public methods of the binding classes
+    def __init__(self):
+        self.count = 0
+        self._originals = []
+
+    def install(self):
+        self._originals = domain_model.wrap_libvirt_calls(self._count)
+
+    def uninstall(self):
+        domain_model.unwrap_libvirt_calls(self._originals)
+        self._originals = []
+
+    def _count(self):
+        self.count += 1
+
+
+def domain_xml(index):
+    name = f"win10-office-{index:04d}" if index % 2 else f"ubuntu-dev-{index:04d}"
+    devices = ["<disk type='file' device='disk'><source file='/var/lib/libvirt/images/{}.qcow2'/><target dev='vda' bus='virtio'/></disk>".format(name)]
+    if index % PASSTHROUGH_EVERY == 0:
+        devices.append("<hostdev mode='subsystem' type='pci' managed='yes'><source><address domain='0x0000' bus='0x{:02x}' slot='0x00' function='0x0'/></source></hostdev>".format(1 + index % 250))
+    elif index % HEADLESS_EVERY:
+        graphics_type = 'spice' if index % 2 else 'vnc'
+        devices.append(f"<graphics type='{graphics_type}' autoport='yes'><listen type='address' address='127.0.0.1'/></graphics>")
+    runstate = libvirt.VIR_DOMAIN_RUNNING if index % 4 else libvirt.VIR_DOMAIN_SHUTOFF
+    return f"""<domain type='test' xmlns:test='http://libvirt.org/schemas/domain/test/1.0'>
+  <name>{name}</name><uuid>{uuidlib.UUID(int=index + 1)}</uuid>
+  <title>Benchmark VM {index}</title><description>Generated for benchmark.py</description>
+  <memory unit='MiB'>2048</memory><vcpu>2</vcpu>
+  <os><type arch='x86_64'>hvm</type></os>
+  <devices>{''.join(devices)}</devices>
+  <test:runstate>{runstate}</test:runstate>
+</domain>"""
+
+
+def write_test_node(path, size):
+    with open(path, 'w') as f:
+        f.write("<node>\n" + "\n".join(domain_xml(i) for i in range(size)) + "\n</node>\n")
+
+
+def summarize(samples_ms):
+    samples_ms = sorted(samples_ms)
+    return {'mean': round(statistics.mean(samples_ms), 3), 'p50': round(samples_ms[len(samples_ms) // 2], 3),
+            'p95': round(samples_ms[min(len(samples_ms) - 1, int(len(samples_ms) * 0.95))], 3), 'max': round(samples_ms[-1], 3)}
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def run_scenario(uri, iterations, counter):
+    connections = connection_manager.ConnectionManager([('', uri)], lambda callback, *args: None)
+    descriptors = domain_model.DescriptorCache()
+    connections.connect()
+    try:
+        # Cold refresh reads every domain's XML, warm refreshes only take the bulk snapshot
+        counter.count = 0
+        domains, refresh_cold_ms = timed(connection_manager.collect_domains, connections, descriptors)
+        rpc_cold = counter.count
+        refresh_warm, rpc_warm = [], []
+        for _i in range(iterations):
+            counter.count = 0
+            _domains, elapsed = timed(connection_manager.collect_domains, connections, descriptors)
+            refresh_warm.append(elapsed); rpc_warm.append(counter.count)
+
+        # The model work behind _update_display for every VM in the carousel
+        display = []
+        for domain in domains:
+            start = time.perf_counter()
+            connections.record_for(domain); descriptors.cached(domain.UUIDString())
+            display.append((time.perf_counter() - start) * 1000)
+
+        # parse_descriptor on the XML libvirt actually returns
+        xml_descs = [(d.UUIDString(), d.XMLDesc(0)) for d in domains]
+        start = time.perf_counter()
+        for _i in range(iterations):
+            for uuid, xml_desc in xml_descs: domain_model.parse_descriptor(uuid, xml_desc)
+        parse_us = (time.perf_counter() - start) * 1e6 / max(1, iterations * len(xml_descs))
+        vm_types = {}
+        for uuid, _xml in xml_descs:
+            vm_type = descriptors.cached(uuid).vm_type; vm_types[vm_type] = vm_types.get(vm_type, 0) + 1
+
+        # Index build as done on refresh, then one search per keystroke of a typed query
+        index = search_index.SearchIndex()
+        start = time.perf_counter()
+        for domain in domains:
+            descriptor = descriptors.cached(domain.UUIDString())
+            index.update(domain.UUIDString(), domain.name(), descriptor.title, descriptor.description, descriptor.os_hints.values())
+        index_build_ms = (time.perf_counter() - start) * 1000
+        keystrokes = []
+        for _i in range(iterations):
+            for end in range(1, len(SEARCH_QUERY) + 1):
+                keystrokes.append(timed(index.search, SEARCH_QUERY[:end], SEARCH_RESULT_LIMIT)[1])
+
+        # Peak Python heap of a cold refresh with a fresh descriptor cache
+        tracemalloc.start()
+        connection_manager.collect_domains(connections, domain_model.DescriptorCache())
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'domains': len(domains), 'vm_types': vm_types,
+            'refresh_cold_ms': round(refresh_cold_ms, 3), 'refresh_warm_ms': summarize(refresh_warm),
+            'rpc_per_refresh_cold': rpc_cold, 'rpc_per_refresh_warm': max(rpc_warm),
+            'update_display_model_ms': summarize(display) if display else None,
+            'xml_parse_us_per_domain': round(parse_us, 2),
+            'search_index_build_ms': round(index_build_ms, 3), 'search_keystroke_ms': summarize(keystrokes),
+            'peak_refresh_heap_kib': peak // 1024,
+            'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+    finally:
+        connections.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark VM list refresh, XML parsing and search against the libvirt test driver.")
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES), help="comma separated domain counts")
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--uri', help="benchmark an existing connection (e.g. test:///default) instead of generated hosts")
+    parser.add_argument('--output', help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    counter = RpcCounter(); counter.install()
+    scenarios = []
+    try:
+        if args.uri:
+            scenarios.append(dict(run_scenario(args.uri, args.iterations, counter), uri=args.uri))
+        else:
+            with tempfile.TemporaryDirectory(prefix="vmlauncher-bench-") as tmpdir:
+                for size in (int(s) for s in args.sizes.split(',') if s.strip()):
+                    path = os.path.join(tmpdir, f"node-{size}.xml")
+                    write_test_node(path, size)
+                    print(f"Benchmarking {size} domains...", file=sys.stderr)
+                    scenarios.append(dict(run_scenario(f"test://{path}", args.iterations, counter), uri=f"test:///<generated {size}>"))
+    finally:
+        counter.uninstall()
+
+    results = {'version': 1, 'timestamp': time.time(), 'python': platform.python_version(),
+               'libvirt': libvirt.getVersion(), 'iterations': args.iterations, 'scenarios': scenarios}
+    data = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f: f.write(data + "\n")
+    else:
+        print(data)
+
+
+if __name__ == "__main__":
+    main()
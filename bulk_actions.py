@@ -0,0 +1,120 @@
+import fnmatch
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# settings.ini [VMLauncher]: bulk_concurrency, bulk_stagger_seconds
+DEFAULT_CONCURRENCY = 4
+# Only starts are staggered: a classroom of guests booting at once saturates shared storage
+DEFAULT_STAGGER_SECONDS = 2.0
+STAGGERED_ACTIONS = ('start',)
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+FINISHED_STATES = (DONE, SKIPPED, FAILED)
+
+
+def groups_from_settings(settings):
+    # [Groups] maps a group name to comma separated VM names or shell patterns, e.g. classroom = win10-lab-*, teacher
+    if 'Groups' not in settings: return {}
+    return {name: [p.strip() for p in value.split(',') if p.strip()] for name, value in settings['Groups'].items()}
+
+
+def options_from_settings(settings):
+    options = {'groups': groups_from_settings(settings)}
+    if 'VMLauncher' in settings:
+        s = settings['VMLauncher']
+        options['concurrency'] = max(1, s.getint('bulk_concurrency', DEFAULT_CONCURRENCY))
+        options['stagger_seconds'] = max(0.0, s.getfloat('bulk_stagger_seconds', DEFAULT_STAGGER_SECONDS))
+    return options
+
+
+def group_members(patterns, domains):
+    return [d for d in domains if any(fnmatch.fnmatchcase(d.name(), p) for p in patterns)]
+
+
+class Skipped(Exception):
+    # Raised by run_action when a VM turns out not to qualify once its action is due
+    pass
+
+
+class BulkResult:
+    __slots__ = ('uuid', 'name', 'state', 'error')
+
+    def __init__(self, uuid, name, state=PENDING, error=None):
+        self.uuid = uuid
+        self.name = name
+        self.state = state
+        self.error = error
+
+    def as_dict(self):
+        return {'name': self.name, 'state': self.state, 'error': self.error}
+
+
+class BulkRun:
+    # Runs one action over many VMs, at most `concurrency` at a time and launched `stagger_seconds` apart.
+    # jobs: (domain, skip reason or None). Progress and the final results go through dispatch (GLib.idle_add
+    # in the window); without one they are called on the worker threads.
+    def __init__(self, action, jobs, run_action, dispatch=None, on_progress=None, concurrency=DEFAULT_CONCURRENCY, stagger_seconds=0.0):
+        self.action = action
+        self.run_action = run_action
+        self.dispatch = dispatch
+        self.on_progress = on_progress
+        self.concurrency = max(1, concurrency)
+        self.stagger_seconds = max(0.0, stagger_seconds)
+        self.jobs = [(domain, BulkResult(domain.UUIDString(), domain.name(), SKIPPED if reason else PENDING, reason)) for domain, reason in jobs]
+        self.pending = {result.uuid for _domain, result in self.jobs if result.state == PENDING}
+        self._cancelled = threading.Event()
+
+    @property
+    def results(self):
+        return [result for _domain, result in self.jobs]
+
+    def is_pending(self, uuid):
+        return uuid in self.pending
+
+    def summary(self):
+        counts = dict.fromkeys(FINISHED_STATES, 0)
+        for result in self.results:
+            if result.state in counts: counts[result.state] += 1
+        return counts
+
+    def start(self, on_finished=None):
+        threading.Thread(target=self.run, args=(on_finished,), name="bulk-action", daemon=True).start()
+
+    def cancel(self):
+        # VMs already launched finish their action; the rest are skipped
+        self._cancelled.set()
+
+    def run(self, on_finished=None):
+        slots = threading.BoundedSemaphore(self.concurrency); launched = False
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="vmlauncher-bulk") as executor:
+            for domain, result in self.jobs:
+                if result.state != PENDING: continue
+                slots.acquire()
+                if launched and self.stagger_seconds: self._cancelled.wait(self.stagger_seconds)
+                if self._cancelled.is_set():
+                    slots.release(); self._update(result, SKIPPED, "Cancelled"); continue
+                launched = True
+                self._update(result, RUNNING)
+                executor.submit(self._run_one, domain, result, slots)
+        if on_finished is not None: self._notify(on_finished, self.results)
+        return self.results
+
+    def _run_one(self, domain, result, slots):
+        try: self.run_action(domain, self.action)
+        except Skipped as e: self._update(result, SKIPPED, str(e))
+        except Exception as e: self._update(result, FAILED, str(e))
+        else: self._update(result, DONE)
+        finally: slots.release()
+
+    def _update(self, result, state, error=None):
+        result.state = state; result.error = error
+        if state in FINISHED_STATES: self.pending.discard(result.uuid)
+        if self.on_progress is not None: self._notify(self.on_progress, result)
+
+    def _notify(self, callback, *args):
+        if self.dispatch is None: callback(*args)
+        else: self.dispatch(callback, *args)
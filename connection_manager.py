@@ -0,0 +1,244 @@
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import libvirt
+
+import domain_model
+import viewers
+
+DEFAULT_URI = 'qemu:///system'
+# A dead peer is noticed after KEEPALIVE_INTERVAL * (KEEPALIVE_COUNT + 1) seconds
+KEEPALIVE_INTERVAL = 5
+KEEPALIVE_COUNT = 3
+RECONNECT_MIN_SECONDS = 1
+RECONNECT_MAX_SECONDS = 60
+
+
+def qualify(key, label):
+    # The home host has an empty label, so its uuids and names stay exactly as libvirt reports them
+    return f"{key}{domain_model.HOST_SEPARATOR}{label}" if label else key
+
+
+def unqualify(key, label):
+    suffix = domain_model.HOST_SEPARATOR + label
+    return key[:-len(suffix)] if label and key.endswith(suffix) else key
+
+
+def qualify_record(record, label):
+    if not label: return record
+    return record._replace(uuid=qualify(record.uuid, label), name=qualify(record.name, label))
+
+
+def collect_domains(connections, descriptors):
+    # Worker thread: one bulk snapshot per host, plus XML only for domains missing from the descriptor cache
+    domains = connections.resync()
+    descriptors.prune(d.UUIDString() for d in domains)
+    for domain in domains:
+        uuid = domain.UUIDString()
+        # Warm-start descriptors of inactive VMs are still good enough; they are re-read when viewed
+        if descriptors.peek(uuid) is not None and not (descriptors.is_stale(uuid) and connections.is_active(domain)): continue
+        try: descriptors.get(domain)
+        except libvirt.libvirtError as e: print(f"Error reading XML for {domain.name()}: {e}", file=sys.stderr)
+    return domains
+
+
+class HostDomain:
+    # A virDomain tagged with its host so uuids and names stay unique in the merged carousel
+    def __init__(self, domain, host):
+        self.domain = domain
+        self.host = host
+
+    def UUIDString(self):
+        return qualify(self.domain.UUIDString(), self.host.label)
+
+    def name(self):
+        return qualify(self.domain.name(), self.host.label)
+
+    def __getattr__(self, attr):
+        return getattr(self.domain, attr)
+
+
+class Host:
+    def __init__(self, label, uri, dispatch):
+        self.label = label
+        self.uri = uri
+        self.remote_host = viewers.remote_host_for_uri(uri)
+        self.conn = None
+        self.engine = domain_model.DomainStateEngine(None, dispatch)
+        self.events_enabled = False
+        self.domains = []
+        self.retry_delay = RECONNECT_MIN_SECONDS
+        self.retry_timer = None
+
+    @property
+    def is_connected(self):
+        return self.conn is not None
+
+
+class ConnectionManager:
+    # Aggregates one DomainStateEngine per configured URI behind the same interface as a single engine.
+    def __init__(self, hosts, dispatch):
+        # hosts: [(label, uri)]; the first one is the home host and its VMs carry no host tag
+        self.dispatch = dispatch
+        self.hosts = [Host('' if i == 0 else label, uri, dispatch) for i, (label, uri) in enumerate(hosts)]
+        self._hosts_by_label = {host.label: host for host in self.hosts}
+        self._listeners = []
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(max_workers=len(self.hosts), thread_name_prefix="libvirt-host")
+        for host in self.hosts:
+            host.engine.add_listener(lambda change, host=host: self._on_host_change(host, change))
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners: self._listeners.remove(callback)
+
+    @property
+    def events_enabled(self):
+        connected = [host for host in self.hosts if host.is_connected]
+        return bool(connected) and all(host.events_enabled for host in connected)
+
+    def host_for(self, domain):
+        return self._hosts_by_label.get(domain_model.host_label(domain.UUIDString()), self.hosts[0])
+
+    def conn_for(self, domain):
+        # The host's connection at this moment, or None while it is away
+        return self.host_for(domain).conn
+
+    @property
+    def disconnected_hosts(self):
+        return [host for host in self.hosts if not host.is_connected]
+
+    def connect(self):
+        # Worker thread: open every host in parallel; hosts that fail keep retrying in the background
+        # while their VMs are served from the cached model.
+        domain_model.start_event_loop()
+        return sum(self._executor.map(self._connect, self.hosts))
+
+    def stop(self):
+        self._stopped = True
+        for host in self.hosts:
+            if host.retry_timer is not None: host.retry_timer.cancel()
+            conn = host.conn; host.conn = None
+            if conn is None: continue
+            host.engine.stop()
+            try: conn.close()
+            except libvirt.libvirtError as e: print(f"Error closing {host.uri}: {e}", file=sys.stderr)
+        self._executor.shutdown(wait=False)
+
+    def _connect(self, host):
+        try:
+            conn = libvirt.open(host.uri)
+        except libvirt.libvirtError as e:
+            print(f"Failed to connect to {host.uri}: {e}", file=sys.stderr)
+            self._schedule_reconnect(host)
+            return False
+        try: conn.setKeepAlive(KEEPALIVE_INTERVAL, KEEPALIVE_COUNT)
+        except libvirt.libvirtError as e: print(f"Keepalive unavailable on {host.uri}: {e}", file=sys.stderr)
+        host.events_enabled = host.engine.attach(conn)
+        host.conn = conn; host.retry_delay = RECONNECT_MIN_SECONDS
+        return True
+
+    def _schedule_reconnect(self, host):
+        if self._stopped: return
+        delay = host.retry_delay
+        host.retry_delay = min(host.retry_delay * 2, RECONNECT_MAX_SECONDS)
+        host.retry_timer = threading.Timer(delay, self._reconnect, (host,))
+        host.retry_timer.daemon = True
+        host.retry_timer.start()
+
+    def _reconnect(self, host):
+        # Timer thread
+        host.retry_timer = None
+        if self._stopped or host.is_connected: return
+        if self._connect(host):
+            self.dispatch(self._notify, domain_model.DomainChange(domain_model.CHANGE_CONNECTED, None, host.label, host.uri))
+
+    def resync(self):
+        # Worker thread: hosts are listed concurrently so a slow node only costs its own round trip.
+        # Disconnected hosts contribute their last known VMs.
+        futures = {host: self._executor.submit(host.engine.resync) for host in self.hosts if host.is_connected}
+        domains = []
+        for host in self.hosts:
+            if host in futures:
+                try: listed = [HostDomain(d, host) for d in futures[host].result()]
+                except libvirt.libvirtError as e: print(f"Error listing VMs on {host.uri}: {e}", file=sys.stderr)
+                else:
+                    # A host that dropped meanwhile keeps the cached stand-ins the UI thread gave it
+                    if host.is_connected: host.domains = listed
+            domains.extend(host.domains)
+        return domains
+
+    def collect_stats(self, stats, flags):
+        # Worker thread: one getAllDomainStats per connected host, concurrently; returns [(qualified uuid, stats)]
+        futures = {}
+        for host in self.hosts:
+            # The UI thread sets host.conn to None when the host drops; use one snapshot of it
+            conn = host.conn
+            if conn is not None: futures[host] = self._executor.submit(conn.getAllDomainStats, stats, flags)
+        results = []
+        for host, future in futures.items():
+            try: results.extend((qualify(domain.UUIDString(), host.label), values) for domain, values in future.result())
+            except libvirt.libvirtError as e: print(f"Error reading statistics on {host.uri}: {e}", file=sys.stderr)
+        return results
+
+    def seed(self, records):
+        by_host = {}
+        for record in records:
+            host = self._hosts_by_label.get(domain_model.host_label(record.uuid))
+            if host is None: continue
+            by_host.setdefault(host, []).append(record._replace(uuid=unqualify(record.uuid, host.label), name=unqualify(record.name, host.label)))
+        for host, host_records in by_host.items():
+            host.engine.seed(host_records)
+            host.domains = [domain_model.CachedDomain(qualify(r.uuid, host.label), qualify(r.name, host.label)) for r in host_records]
+
+    def get(self, uuid):
+        host = self._hosts_by_label.get(domain_model.host_label(uuid))
+        if host is None: return None
+        record = host.engine.get(unqualify(uuid, host.label))
+        return qualify_record(record, host.label) if record is not None else None
+
+    def find_by_name(self, name):
+        for host in self.hosts:
+            if host.label and not name.endswith(domain_model.HOST_SEPARATOR + host.label): continue
+            record = host.engine.find_by_name(unqualify(name, host.label))
+            if record is not None: return qualify_record(record, host.label)
+        return None
+
+    def record_for(self, domain):
+        record = self.get(domain.UUIDString())
+        if record is not None: return record
+        host = self.host_for(domain)
+        # Nothing to ask while the host is away
+        if not host.is_connected: return domain_model.VMRecord.bare(domain.UUIDString(), domain.name(), libvirt.VIR_DOMAIN_NOSTATE, False)
+        return qualify_record(host.engine.record_for(getattr(domain, 'domain', domain)), host.label)
+
+    def is_active(self, domain):
+        return self.record_for(domain).active
+
+    def is_name_active(self, name):
+        record = self.find_by_name(name)
+        return record is not None and record.active
+
+    def _on_host_change(self, host, change):
+        # Main thread: translate per-host changes into qualified ones
+        if change.kind == domain_model.CHANGE_DISCONNECTED:
+            # Keep serving the last snapshot; uuids and names of virDomain objects are known client-side
+            conn = host.conn; host.conn = None
+            host.domains = [domain_model.CachedDomain(d.UUIDString(), d.name()) for d in host.domains]
+            host.engine.stop()
+            if conn is not None:
+                try: conn.close()
+                except libvirt.libvirtError as e: print(f"Error closing {host.uri}: {e}", file=sys.stderr)
+            self._schedule_reconnect(host)
+            self._notify(change._replace(name=host.label))
+            return
+        self._notify(change._replace(uuid=qualify(change.uuid, host.label), name=qualify(change.name, host.label)))
+
+    def _notify(self, change):
+        for callback in list(self._listeners):
+            try: callback(change)
+            except Exception as e: print(f"Error handling domain change {change.kind}: {e}", file=sys.stderr)
+        return False
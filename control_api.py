@@ -0,0 +1,146 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+
+import libvirt
+
+import launcher_service
+
+# The kiosk runs as root (see vmlauncher.service); desktop sessions get a per-user socket
+SOCKET_PATH = '/run/vmlauncher.sock' if os.geteuid() == 0 else os.path.join(os.environ.get('XDG_RUNTIME_DIR') or '/tmp', f'vmlauncher-{os.getuid()}.sock')
+# Passthrough starts wait up to REVIVAL_READY_TIMEOUT_SECONDS for the supervisor
+CLIENT_TIMEOUT_SECONDS = launcher_service.REVIVAL_READY_TIMEOUT_SECONDS + 15
+UI_CALL_TIMEOUT_SECONDS = 10
+# Commands that need the launcher window; headless callers get an error
+UI_COMMANDS = ('select', 'view')
+REQUEST_ERRORS = (launcher_service.ServiceError, libvirt.libvirtError, subprocess.SubprocessError, OSError)
+
+
+def _vm(request):
+    vm = request.get('vm')
+    if not vm: raise launcher_service.ServiceError(f"'{request.get('command')}' needs a VM name")
+    return vm
+
+
+def execute(service, request, ui_handlers=None):
+    # request: {"command": ..., "vm": ..., "value": ..., "group": ...}; returns a JSON-serialisable result or raises one of REQUEST_ERRORS
+    command = request.get('command')
+    if command == 'list': return service.list_vms()
+    if command == 'refresh':
+        # The launcher window refreshes through its own task queue, so two refreshes never overlap
+        handler = (ui_handlers or {}).get('refresh')
+        if handler is not None: handler()
+        else: service.refresh()
+        return service.list_vms()
+    if command == 'status': return service.describe(service.find(_vm(request)))
+    if command == 'display': return service.display_info(service.find(_vm(request)))
+    if command == 'plan':
+        plan = service.launch_plan(service.find(_vm(request)))
+        return plan.as_dict() if plan is not None else None
+    if command == 'groups':
+        return {name: [d.name() for d in service.group_members(name)] for name in sorted(service.groups)}
+    if command in launcher_service.VM_ACTIONS and request.get('group'):
+        # Blocks until every member has been handled; failures are reported per VM, not raised
+        return [result.as_dict() for result in service.bulk_run(command, service.group_members(request['group'])).run()]
+    if command in launcher_service.VM_ACTIONS:
+        # With the window running the action is one of its tasks: never alongside another action on the same VM
+        handler = (ui_handlers or {}).get('action')
+        if handler is not None: handler(service.find(_vm(request)), command)
+        else: service.run_action(service.find(_vm(request)), command)
+        return None
+    if command == 'volume':
+        if request.get('value') is None: return service.get_volume()
+        service.set_volume(int(request['value'])); return None
+    if command in UI_COMMANDS:
+        handler = (ui_handlers or {}).get(command)
+        if handler is None: raise launcher_service.ServiceError(f"'{command}' needs the running launcher window")
+        return handler(service.find(_vm(request)))
+    raise launcher_service.ServiceError(f"Unknown command {command}")
+
+
+def call_in_ui(dispatch, fn, *args):
+    # Runs fn on the UI thread and waits for its result
+    done = threading.Event(); outcome = {}
+
+    def run():
+        try: outcome['result'] = fn(*args)
+        except Exception as e: outcome['error'] = e
+        done.set()
+        return False
+    dispatch(run)
+    if not done.wait(UI_CALL_TIMEOUT_SECONDS): raise launcher_service.ServiceError("The launcher window did not respond")
+    if 'error' in outcome: raise outcome['error']
+    return outcome.get('result')
+
+
+def call_as_task(dispatch, submit):
+    # submit(on_done, on_error) runs on the UI thread and starts a background task, or raises if it cannot;
+    # waits for that task and returns its result
+    done = threading.Event(); outcome = {}
+
+    def finish(key, value):
+        outcome[key] = value; done.set()
+    call_in_ui(dispatch, submit, lambda result: finish('result', result), lambda error: finish('error', error))
+    if not done.wait(CLIENT_TIMEOUT_SECONDS): raise launcher_service.ServiceError("The launcher is still working on it")
+    if 'error' in outcome: raise outcome['error']
+    return outcome.get('result')
+
+
+class ControlServer:
+    # JSON lines over an owner-only UNIX socket: {"command": "start", "vm": "win10"} -> {"ok": true, "result": null}
+    def __init__(self, service, ui_handlers=None, path=SOCKET_PATH):
+        self.service = service
+        self.ui_handlers = ui_handlers or {}
+        self.path = path
+        self._server = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+                print(f"Control socket {self.path} is owned by another launcher", file=sys.stderr); return False
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.path)
+            finally:
+                probe.close()
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path); os.chmod(self.path, 0o600); self._server.listen(8)
+        threading.Thread(target=self._accept_loop, name="control-api", daemon=True).start()
+        return True
+
+    def stop(self):
+        if self._server is None: return
+        self._server.close(); self._server = None
+        try: os.unlink(self.path)
+        except OSError: pass
+
+    def _accept_loop(self):
+        while self._server is not None:
+            try: client, _ = self._server.accept()
+            except OSError: return
+            threading.Thread(target=self._serve_client, args=(client,), name="control-client", daemon=True).start()
+
+    def _serve_client(self, client):
+        with client:
+            client.settimeout(CLIENT_TIMEOUT_SECONDS)
+            try:
+                request = json.loads(client.makefile('r').readline())
+                response = {'ok': True, 'result': execute(self.service, request, self.ui_handlers)}
+            except REQUEST_ERRORS + (ValueError, TypeError, AttributeError) as e:
+                response = {'ok': False, 'error': str(e)}
+            try: client.sendall(json.dumps(response).encode('utf-8') + b"\n")
+            except OSError as e: print(f"Control client went away: {e}", file=sys.stderr)
+
+
+def request(command, vm=None, value=None, path=SOCKET_PATH, group=None):
+    # Raises FileNotFoundError/ConnectionRefusedError when no launcher is listening
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        # A group action takes as long as its slowest member, plus the stagger
+        client.settimeout(None if group else CLIENT_TIMEOUT_SECONDS)
+        client.connect(path)
+        client.sendall(json.dumps({'command': command, 'vm': vm, 'value': value, 'group': group}).encode('utf-8') + b"\n")
+        return json.loads(client.makefile('r').readline())
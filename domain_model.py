@@ -0,0 +1,432 @@
+import json
+import os
+import sys
+import threading
+import xml.etree.ElementTree as ET
+import zlib
+from collections import namedtuple
+
+import libvirt
+
+# The libvirt state a domain is left in after each lifecycle event, and whether it is still active.
+LIFECYCLE_STATES = {
+    libvirt.VIR_DOMAIN_EVENT_STARTED: (libvirt.VIR_DOMAIN_RUNNING, True),
+    libvirt.VIR_DOMAIN_EVENT_RESUMED: (libvirt.VIR_DOMAIN_RUNNING, True),
+    libvirt.VIR_DOMAIN_EVENT_SUSPENDED: (libvirt.VIR_DOMAIN_PAUSED, True),
+    libvirt.VIR_DOMAIN_EVENT_SHUTDOWN: (libvirt.VIR_DOMAIN_SHUTDOWN, True),
+    libvirt.VIR_DOMAIN_EVENT_PMSUSPENDED: (libvirt.VIR_DOMAIN_PMSUSPENDED, True),
+    libvirt.VIR_DOMAIN_EVENT_STOPPED: (libvirt.VIR_DOMAIN_SHUTOFF, False),
+    libvirt.VIR_DOMAIN_EVENT_CRASHED: (libvirt.VIR_DOMAIN_CRASHED, False),
+}
+
+# Change kinds pushed to listeners
+CHANGE_ADDED = 'added'
+CHANGE_REMOVED = 'removed'
+CHANGE_DEFINED = 'defined'
+CHANGE_LIFECYCLE = 'lifecycle'
+CHANGE_REBOOT = 'reboot'
+CHANGE_GRAPHICS = 'graphics'
+CHANGE_DEVICES = 'devices'
+CHANGE_DISCONNECTED = 'disconnected'
+CHANGE_CONNECTED = 'connected'
+
+DomainChange = namedtuple('DomainChange', ['kind', 'uuid', 'name', 'detail'])
+
+# Lifecycle events after which the live XML (e.g. autoport graphics ports) differs
+DESCRIPTOR_RESET_EVENTS = (libvirt.VIR_DOMAIN_EVENT_STARTED, libvirt.VIR_DOMAIN_EVENT_STOPPED, libvirt.VIR_DOMAIN_EVENT_CRASHED)
+
+# VMs of secondary hosts are keyed '<uuid>@<host label>'; the home host's keys are plain uuids
+HOST_SEPARATOR = '@'
+
+LIBOSINFO_NS = '{http://libosinfo.org/xmlns/libvirt/domain/1.0}'
+
+ACTIVE_STATES = (libvirt.VIR_DOMAIN_RUNNING, libvirt.VIR_DOMAIN_BLOCKED, libvirt.VIR_DOMAIN_PAUSED,
+                 libvirt.VIR_DOMAIN_SHUTDOWN, libvirt.VIR_DOMAIN_PMSUSPENDED)
+SNAPSHOT_STATS = (libvirt.VIR_DOMAIN_STATS_STATE | libvirt.VIR_DOMAIN_STATS_BALLOON |
+                  libvirt.VIR_DOMAIN_STATS_VCPU | libvirt.VIR_DOMAIN_STATS_BLOCK)
+# virDomain/virConnect methods answered from the client-side object, never an RPC
+CLIENT_SIDE_METHODS = ('UUID', 'UUIDString', 'name', 'ID', 'connect', 'c_pointer')
+
+_event_loop_thread = None
+
+
+def host_label(uuid):
+    return uuid.rpartition(HOST_SEPARATOR)[2] if HOST_SEPARATOR in uuid else ''
+
+
+def wrap_libvirt_calls(on_call):
+    # Calls on_call() before every virConnect/virDomain method that may reach the daemon (benchmarks, metrics).
+    # Returns the originals for unwrap_libvirt_calls().
+    originals = []
+    for cls in (libvirt.virConnect, libvirt.virDomain):
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith('_') or attr in CLIENT_SIDE_METHODS or not callable(value): continue
+            originals.append((cls, attr, value))
+            setattr(cls, attr, _counted_call(value, on_call))
+    return originals
+
+
+def unwrap_libvirt_calls(originals):
+    for cls, attr, value in originals: setattr(cls, attr, value)
+
+
+def _counted_call(method, on_call):
+    def counted(*args, **kwargs):
+        on_call()
+        return method(*args, **kwargs)
+    return counted
+
+
+def start_event_loop():
+    # Must run before the first libvirt.open() so connections pick up the event implementation.
+    global _event_loop_thread
+    if _event_loop_thread is not None: return
+    libvirt.virEventRegisterDefaultImpl()
+
+    def run():
+        while True:
+            if libvirt.virEventRunDefaultImpl() < 0:
+                print("libvirt event loop iteration failed", file=sys.stderr)
+
+    _event_loop_thread = threading.Thread(target=run, name="libvirt-events", daemon=True)
+    _event_loop_thread.start()
+
+
+class VMRecord(namedtuple('VMRecord', ['uuid', 'name', 'state', 'active', 'vcpus', 'memory_kib', 'max_memory_kib', 'disks'])):
+    # Immutable per-VM snapshot read by the UI; events produce updated copies via _replace().
+    __slots__ = ()
+
+    @classmethod
+    def from_stats(cls, domain, stats):
+        state = stats.get('state.state', libvirt.VIR_DOMAIN_NOSTATE)
+        disks = tuple((stats.get(f'block.{i}.name'), stats.get(f'block.{i}.path'),
+                       stats.get(f'block.{i}.capacity', 0), stats.get(f'block.{i}.allocation', 0))
+                      for i in range(stats.get('block.count', 0)))
+        return cls(domain.UUIDString(), domain.name(), state, state in ACTIVE_STATES,
+                   stats.get('vcpu.current', 0), stats.get('balloon.current', 0), stats.get('balloon.maximum', 0), disks)
+
+    @classmethod
+    def bare(cls, uuid, name, state, active):
+        return cls(uuid, name, state, active, 0, 0, 0, ())
+
+
+class DomainStateEngine:
+    def __init__(self, conn, dispatch):
+        # dispatch(callback, *args) hands a call over to the UI thread, e.g. GLib.idle_add.
+        self.conn = conn
+        self.dispatch = dispatch
+        self.domains = {}
+        self.connected = True
+        self._listeners = []
+        self._callback_ids = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def attach(self, conn):
+        self.conn = conn
+        return self.start()
+
+    def seed(self, records):
+        # Warm start: serve cached records until the first resync replaces them
+        with self._lock: self.domains = {record.uuid: record for record in records}
+
+    def start(self):
+        events = [
+            (libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, self._on_lifecycle),
+            (libvirt.VIR_DOMAIN_EVENT_ID_REBOOT, self._on_reboot),
+            (libvirt.VIR_DOMAIN_EVENT_ID_GRAPHICS, self._on_graphics),
+            (libvirt.VIR_DOMAIN_EVENT_ID_DEVICE_ADDED, self._on_device_changed),
+            (libvirt.VIR_DOMAIN_EVENT_ID_DEVICE_REMOVED, self._on_device_changed),
+        ]
+        try:
+            for event_id, callback in events:
+                self._callback_ids.append(self.conn.domainEventRegisterAny(None, event_id, callback, None))
+            self.conn.registerCloseCallback(self._on_close, None)
+        except libvirt.libvirtError as e:
+            print(f"Domain events unavailable, falling back to polling: {e}", file=sys.stderr)
+            self.stop()
+            return False
+        return True
+
+    def stop(self):
+        for callback_id in self._callback_ids:
+            try: self.conn.domainEventDeregisterAny(callback_id)
+            except libvirt.libvirtError: pass
+        self._callback_ids = []
+        try: self.conn.unregisterCloseCallback()
+        except libvirt.libvirtError: pass
+
+    def resync(self):
+        # One bulk RPC regardless of the number of domains
+        try:
+            results = self.conn.getAllDomainStats(SNAPSHOT_STATS, 0)
+            domains = [domain for domain, _ in results]
+            model = {}
+            for domain, stats in results:
+                record = VMRecord.from_stats(domain, stats); model[record.uuid] = record
+        except libvirt.libvirtError as e:
+            if e.get_error_code() != libvirt.VIR_ERR_NO_SUPPORT: raise
+            domains, model = self._resync_without_stats()
+        with self._lock:
+            self.domains = model
+            self.connected = True
+        return domains
+
+    def _resync_without_stats(self):
+        # Older daemons: everything, then the active subset
+        domains = self.conn.listAllDomains(0)
+        active_uuids = {d.UUIDString() for d in self.conn.listAllDomains(libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE)}
+        model = {}
+        for domain in domains:
+            uuid = domain.UUIDString(); active = uuid in active_uuids
+            state = libvirt.VIR_DOMAIN_RUNNING if active else libvirt.VIR_DOMAIN_SHUTOFF
+            model[uuid] = VMRecord.bare(uuid, domain.name(), state, active)
+        return domains, model
+
+    def get(self, uuid):
+        return self.domains.get(uuid)
+
+    def find_by_name(self, name):
+        for entry in list(self.domains.values()):
+            if entry.name == name: return entry
+        return None
+
+    def record_for(self, domain):
+        record = self.domains.get(domain.UUIDString())
+        if record is None:
+            active = domain.isActive()
+            record = VMRecord.bare(domain.UUIDString(), domain.name(), libvirt.VIR_DOMAIN_RUNNING if active else libvirt.VIR_DOMAIN_SHUTOFF, active)
+        return record
+
+    def is_active(self, domain):
+        return self.record_for(domain).active
+
+    def is_name_active(self, name):
+        entry = self.find_by_name(name)
+        return entry is not None and entry.active
+
+    # --- Event callbacks (run on the libvirt event loop thread) ---
+
+    def _on_lifecycle(self, conn, dom, event, detail, opaque):
+        uuid = dom.UUIDString(); name = dom.name()
+        with self._lock:
+            entry = self.domains.get(uuid)
+            if event == libvirt.VIR_DOMAIN_EVENT_UNDEFINED:
+                self.domains.pop(uuid, None); entry = None; kind = CHANGE_REMOVED
+            elif entry is None:
+                entry = VMRecord.bare(uuid, name, libvirt.VIR_DOMAIN_SHUTOFF, False)
+                kind = CHANGE_ADDED
+            elif event == libvirt.VIR_DOMAIN_EVENT_DEFINED:
+                entry = entry._replace(name=name); kind = CHANGE_DEFINED
+            else:
+                kind = CHANGE_LIFECYCLE
+            if entry is not None and event in LIFECYCLE_STATES:
+                state, active = LIFECYCLE_STATES[event]
+                entry = entry._replace(state=state, active=active)
+            if entry is not None: self.domains[uuid] = entry
+        self._emit(DomainChange(kind, uuid, name, event))
+
+    def _on_reboot(self, conn, dom, opaque):
+        self._emit(DomainChange(CHANGE_REBOOT, dom.UUIDString(), dom.name(), None))
+
+    def _on_graphics(self, conn, dom, phase, local_addr, remote_addr, auth_scheme, subject, opaque):
+        self._emit(DomainChange(CHANGE_GRAPHICS, dom.UUIDString(), dom.name(), phase))
+
+    def _on_device_changed(self, conn, dom, dev_alias, opaque):
+        self._emit(DomainChange(CHANGE_DEVICES, dom.UUIDString(), dom.name(), dev_alias))
+
+    def _on_close(self, conn, reason, opaque):
+        with self._lock: self.connected = False
+        self._emit(DomainChange(CHANGE_DISCONNECTED, None, None, reason))
+
+    def _emit(self, change):
+        self.dispatch(self._notify, change)
+
+    def _notify(self, change):
+        for callback in list(self._listeners):
+            try: callback(change)
+            except Exception as e: print(f"Error handling domain change {change.kind}: {e}", file=sys.stderr)
+        return False
+
+
+class DomainDescriptor:
+    __slots__ = ('uuid', 'xml_hash', 'vm_type', 'graphics', 'hostdevs', 'os_hints', 'title', 'description')
+
+    def __init__(self, uuid, xml_hash, vm_type, graphics, hostdevs, os_hints, title, description):
+        self.uuid = uuid
+        self.xml_hash = xml_hash
+        self.vm_type = vm_type
+        self.graphics = graphics
+        self.hostdevs = hostdevs
+        self.os_hints = os_hints
+        self.title = title
+        self.description = description
+
+    def stale_copy(self):
+        return DomainDescriptor(self.uuid, None, self.vm_type, self.graphics, self.hostdevs, self.os_hints, self.title, self.description)
+
+
+def xml_hash(xml_desc):
+    return zlib.crc32(xml_desc.encode('utf-8'))
+
+
+def parse_graphics(element):
+    # Graphics attributes plus the first <listen> child and SPICE <gl>, flattened for the viewers
+    graphics = dict(element.attrib)
+    listen = element.find('listen')
+    if listen is not None:
+        graphics['listenType'] = listen.get('type')
+        if listen.get('socket'): graphics['socket'] = listen.get('socket')
+        if listen.get('address') and 'listen' not in graphics: graphics['listen'] = listen.get('address')
+    gl = element.find('gl')
+    if gl is not None and gl.get('enable') == 'yes': graphics['gl'] = 'yes'
+    return graphics
+
+
+def parse_descriptor(uuid, xml_desc):
+    root = ET.fromstring(xml_desc); devices = root.find('devices')
+    hostdevs = []
+    graphics_elements = []
+    if devices is not None:
+        for hostdev in devices.findall('hostdev'):
+            if hostdev.get('type') != 'pci': continue
+            source = hostdev.find('source')
+            address = source.find('address') if source is not None else None
+            if address is not None:
+                hostdevs.append(tuple(address.get(k) for k in ('domain', 'bus', 'slot', 'function')))
+        graphics_elements = devices.findall('graphics')
+    if hostdevs: vm_type, graphics = 'passthrough', None
+    elif graphics_elements: vm_type, graphics = 'virtual', parse_graphics(graphics_elements[0])
+    else: vm_type, graphics = 'headless', None
+
+    os_hints = {}
+    os_type = root.find('os/type')
+    if os_type is not None:
+        os_hints['type'] = os_type.text
+        os_hints['arch'] = os_type.get('arch')
+        os_hints['machine'] = os_type.get('machine')
+    libosinfo_os = root.find(f'metadata/{LIBOSINFO_NS}libosinfo/{LIBOSINFO_NS}os')
+    if libosinfo_os is not None: os_hints['id'] = libosinfo_os.get('id')
+
+    return DomainDescriptor(uuid, xml_hash(xml_desc), vm_type, graphics, hostdevs, os_hints,
+                            root.findtext('title', ''), root.findtext('description', ''))
+
+
+class DescriptorCache:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, domain):
+        uuid = domain.UUIDString()
+        descriptor = self._entries.get(uuid)
+        if isinstance(domain, CachedDomain):
+            # Warm start or disconnected host: nothing to fetch from, serve whatever was cached
+            return self.cached(uuid)
+        # Entries without a hash come from the warm-start snapshot and are re-read once connected
+        if descriptor is None or descriptor.xml_hash is None: descriptor = self.refresh(domain)
+        return descriptor
+
+    def is_stale(self, uuid):
+        descriptor = self._entries.get(uuid)
+        return descriptor is None or descriptor.xml_hash is None
+
+    def seed(self, descriptors):
+        with self._lock:
+            for descriptor in descriptors: self._entries.setdefault(descriptor.uuid, descriptor)
+
+    def refresh(self, domain, xml_desc=None):
+        # Re-parse only when the XML actually changed
+        uuid = domain.UUIDString()
+        if xml_desc is None: xml_desc = domain.XMLDesc(0)
+        current = self._entries.get(uuid)
+        if current is not None and current.xml_hash == xml_hash(xml_desc): return current
+        descriptor = parse_descriptor(uuid, xml_desc)
+        with self._lock: self._entries[uuid] = descriptor
+        return descriptor
+
+    def peek(self, uuid):
+        return self._entries.get(uuid)
+
+    def cached(self, uuid):
+        # Never does I/O; unknown domains look headless until their XML has been read
+        return self._entries.get(uuid) or DomainDescriptor(uuid, None, 'headless', None, [], {}, '', '')
+
+    def invalidate(self, uuid):
+        with self._lock: self._entries.pop(uuid, None)
+
+    def prune(self, uuids):
+        with self._lock:
+            for uuid in set(self._entries) - set(uuids): del self._entries[uuid]
+
+    def mark_stale(self, uuid):
+        # Keeps serving the old classification until the XML has been re-read
+        with self._lock:
+            descriptor = self._entries.get(uuid)
+            if descriptor is not None and descriptor.xml_hash is not None: self._entries[uuid] = descriptor.stale_copy()
+
+    def on_domain_change(self, change):
+        if change.kind in (CHANGE_REMOVED, CHANGE_DEFINED, CHANGE_DEVICES):
+            self.invalidate(change.uuid)
+        elif change.kind == CHANGE_LIFECYCLE and change.detail in DESCRIPTOR_RESET_EVENTS:
+            self.mark_stale(change.uuid)
+        elif change.kind == CHANGE_DISCONNECTED:
+            # Host-level changes carry the host label as their name. Keep serving the descriptors, re-read after reconnecting.
+            label = change.name or ''
+            with self._lock:
+                for uuid, descriptor in list(self._entries.items()):
+                    if host_label(uuid) == label and descriptor.xml_hash is not None: self._entries[uuid] = descriptor.stale_copy()
+
+
+class CachedDomain:
+    # Stand-in for a virDomain while the carousel is painted from the warm-start snapshot
+    def __init__(self, uuid, name):
+        self._uuid = uuid
+        self._name = name
+
+    def UUIDString(self):
+        return self._uuid
+
+    def name(self):
+        return self._name
+
+
+def save_warm_snapshot(path, records, descriptors):
+    entries = []
+    for record in records:
+        entry = {'record': record._replace(disks=[list(d) for d in record.disks])._asdict()}
+        descriptor = descriptors.peek(record.uuid)
+        if descriptor is not None:
+            entry['descriptor'] = {k: getattr(descriptor, k) for k in DomainDescriptor.__slots__ if k != 'xml_hash'}
+        entries.append(entry)
+    data = json.dumps({'version': 1, 'domains': entries}, sort_keys=True)
+    try:
+        with open(path) as f:
+            if f.read() == data: return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f: f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+def load_warm_snapshot(path):
+    # Returns (records, descriptors); both empty when there is no usable snapshot
+    try:
+        with open(path) as f: data = json.load(f)
+        if data.get('version') != 1: return [], []
+        records, descriptors = [], []
+        for entry in data['domains']:
+            fields = entry['record']; fields['disks'] = tuple(tuple(d) for d in fields['disks'])
+            records.append(VMRecord(**fields))
+            if 'descriptor' in entry:
+                fields = entry['descriptor']; fields['hostdevs'] = [tuple(h) for h in fields['hostdevs']]
+                descriptors.append(DomainDescriptor(xml_hash=None, **fields))
+        return records, descriptors
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        if not isinstance(e, FileNotFoundError): print(f"Ignoring warm-start snapshot {path}: {e}", file=sys.stderr)
+        return [], []
@@ -0,0 +1,135 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import libvirt
+
+import bulk_actions
+import domain_model
+
+# settings.ini [VMLauncher]: guest_shutdown_timeout, guest_shutdown_escalation = save|destroy
+DEFAULT_TIMEOUT_SECONDS = 60
+ESCALATE_SAVE = 'save'
+ESCALATE_DESTROY = 'destroy'
+# Lifecycle events end the wait early; this poll is only a safety net for missed events
+POLL_SECONDS = 5
+MAX_WORKERS = 8
+
+SHUTTING_DOWN = 'shutting down'
+ESCALATING = 'escalating'
+STOPPED = 'stopped'
+SAVED = 'saved'
+DESTROYED = 'destroyed'
+FAILED = 'failed'
+FINISHED_STATES = (STOPPED, SAVED, DESTROYED, FAILED)
+
+
+def options_from_settings(settings):
+    if 'VMLauncher' not in settings: return {}
+    s = settings['VMLauncher']
+    escalation = s.get('guest_shutdown_escalation', ESCALATE_SAVE)
+    return {'timeout_seconds': max(0, s.getint('guest_shutdown_timeout', DEFAULT_TIMEOUT_SECONDS)),
+            'escalation': escalation if escalation in (ESCALATE_SAVE, ESCALATE_DESTROY) else ESCALATE_SAVE}
+
+
+class HostShutdown:
+    # Asks every running guest to shut down at once (ACPI), waits for them through lifecycle events and, past
+    # timeout_seconds, managed-saves or destroys the stragglers in parallel. The host is powered off by the caller.
+    def __init__(self, domains, dispatch=None, on_progress=None, timeout_seconds=DEFAULT_TIMEOUT_SECONDS, escalation=ESCALATE_SAVE):
+        self.dispatch = dispatch
+        self.on_progress = on_progress
+        self.timeout_seconds = timeout_seconds
+        self.escalation = escalation
+        self.jobs = [(domain, bulk_actions.BulkResult(domain.UUIDString(), domain.name(), SHUTTING_DOWN)) for domain in domains]
+        self.cancelled = False
+        self._hurry = False
+        self._stopped_uuids = set()
+        self._cond = threading.Condition()
+
+    @property
+    def results(self):
+        return [result for _domain, result in self.jobs]
+
+    def summary(self):
+        counts = dict.fromkeys(FINISHED_STATES, 0)
+        for result in self.results:
+            if result.state in counts: counts[result.state] += 1
+        return counts
+
+    def start(self, on_finished=None):
+        threading.Thread(target=self.run, args=(on_finished,), name="host-shutdown", daemon=True).start()
+
+    def escalate_now(self):
+        with self._cond: self._hurry = True; self._cond.notify()
+
+    def cancel(self):
+        # Guests already asked to shut down keep going; nothing is escalated and the caller must not power off
+        with self._cond: self.cancelled = True; self._cond.notify()
+
+    def on_domain_change(self, change):
+        # ConnectionManager listener
+        if change.kind == domain_model.CHANGE_LIFECYCLE and change.detail == libvirt.VIR_DOMAIN_EVENT_STOPPED:
+            with self._cond: self._stopped_uuids.add(change.uuid); self._cond.notify()
+
+    def run(self, on_finished=None):
+        deadline = time.monotonic() + self.timeout_seconds; next_poll = time.monotonic() + POLL_SECONDS; waiting = []
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="vmlauncher-shutdown") as executor:
+            for domain, result in self.jobs: executor.submit(self._request_shutdown, domain, result)
+            while True:
+                if waiting and time.monotonic() >= next_poll:
+                    next_poll = time.monotonic() + POLL_SECONDS
+                    stopped = {result.uuid for domain, result in waiting if not self._is_active(domain)}
+                    with self._cond: self._stopped_uuids |= stopped
+                with self._cond:
+                    for _domain, result in self.jobs:
+                        if result.uuid in self._stopped_uuids and result.state == SHUTTING_DOWN: self._update(result, STOPPED)
+                    waiting = [(d, r) for d, r in self.jobs if r.state == SHUTTING_DOWN]
+                    if not waiting or self.cancelled: break
+                    now = time.monotonic()
+                    if now >= deadline or self._hurry:
+                        for domain, result in waiting:
+                            self._update(result, ESCALATING); executor.submit(self._escalate, domain, result)
+                        continue
+                    self._cond.wait(min(deadline, next_poll) - now)
+        if on_finished is not None: self._notify(on_finished, self.results)
+        return self.results
+
+    def _request_shutdown(self, domain, result):
+        try:
+            domain.shutdown()
+        except libvirt.libvirtError as e:
+            if not self._is_active(domain): self._mark_stopped(result); return
+            # No ACPI or agent to ask: escalate this guest straight away
+            with self._cond:
+                if result.state != SHUTTING_DOWN: return
+                self._update(result, ESCALATING, str(e))
+            self._escalate(domain, result)
+
+    def _escalate(self, domain, result):
+        if self.escalation == ESCALATE_SAVE:
+            try: domain.managedSave(0); self._update(result, SAVED); return
+            except libvirt.libvirtError as e:
+                # Guests with host devices cannot be saved; fall through to destroy
+                if not self._is_active(domain): self._mark_stopped(result); return
+                result.error = str(e)
+        try: domain.destroy(); self._update(result, DESTROYED, result.error)
+        except libvirt.libvirtError as e:
+            if not self._is_active(domain): self._mark_stopped(result)
+            else: self._update(result, FAILED, str(e))
+
+    def _mark_stopped(self, result):
+        with self._cond: self._stopped_uuids.add(result.uuid); self._cond.notify()
+        if result.state == ESCALATING: self._update(result, STOPPED)
+
+    def _is_active(self, domain):
+        try: return bool(domain.isActive())
+        except libvirt.libvirtError: return False
+
+    def _update(self, result, state, error=None):
+        result.state = state
+        if error is not None: result.error = error
+        if self.on_progress is not None: self._notify(self.on_progress, result)
+
+    def _notify(self, callback, *args):
+        if self.dispatch is None: callback(*args)
+        else: self.dispatch(callback, *args)
@@ -0,0 +1,106 @@
+import sys
+import time
+from collections import OrderedDict
+
+import gi
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import GLib, GdkPixbuf
+
+import libvirt
+
+PIXBUF_CACHE_SIZE = 32
+# Allocations are rounded to this many pixels so small resizes reuse cached scales
+SIZE_BUCKET = 32
+MAX_CONCURRENT_CAPTURES = 2
+
+
+def bucket_size(width, height):
+    if width <= 1 or height <= 1: return 0, 0
+    return max(SIZE_BUCKET, width - width % SIZE_BUCKET), max(SIZE_BUCKET, height - height % SIZE_BUCKET)
+
+
+def scale_to_fit(pixbuf, width, height):
+    if not width or not height: return pixbuf
+    ratio = min(width / pixbuf.get_width(), height / pixbuf.get_height())
+    if abs(ratio - 1.0) < 0.01: return pixbuf
+    return pixbuf.scale_simple(max(1, int(pixbuf.get_width() * ratio)), max(1, int(pixbuf.get_height() * ratio)), GdkPixbuf.InterpType.BILINEAR)
+
+
+class PixbufCache:
+    def __init__(self, capacity=PIXBUF_CACHE_SIZE):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+
+    def get(self, path, width, height):
+        key = (path, width, height)
+        pixbuf = self._entries.get(key)
+        if pixbuf is not None:
+            self._entries.move_to_end(key)
+            return pixbuf
+        try:
+            if width and height: pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(path, width, height, True)
+            else: pixbuf = GdkPixbuf.Pixbuf.new_from_file(path)
+        except GLib.Error as e:
+            print(f"Could not load image {path}: {e}", file=sys.stderr)
+            return None
+        self._entries[key] = pixbuf
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+        return pixbuf
+
+    def clear(self):
+        self._entries.clear()
+
+
+def capture_screenshot(domain, width, height):
+    # Runs on a worker thread: fetch the guest's primary screen and scale it for the carousel
+    stream = domain.connect().newStream(0)
+    chunks = []
+    try:
+        domain.screenshot(stream, 0, 0)
+        stream.recvAll(lambda st, data, buf: buf.append(data), chunks)
+        stream.finish()
+    except libvirt.libvirtError:
+        try: stream.abort()
+        except libvirt.libvirtError: pass
+        raise
+    loader = GdkPixbuf.PixbufLoader()
+    loader.write(b''.join(chunks)); loader.close()
+    return scale_to_fit(loader.get_pixbuf(), width, height)
+
+
+class ThumbnailCapturer:
+    def __init__(self, tasks, max_concurrent=MAX_CONCURRENT_CAPTURES):
+        self.tasks = tasks
+        self.max_concurrent = max_concurrent
+        self.thumbnails = {}  # uuid -> (captured_at, pixbuf)
+        self._in_progress = 0
+
+    def get(self, uuid):
+        entry = self.thumbnails.get(uuid)
+        return entry[1] if entry else None
+
+    def discard(self, uuid):
+        self.thumbnails.pop(uuid, None)
+
+    def request(self, domain, width, height, min_age, on_ready):
+        # Called on the main thread; returns False when throttled or capped.
+        uuid = domain.UUIDString()
+        entry = self.thumbnails.get(uuid)
+        if entry is not None and time.monotonic() - entry[0] < min_age: return False
+        if self._in_progress >= self.max_concurrent: return False
+        submitted = self.tasks.submit(capture_screenshot, domain, width, height, key=('thumbnail', uuid),
+                                      on_done=lambda pixbuf: self._on_captured(uuid, pixbuf, on_ready),
+                                      on_error=lambda e: self._on_failed(uuid, e))
+        if submitted: self._in_progress += 1
+        return submitted
+
+    def _on_captured(self, uuid, pixbuf, on_ready):
+        self._in_progress -= 1
+        if pixbuf is None: return
+        self.thumbnails[uuid] = (time.monotonic(), pixbuf)
+        on_ready(uuid)
+
+    def _on_failed(self, uuid, error):
+        self._in_progress -= 1
+        print(f"Screenshot of {uuid} failed: {error}", file=sys.stderr)
@@ -0,0 +1,262 @@
+import fnmatch
+import sys
+import threading
+import xml.etree.ElementTree as ET
+
+import libvirt
+
+# settings.ini [Profiles] maps a profile to comma separated VM names or shell patterns, like [Groups]:
+#   pinned = win10-office-*       dedicated host cores for the vCPUs, emulator threads on the host's cores
+#   performance = cad-*, gaming   pinned, plus memory from hugepages on the same NUMA node
+PINNED = 'pinned'
+PERFORMANCE = 'performance'
+PROFILES = (PINNED, PERFORMANCE)
+# [VMLauncher] host_cpus = 0-1: kept for the launcher, the display and QEMU emulator threads. Default: the first core.
+# Plans are made of whole cores, so a guest never shares a core's hyperthreads with the host or another guest.
+
+# Prefixes kept when a definition is rewritten for createXML
+ET.register_namespace('qemu', 'http://libvirt.org/schemas/domain/qemu/1.0')
+ET.register_namespace('libosinfo', 'http://libosinfo.org/xmlns/libvirt/domain/1.0')
+
+
+def parse_cpulist(text):
+    # "0-3,8,10-11" as used by sysfs and libvirt cpusets; "^2" exclusions are not used by the launcher
+    cpus = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part: continue
+        first, _sep, last = part.partition('-')
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def format_cpulist(cpus):
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1: ranges[-1][1] = cpu
+        else: ranges.append([cpu, cpu])
+    return ','.join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+def options_from_settings(settings):
+    options = {'profiles': {}}
+    if 'Profiles' in settings:
+        for profile, value in settings['Profiles'].items():
+            if profile not in PROFILES: print(f"Unknown launch profile {profile} in settings", file=sys.stderr); continue
+            options['profiles'][profile] = [p.strip() for p in value.split(',') if p.strip()]
+    if 'VMLauncher' in settings and settings['VMLauncher'].get('host_cpus'):
+        try: options['host_cpus'] = parse_cpulist(settings['VMLauncher']['host_cpus'])
+        except ValueError: print(f"Invalid host_cpus in settings: {settings['VMLauncher']['host_cpus']}", file=sys.stderr)
+    return options
+
+
+def _kib(element):
+    if element is None or not element.text: return 0
+    scale = {'b': 1 / 1024, 'bytes': 1 / 1024, 'k': 1, 'kib': 1, 'kb': 1000 / 1024, 'm': 1024, 'mib': 1024, 'mb': 1000 ** 2 / 1024,
+             'g': 1024 ** 2, 'gib': 1024 ** 2, 'gb': 1000 ** 3 / 1024, 't': 1024 ** 3, 'tib': 1024 ** 3, 'tb': 1000 ** 4 / 1024}
+    return int(int(element.text) * scale.get(element.get('unit', 'KiB').lower(), 1))
+
+
+class HostTopology:
+    # cells: {NUMA node: [core, ...]} where a core is the sorted tuple of its hyperthread CPU ids.
+    # page_sizes: hugepage sizes in KiB the host offers, largest first.
+    def __init__(self, cells, page_sizes):
+        self.cells = cells
+        self.page_sizes = page_sizes
+        self.core_of = {cpu: core for cores in cells.values() for core in cores for cpu in core}
+
+    @classmethod
+    def from_capabilities(cls, xml_desc):
+        root = ET.fromstring(xml_desc); cells = {}; page_sizes = set()
+        for cell in root.findall('host/topology/cells/cell'):
+            cores = {}
+            for cpu in cell.findall('cpus/cpu'):
+                cpu_id = int(cpu.get('id'))
+                # Offline CPUs are listed without siblings
+                core = tuple(sorted(parse_cpulist(cpu.get('siblings')))) if cpu.get('siblings') else (cpu_id,)
+                cores[core] = None
+            cells[int(cell.get('id'))] = list(cores)
+            sizes = [int(pages.get('size')) for pages in cell.findall('pages')]
+            # The smallest size is the base page, not a hugepage pool
+            page_sizes.update(sorted(sizes)[1:])
+        return cls(cells, sorted(page_sizes, reverse=True))
+
+    def first_core(self):
+        for node in sorted(self.cells):
+            if self.cells[node]: return set(self.cells[node][0])
+        return set()
+
+    def whole_cores(self, cpus):
+        # Every CPU sharing a core with one of cpus
+        return {cpu for c in cpus for cpu in self.core_of.get(c, (c,))}
+
+
+class LaunchPlan:
+    __slots__ = ('name', 'profile', 'vcpu_pins', 'cores', 'emulator_cpus', 'node', 'page_size_kib', 'memory_kib', 'live', 'notes')
+
+    def __init__(self, name, profile, memory_kib=0):
+        self.name = name
+        self.profile = profile
+        self.vcpu_pins = []        # host CPU of vCPU 0, 1, ...
+        self.cores = set()         # every host CPU of the cores given to the guest
+        self.emulator_cpus = set()
+        self.node = None
+        self.page_size_kib = None
+        self.memory_kib = memory_kib
+        self.live = False          # applied to a running guest instead of through createXML
+        self.notes = []
+
+    @property
+    def pages(self):
+        return -(-self.memory_kib // self.page_size_kib) if self.page_size_kib else 0
+
+    def describe(self):
+        parts = [f"{self.name}: {self.profile}"]
+        if self.vcpu_pins:
+            parts.append(f"vCPUs 0-{len(self.vcpu_pins) - 1} on host CPUs {','.join(map(str, self.vcpu_pins))}"
+                         + (f" (NUMA node {self.node})" if self.node is not None else " (across NUMA nodes)"))
+            parts.append(f"emulator on {format_cpulist(self.emulator_cpus)}")
+        if self.page_size_kib: parts.append(f"memory on {self.pages} x {self.page_size_kib} KiB hugepages")
+        elif self.node is not None: parts.append(f"memory preferred on node {self.node}")
+        if self.live: parts.append("applied live")
+        return "; ".join(parts + self.notes)
+
+    def as_dict(self):
+        return {'name': self.name, 'profile': self.profile, 'vcpu_pins': self.vcpu_pins, 'emulator_cpus': sorted(self.emulator_cpus),
+                'numa_node': self.node, 'hugepage_kib': self.page_size_kib, 'live': self.live, 'notes': self.notes, 'summary': self.describe()}
+
+
+def apply_plan(xml_desc, plan):
+    # A copy of the definition with the plan's tuning; the persistent definition itself is never redefined
+    root = ET.fromstring(xml_desc)
+    cputune = root.find('cputune')
+    if cputune is None: cputune = ET.SubElement(root, 'cputune')
+    for element in cputune.findall('vcpupin') + cputune.findall('emulatorpin'): cputune.remove(element)
+    for vcpu, cpu in enumerate(plan.vcpu_pins): ET.SubElement(cputune, 'vcpupin', vcpu=str(vcpu), cpuset=str(cpu))
+    ET.SubElement(cputune, 'emulatorpin', cpuset=format_cpulist(plan.emulator_cpus))
+    vcpu = root.find('vcpu')
+    if vcpu is not None and vcpu.get('cpuset'): del vcpu.attrib['cpuset']
+    if plan.node is not None:
+        numatune = root.find('numatune')
+        if numatune is None: numatune = ET.SubElement(root, 'numatune')
+        for element in numatune.findall('memory'): numatune.remove(element)
+        ET.SubElement(numatune, 'memory', mode='strict' if plan.page_size_kib else 'preferred', nodeset=str(plan.node))
+    if plan.page_size_kib:
+        backing = root.find('memoryBacking')
+        if backing is None: backing = ET.SubElement(root, 'memoryBacking')
+        for element in backing.findall('hugepages'): backing.remove(element)
+        ET.SubElement(ET.SubElement(backing, 'hugepages'), 'page', size=str(plan.page_size_kib), unit='KiB')
+    return ET.tostring(root, encoding='unicode')
+
+
+class LaunchPlanner:
+    # Starts VMs that have a profile with a plan that shares no core with the host or another pinned guest.
+    # Plans are made one at a time under a lock and stay reserved until the guest runs, so a bulk start
+    # spreads its VMs over the free cores instead of stacking them.
+    def __init__(self, profiles=None, host_cpus=None):
+        self.profiles = profiles or {}
+        self.host_cpus = host_cpus
+        self._starting = {}
+        self._lock = threading.Lock()
+
+    def profile_for(self, name):
+        for profile in PROFILES:
+            if any(fnmatch.fnmatchcase(name, p) for p in self.profiles.get(profile, ())): return profile
+        return None
+
+    def plan(self, conn, domain):
+        # Dry run: the plan a start would use now, or None without a profile
+        profile = self.profile_for(domain.name())
+        if profile is None: return None
+        with self._lock: return self._plan(conn, domain, profile, ET.fromstring(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE)))
+
+    def start(self, conn, domain):
+        # Blocks like domain.create(); returns the plan that was applied, or None
+        profile = self.profile_for(domain.name())
+        if profile is None: domain.create(); return None
+        uuid = domain.UUIDString()
+        xml_desc = domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE | libvirt.VIR_DOMAIN_XML_SECURE)
+        with self._lock:
+            plan = self._plan(conn, domain, profile, ET.fromstring(xml_desc))
+            self._starting[uuid] = plan
+        try:
+            if not plan.vcpu_pins: domain.create(); return plan
+            # A managed save image is only restored by create(); the pinning follows once it runs
+            if domain.hasManagedSaveImage(0):
+                domain.create(); self._pin_live(domain, plan); return plan
+            try:
+                conn.createXML(apply_plan(xml_desc, plan), 0)
+            except libvirt.libvirtError as e:
+                print(f"Tuned start of {domain.name()} failed, starting it as defined: {e}", file=sys.stderr)
+                plan.notes.append("tuned start failed")
+                domain.create(); self._pin_live(domain, plan)
+            return plan
+        finally:
+            with self._lock: del self._starting[uuid]
+
+    def _pin_live(self, domain, plan):
+        # Memory cannot move to hugepages on a running guest; CPU pinning can
+        plan.live = True
+        if plan.page_size_kib: plan.notes.append("hugepages not applied"); plan.page_size_kib = None
+        count = max(max(plan.vcpu_pins), max(plan.emulator_cpus, default=0)) + 1
+        try:
+            for vcpu, cpu in enumerate(plan.vcpu_pins):
+                domain.pinVcpuFlags(vcpu, tuple(i == cpu for i in range(count)), libvirt.VIR_DOMAIN_AFFECT_LIVE)
+            if plan.emulator_cpus: domain.pinEmulator(tuple(i in plan.emulator_cpus for i in range(count)), libvirt.VIR_DOMAIN_AFFECT_LIVE)
+        except libvirt.libvirtError as e:
+            print(f"Error pinning {domain.name()}: {e}", file=sys.stderr); plan.notes.append("pinning failed")
+
+    def _busy_cpus(self, conn, uuid):
+        # Host CPUs pinned by running guests (other than uuid) and by plans still starting
+        busy = set()
+        for other in conn.listAllDomains(libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE):
+            if other.UUIDString() == uuid: continue
+            try: root = ET.fromstring(other.XMLDesc(0))
+            except libvirt.libvirtError: continue
+            for pin in root.findall('cputune/vcpupin'): busy |= parse_cpulist(pin.get('cpuset', ''))
+            cpuset = root.find('vcpu').get('cpuset') if root.find('vcpu') is not None else None
+            if cpuset: busy |= parse_cpulist(cpuset)
+        for plan in self._starting.values(): busy |= plan.cores
+        return busy
+
+    def _free_pages(self, conn, topology):
+        # {node: {size KiB: free pages}}, less what plans still starting will take
+        if not topology.page_sizes: return {}
+        try: free = conn.getFreePages(topology.page_sizes, 0, max(topology.cells) + 1)
+        except libvirt.libvirtError as e: print(f"Error reading free hugepages: {e}", file=sys.stderr); return {}
+        free = {node: dict(sizes) for node, sizes in free.items()}
+        for plan in self._starting.values():
+            if plan.page_size_kib and plan.node in free: free[plan.node][plan.page_size_kib] -= plan.pages
+        return free
+
+    def _plan(self, conn, domain, profile, root):
+        vcpu = root.find('vcpu')
+        vcpus = int(vcpu.get('current') or vcpu.text) if vcpu is not None else 1
+        plan = LaunchPlan(domain.name(), profile, _kib(root.find('memory')))
+        topology = HostTopology.from_capabilities(conn.getCapabilities())
+        if not topology.cells: plan.notes.append("host reports no CPU topology, started as defined"); return plan
+        host_cpus = topology.whole_cores(self.host_cpus if self.host_cpus else topology.first_core())
+        busy = topology.whole_cores(self._busy_cpus(conn, domain.UUIDString())) | host_cpus
+        free = {node: [core for core in cores if not busy.intersection(core)] for node, cores in topology.cells.items()}
+        free_pages = self._free_pages(conn, topology) if profile == PERFORMANCE else {}
+
+        def page_size(node):
+            for size in topology.page_sizes:
+                if plan.memory_kib % size == 0 and free_pages.get(node, {}).get(size, 0) >= plan.memory_kib // size: return size
+            return None
+
+        fitting = [node for node, cores in free.items() if sum(map(len, cores)) >= vcpus]
+        if fitting:
+            # Prefer a node that can also hold the memory in hugepages, then the emptiest
+            node = max(fitting, key=lambda n: (page_size(n) is not None, sum(map(len, free[n])), -n))
+            cores = free[node]; plan.node = node; plan.page_size_kib = page_size(node)
+            if profile == PERFORMANCE and plan.page_size_kib is None: plan.notes.append(f"not enough free hugepages on node {node}")
+        else:
+            cores = [core for n in sorted(free) for core in free[n]]
+            if sum(map(len, cores)) < vcpus:
+                plan.notes.append(f"only {sum(map(len, cores))} free host CPUs for {vcpus} vCPUs, started unpinned"); return plan
+        for core in cores:
+            if len(plan.vcpu_pins) >= vcpus: break
+            plan.cores.update(core); plan.vcpu_pins.extend(core[:vcpus - len(plan.vcpu_pins)])
+        plan.emulator_cpus = host_cpus
+        return plan
@@ -0,0 +1,237 @@
+import configparser
+import os
+import select
+import subprocess
+import sys
+import time
+
+import libvirt
+
+import audio_backend
+import bulk_actions
+import connection_manager
+import domain_model
+import host_shutdown
+import launch_profiles
+import pci_index
+import prewarm
+
+SETTINGS_FILE = os.path.expanduser('~/.config/vmlauncher/settings.ini')
+VM_ACTIONS = ('start', 'shutdown', 'reboot', 'destroy')
+# How long a passthrough start waits for the revival supervisor to acknowledge
+REVIVAL_READY_TIMEOUT_SECONDS = 15
+REVIVAL_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'revival_script.py')
+
+
+class ServiceError(Exception):
+    # A request that cannot be carried out, with a message fit for the user
+    pass
+
+
+def hosts_from_settings(settings):
+    # [Hosts] maps a label to a libvirt URI; the first entry is the home host
+    if 'Hosts' in settings and len(settings['Hosts']): return list(settings['Hosts'].items())
+    return [('', connection_manager.DEFAULT_URI)]
+
+
+def load_settings(path=SETTINGS_FILE):
+    settings = configparser.ConfigParser()
+    settings.read(path)
+    return settings
+
+
+def wait_for_revival_ready(args, timeout=REVIVAL_READY_TIMEOUT_SECONDS):
+    # Reads the client's output only up to READY=1: a supervisor it spawned may outlive it, so EOF is no signal
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, universal_newlines=True, preexec_fn=os.setpgrp)
+    deadline = time.monotonic() + timeout; output = []
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([proc.stdout], [], [], remaining)[0]:
+                proc.kill(); proc.wait(); raise subprocess.TimeoutExpired(args, timeout, "".join(output))
+            line = proc.stdout.readline()
+            if not line: raise subprocess.CalledProcessError(proc.wait(), args, "".join(output))
+            output.append(line)
+            if line.strip() == "READY=1": proc.wait(); return
+    finally:
+        proc.stdout.close()
+
+
+class LauncherService:
+    # The GTK-free core behind the kiosk window, the control socket and vmlauncherctl.py.
+    # Everything that talks to libvirt or pactl blocks and belongs on a worker thread.
+    def __init__(self, hosts, dispatch, groups=None, concurrency=bulk_actions.DEFAULT_CONCURRENCY, stagger_seconds=bulk_actions.DEFAULT_STAGGER_SECONDS,
+                 shutdown_options=None, launch_options=None, prewarm_options=None):
+        self.connections = connection_manager.ConnectionManager(hosts, dispatch)
+        self.descriptors = domain_model.DescriptorCache()
+        self.connections.add_listener(self.descriptors.on_domain_change)
+        self.connections.add_listener(self._on_domain_change)
+        self.domains = []
+        self.groups = groups or {}
+        self.bulk_concurrency = concurrency
+        self.bulk_stagger_seconds = stagger_seconds
+        self.shutdown_options = shutdown_options or {}
+        # Local PCI devices, rescanned on every refresh since passthrough starts rebind drivers
+        self.pci = None
+        self.planner = launch_profiles.LaunchPlanner(**(launch_options or {}))
+        # The launch plan of every running VM started with a profile, by uuid
+        self.launch_plans = {}
+        self.prewarmer = prewarm.Prewarmer(**(prewarm_options or {}))
+
+    def connect(self):
+        return self.connections.connect()
+
+    def stop(self):
+        self.connections.stop()
+
+    def refresh(self):
+        domains = connection_manager.collect_domains(self.connections, self.descriptors)
+        self.pci = pci_index.PCIIndex.scan()
+        self.domains = sorted(domains, key=lambda d: d.name().lower())
+        return self.domains
+
+    def _on_domain_change(self, change):
+        if change.kind == domain_model.CHANGE_LIFECYCLE and change.detail == libvirt.VIR_DOMAIN_EVENT_STOPPED: self.launch_plans.pop(change.uuid, None)
+
+    def find(self, name_or_uuid):
+        for domain in self.domains:
+            if name_or_uuid in (domain.name(), domain.UUIDString()): return domain
+        raise ServiceError(f"No VM named {name_or_uuid}")
+
+    def describe(self, domain):
+        record = self.connections.record_for(domain); descriptor = self.descriptors.cached(record.uuid)
+        return {'uuid': record.uuid, 'name': record.name, 'host': domain_model.host_label(record.uuid),
+                'state': record.state, 'active': record.active, 'vm_type': descriptor.vm_type,
+                'vcpus': record.vcpus, 'memory_kib': record.memory_kib or record.max_memory_kib,
+                'title': descriptor.title, 'offline': isinstance(domain, domain_model.CachedDomain),
+                'launch_plan': self.launch_plans[record.uuid].describe() if record.active and record.uuid in self.launch_plans else None}
+
+    def list_vms(self):
+        return [self.describe(domain) for domain in self.domains]
+
+    def is_passthrough(self, domain, fresh=True):
+        # fresh reads the XML if the cached classification is stale (worker threads); the UI passes False
+        descriptor = self.descriptors.get(domain) if fresh else self.descriptors.cached(domain.UUIDString())
+        return descriptor.vm_type == 'passthrough'
+
+    def can_start_passthrough(self, domain):
+        # The revival supervisor and the passed-through GPU are on this machine
+        return self.connections.host_for(domain).remote_host is None
+
+    def passthrough_conflicts(self, domain, pci=None):
+        # Why this passthrough VM cannot start right now: missing devices, devices or IOMMU groups held by
+        # another running VM, or group members still bound to host drivers. Cached model only, unless pci is given.
+        pci = pci or self.pci; uuid = domain.UUIDString(); descriptor = self.descriptors.peek(uuid)
+        if pci is None or descriptor is None or not descriptor.hostdevs or not self.can_start_passthrough(domain) or self.connections.is_active(domain): return []
+        claims = {}
+        for other in self.domains:
+            other_descriptor = self.descriptors.peek(other.UUIDString())
+            if other.UUIDString() == uuid or other_descriptor is None or not other_descriptor.hostdevs: continue
+            if not self.can_start_passthrough(other) or not self.connections.is_active(other): continue
+            for address in pci_index.hostdev_addresses(other_descriptor.hostdevs): claims[address] = other.name()
+        return pci.conflicts(pci_index.hostdev_addresses(descriptor.hostdevs), claims)
+
+    def run_action(self, domain, action):
+        if action not in VM_ACTIONS: raise ServiceError(f"Unknown action {action}")
+        if isinstance(domain, domain_model.CachedDomain): raise ServiceError(f"The host of {domain.name()} is not connected")
+        if action == "start" and self.is_passthrough(domain): self.start_passthrough(domain)
+        elif action == "start": self._create(domain)
+        elif action == "shutdown": domain.shutdown()
+        elif action == "reboot": domain.reboot()
+        elif action == "destroy": domain.destroy()
+
+    def skip_reason(self, domain, action, fresh=True):
+        # Why a bulk action leaves this VM alone, or None
+        if isinstance(domain, domain_model.CachedDomain): return "Host not connected"
+        # Passthrough VMs take over the GPU and the display; they are only ever started one at a time
+        if self.is_passthrough(domain, fresh): return "GPU passthrough VM"
+        active = self.connections.is_active(domain)
+        if action == "start" and active: return "Already running"
+        if action != "start" and not active: return "Not running"
+        return None
+
+    def group_members(self, group, domains=None):
+        if group not in self.groups: raise ServiceError(f"No group named {group}")
+        return bulk_actions.group_members(self.groups[group], self.domains if domains is None else domains)
+
+    def bulk_run(self, action, domains, dispatch=None, on_progress=None, skip_reason=None):
+        if action not in VM_ACTIONS: raise ServiceError(f"Unknown action {action}")
+        skip_reason = skip_reason or self.skip_reason
+        stagger = self.bulk_stagger_seconds if action in bulk_actions.STAGGERED_ACTIONS else 0.0
+        return bulk_actions.BulkRun(action, [(d, skip_reason(d, action)) for d in domains], self._run_bulk_action, dispatch, on_progress,
+                                    self.bulk_concurrency, stagger)
+
+    def _run_bulk_action(self, domain, action):
+        # Worker thread: the skip reasons were worked out from the cache when the run was built
+        reason = self.skip_reason(domain, action)
+        if reason: raise bulk_actions.Skipped(reason)
+        self.run_action(domain, action)
+
+    def local_running_domains(self):
+        # The guests that go down with this machine
+        return [d for d in self.domains if not isinstance(d, domain_model.CachedDomain) and self.connections.host_for(d).remote_host is None
+                and self.connections.is_active(d)]
+
+    def host_shutdown(self, dispatch=None, on_progress=None):
+        # The caller starts it, powers off once it finishes uncancelled and then calls end_host_shutdown
+        shutdown = host_shutdown.HostShutdown(self.local_running_domains(), dispatch, on_progress, **self.shutdown_options)
+        self.connections.add_listener(shutdown.on_domain_change)
+        return shutdown
+
+    def end_host_shutdown(self, shutdown):
+        self.connections.remove_listener(shutdown.on_domain_change)
+
+    def start_passthrough(self, domain):
+        if not self.can_start_passthrough(domain): raise ServiceError(f"Passthrough VM {domain.name()} can only be started on its own host")
+        # Fail here, not after the display manager has been stopped; the conflict check needs the VM's current hostdevs
+        self.descriptors.get(domain)
+        conflicts = self.passthrough_conflicts(domain, pci_index.PCIIndex.scan())
+        if conflicts: raise ServiceError(f"Passthrough VM {domain.name()} cannot start: " + "; ".join(conflicts))
+        requested_at = time.time(); started = time.monotonic()
+        # Returns once the supervisor has registered the VM and printed READY=1
+        wait_for_revival_ready([sys.executable, REVIVAL_SCRIPT, domain.name(), '--requested-at', f"{requested_at:.3f}"])
+        ready = time.monotonic(); self._create(domain); created = time.monotonic()
+        print(f"Passthrough start of {domain.name()}: revival ready {ready - started:.2f}s, domain created {created - started:.2f}s", file=sys.stderr)
+
+    def _create(self, domain):
+        # domain.create(), or a tuned start for VMs with a launch profile. The guest's own reads go first.
+        self.prewarmer.cancel()
+        plan = self.planner.start(self._conn_for(domain), getattr(domain, 'domain', domain))
+        if plan is None: return
+        self.launch_plans[domain.UUIDString()] = plan
+        print(f"Launch plan {plan.describe()}", file=sys.stderr)
+
+    def launch_plan(self, domain):
+        # What starting this VM now would do; None without a profile
+        if isinstance(domain, domain_model.CachedDomain): raise ServiceError(f"The host of {domain.name()} is not connected")
+        if self.connections.is_active(domain): return self.launch_plans.get(domain.UUIDString())
+        return self.planner.plan(self._conn_for(domain), getattr(domain, 'domain', domain))
+
+    def _conn_for(self, domain):
+        conn = self.connections.conn_for(domain)
+        if conn is None: raise ServiceError(f"The host of {domain.name()} is not connected")
+        return conn
+
+    def prewarm(self, domain):
+        # Starts reading a local VM's disk images into the page cache in the background; images of other
+        # hosts are not read through this machine's cache
+        if isinstance(domain, domain_model.CachedDomain) or self.connections.host_for(domain).remote_host is not None: return
+        self.prewarmer.prewarm(domain.name(), lambda: prewarm.disk_sources(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE)))
+
+    def display_info(self, domain):
+        record = self.connections.record_for(domain)
+        if not record.active: raise ServiceError(f"VM {domain.name()} is not running")
+        graphics = self.descriptors.cached(record.uuid).graphics
+        if not graphics: raise ServiceError(f"VM {domain.name()} has no graphical display")
+        return graphics
+
+    def get_volume(self):
+        sink, _server = audio_backend.read_server_info()
+        if not sink: raise ServiceError("No default audio sink")
+        return audio_backend.read_sink_volume(sink)
+
+    def set_volume(self, value):
+        if not 0 <= value <= 100: raise ServiceError("Volume must be between 0 and 100")
+        sink, _server = audio_backend.read_server_info()
+        if not sink: raise ServiceError("No default audio sink")
+        audio_backend.write_sink_volume(sink, value)
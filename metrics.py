@@ -0,0 +1,179 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+from gi.repository import GLib, GObject
+
+import domain_model
+
+# Disabled unless VMLAUNCHER_METRICS=1; nothing is patched then, so the cost is zero.
+ENV_ENABLE = 'VMLAUNCHER_METRICS'
+ENV_FILE = 'VMLAUNCHER_METRICS_FILE'
+ENV_STALL_MS = 'VMLAUNCHER_STALL_MS'
+# node_exporter's textfile collector can pick this up
+DEFAULT_METRICS_FILE = os.path.expanduser('~/.cache/vmlauncher/metrics.prom')
+DEFAULT_STALL_MS = 100
+EXPORT_INTERVAL_SECONDS = 15
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Work done on other threads is accounted to this handler label
+BACKGROUND = 'background'
+
+
+class HandlerStats:
+    __slots__ = ('count', 'total', 'buckets', 'libvirt_calls', 'spawns', 'stalls')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * len(HISTOGRAM_BUCKETS)
+        self.libvirt_calls = 0
+        self.spawns = 0
+        self.stalls = 0
+
+
+class MainLoopMonitor:
+    def __init__(self, path, stall_seconds):
+        self.path = path
+        self.stall_seconds = stall_seconds
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._main_thread = threading.main_thread()
+        # (handler name, start time) of the main-loop callback currently running
+        self._current = None
+        self._reported = None
+
+    def install(self):
+        for name in ('idle_add', 'timeout_add', 'timeout_add_seconds'):
+            setattr(GLib, name, self._wrap_source_add(getattr(GLib, name)))
+        # GTK keeps the timing wrapper, not the handler: disconnect_by_func() and handler_block_by_func() no longer
+        # find handlers connected while metrics are on. The launcher only disconnects by handler id.
+        setattr(GObject.Object, 'connect', self._wrap_connect(GObject.Object.connect))
+        domain_model.wrap_libvirt_calls(lambda: self._count('libvirt_calls'))
+        setattr(subprocess.Popen, '__init__', self._wrap_spawn(subprocess.Popen.__init__))
+        threading.Thread(target=self._watch, name="stall-watchdog", daemon=True).start()
+        threading.Thread(target=self._export_loop, name="metrics-export", daemon=True).start()
+
+    # --- Wrappers ---
+
+    def _timed(self, callback):
+        name = getattr(callback, '__qualname__', None) or repr(callback)
+
+        def timed(*args):
+            # Nested dispatch (e.g. a dialog's run()) is accounted to the outer handler
+            if self._current is not None: return callback(*args)
+            start = time.monotonic()
+            self._current = (name, start)
+            try:
+                return callback(*args)
+            finally:
+                self._current = None
+                self._record(name, time.monotonic() - start)
+        return timed
+
+    def _wrap_source_add(self, original):
+        def source_add(interval_or_callback, *args, **kwargs):
+            if callable(interval_or_callback): return original(self._timed(interval_or_callback), *args, **kwargs)
+            return original(interval_or_callback, self._timed(args[0]), *args[1:], **kwargs)
+        return source_add
+
+    def _wrap_connect(self, original):
+        def connect(obj, detailed_signal, handler, *args):
+            return original(obj, detailed_signal, self._timed(handler), *args)
+        return connect
+
+    def _wrap_spawn(self, original):
+        def init(popen, *args, **kwargs):
+            self._count('spawns')
+            return original(popen, *args, **kwargs)
+        return init
+
+    # --- Accounting ---
+
+    def _handler_name(self):
+        if threading.current_thread() is not self._main_thread: return BACKGROUND
+        current = self._current
+        return current[0] if current is not None else BACKGROUND
+
+    def _stats(self, name):
+        stats = self.stats.get(name)
+        if stats is None: stats = self.stats[name] = HandlerStats()
+        return stats
+
+    def _count(self, field):
+        name = self._handler_name()
+        with self._lock:
+            stats = self._stats(name); setattr(stats, field, getattr(stats, field) + 1)
+
+    def _record(self, name, seconds):
+        with self._lock:
+            stats = self._stats(name)
+            stats.count += 1; stats.total += seconds
+            for i, bound in enumerate(HISTOGRAM_BUCKETS):
+                if seconds <= bound: stats.buckets[i] += 1
+            if seconds > self.stall_seconds: stats.stalls += 1
+
+    def _watch(self):
+        # Samples the main thread's stack while a callback overruns, so the log shows where it is stuck
+        while True:
+            time.sleep(self.stall_seconds / 2)
+            current = self._current
+            if current is None or current is self._reported: continue
+            name, start = current
+            elapsed = time.monotonic() - start
+            if elapsed < self.stall_seconds: continue
+            self._reported = current
+            frame = sys._current_frames().get(self._main_thread.ident)
+            stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+            print(f"Main loop stalled {elapsed * 1000:.0f} ms in {name}:\n{stack}", file=sys.stderr)
+
+    # --- Export ---
+
+    def render(self):
+        with self._lock:
+            snapshot = {name: (s.count, s.total, list(s.buckets), s.libvirt_calls, s.spawns, s.stalls) for name, s in self.stats.items()}
+        lines = ["# HELP vmlauncher_handler_duration_seconds Time spent in main-loop callbacks.",
+                 "# TYPE vmlauncher_handler_duration_seconds histogram"]
+        for name, (count, total, buckets, _calls, _spawns, _stalls) in sorted(snapshot.items()):
+            if name == BACKGROUND: continue
+            label = _escape(name)
+            for bound, value in zip(HISTOGRAM_BUCKETS, buckets):
+                lines.append(f'vmlauncher_handler_duration_seconds_bucket{{handler="{label}",le="{bound}"}} {value}')
+            lines.append(f'vmlauncher_handler_duration_seconds_bucket{{handler="{label}",le="+Inf"}} {count}')
+            lines.append(f'vmlauncher_handler_duration_seconds_sum{{handler="{label}"}} {total:.6f}')
+            lines.append(f'vmlauncher_handler_duration_seconds_count{{handler="{label}"}} {count}')
+        for metric, index, help_text in (('vmlauncher_libvirt_calls_total', 3, "libvirt API calls by calling handler."),
+                                         ('vmlauncher_subprocess_spawns_total', 4, "Subprocesses started by calling handler."),
+                                         ('vmlauncher_main_loop_stalls_total', 5, "Callbacks that overran the stall threshold.")):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for name, values in sorted(snapshot.items()):
+                if values[index]: lines.append(f'{metric}{{handler="{_escape(name)}"}} {values[index]}')
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f: f.write(self.render())
+        os.replace(tmp_path, self.path)
+
+    def _export_loop(self):
+        while True:
+            time.sleep(EXPORT_INTERVAL_SECONDS)
+            try: self.export()
+            except OSError as e: print(f"Could not write metrics to {self.path}: {e}", file=sys.stderr)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def install_from_env():
+    # Must run before the UI is built so every callback registration goes through the wrappers
+    if os.environ.get(ENV_ENABLE) != '1': return None
+    try: stall_ms = float(os.environ.get(ENV_STALL_MS, DEFAULT_STALL_MS))
+    except ValueError: stall_ms = DEFAULT_STALL_MS
+    monitor = MainLoopMonitor(os.environ.get(ENV_FILE, DEFAULT_METRICS_FILE), stall_ms / 1000)
+    monitor.install()
+    return monitor
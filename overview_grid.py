@@ -0,0 +1,193 @@
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk, Gdk, GLib, Pango
+
+TILE_WIDTH = 220
+TILE_HEIGHT = 200
+TILE_SPACING = 12
+IMAGE_WIDTH = 192
+IMAGE_HEIGHT = 128
+# Pictures are filled in once scrolling pauses for this long, so flinging through hundreds of VMs loads none of them
+IMAGE_LOAD_DELAY_MS = 80
+
+
+class OverviewTile(Gtk.Button):
+    def __init__(self):
+        super().__init__()
+        self.set_relief(Gtk.ReliefStyle.NONE)
+        self.set_no_show_all(True)
+        self.index = -1
+        self.key = None
+        self.needs_image = False
+        self.badge_class = None
+        self.event_state = 0
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=4)
+        self.image = Gtk.Image(); self.image.set_size_request(IMAGE_WIDTH, IMAGE_HEIGHT)
+        self.name_label = Gtk.Label(); self.name_label.set_ellipsize(Pango.EllipsizeMode.END); self.name_label.set_max_width_chars(24)
+        self.badge_label = Gtk.Label(); self.badge_label.set_halign(Gtk.Align.CENTER)
+        self.badge_label.get_style_context().add_class("tile-badge")
+        for child in (self.image, self.name_label, self.badge_label): box.pack_start(child, False, False, 0); child.show()
+        self.add(box); box.show()
+
+    def set_content(self, name, badge, badge_class):
+        if self.name_label.get_text() != name: self.name_label.set_text(name); self.set_tooltip_text(name)
+        self.badge_label.set_text(badge)
+        if badge_class != self.badge_class:
+            context = self.badge_label.get_style_context()
+            if self.badge_class: context.remove_class(self.badge_class)
+            if badge_class: context.add_class(badge_class)
+            self.badge_class = badge_class
+
+    def set_image(self, pixbuf):
+        if pixbuf is None: self.image.clear()
+        elif self.image.get_pixbuf() is not pixbuf: self.image.set_from_pixbuf(pixbuf)
+
+
+class OverviewGrid(Gtk.Box):
+    # A recycling grid: only the tiles that fit the viewport exist and scrolling rebinds them to other items.
+    # bind(tile, index) fills a tile's text and returns a key for its picture; load_image(index, width, height)
+    # returns the picture and is deferred until scrolling pauses. on_activate(index, event_state) handles clicks.
+    def __init__(self, bind, load_image, on_activate):
+        super().__init__(orientation=Gtk.Orientation.HORIZONTAL, spacing=0)
+        self.bind = bind
+        self.load_image = load_image
+        self.on_activate = on_activate
+        self.count = 0
+        self.columns = 0
+        self.rows = 0
+        self.tiles = []
+        self.layout_size = (0, 0)
+        self.image_load_id = None
+        self.scroll_remainder = 0.0
+        self.top_row = 0
+
+        self.tile_grid = Gtk.Grid(column_spacing=TILE_SPACING, row_spacing=TILE_SPACING)
+        self.tile_grid.set_halign(Gtk.Align.CENTER); self.tile_grid.set_valign(Gtk.Align.START)
+        # EXTERNAL: the viewport never asks for the full height of the grid; the scrollbar below moves by rows
+        viewport_win = Gtk.ScrolledWindow(hexpand=True, vexpand=True)
+        viewport_win.set_policy(Gtk.PolicyType.EXTERNAL, Gtk.PolicyType.EXTERNAL)
+        viewport_win.add(self.tile_grid)
+        viewport_win.add_events(Gdk.EventMask.SCROLL_MASK | Gdk.EventMask.SMOOTH_SCROLL_MASK)
+        viewport_win.connect("scroll-event", self._on_scroll_event)
+        viewport_win.connect("size-allocate", self._on_size_allocate)
+        self.pack_start(viewport_win, True, True, 0)
+
+        self.adjustment = Gtk.Adjustment(value=0, lower=0, upper=0, step_increment=1, page_increment=1, page_size=1)
+        self.adjustment.connect("value-changed", self._on_scrolled)
+        self.pack_start(Gtk.Scrollbar(orientation=Gtk.Orientation.VERTICAL, adjustment=self.adjustment), False, False, 0)
+
+    # --- Public API ---
+
+    def set_count(self, count):
+        self.count = count
+        self._update_adjustment()
+        self.refresh()
+
+    def refresh(self):
+        # Rebinds the visible tiles; pictures are only reloaded for tiles now showing another item
+        self.top_row = int(self.adjustment.get_value())
+        first = self.top_row * self.columns
+        for i, tile in enumerate(self.tiles):
+            index = first + i
+            if index >= self.count:
+                tile.index = -1; tile.key = None; tile.hide(); continue
+            key = self.bind(tile, index)
+            if index != tile.index or key != tile.key:
+                tile.index = index; tile.key = key; tile.needs_image = True; tile.set_image(None)
+            tile.show()
+        self._schedule_image_load()
+
+    def refresh_index(self, index):
+        tile = self._tile_for(index)
+        if tile is None: return
+        tile.key = self.bind(tile, index); tile.needs_image = True
+        self._schedule_image_load()
+
+    def visible_range(self):
+        first = int(self.adjustment.get_value()) * self.columns
+        return range(first, min(self.count, first + len(self.tiles)))
+
+    def scroll_to(self, index):
+        if self.columns <= 0 or index < 0: return
+        row = index // self.columns; top = int(self.adjustment.get_value())
+        if row < top: self.adjustment.set_value(row)
+        elif row >= top + self.rows: self.adjustment.set_value(row - self.rows + 1)
+
+    # --- Layout ---
+
+    def _on_size_allocate(self, widget, allocation):
+        size = (allocation.width, allocation.height)
+        if size == self.layout_size: return
+        self.layout_size = size
+        # Children cannot be added or removed during allocation
+        GLib.idle_add(self._relayout)
+
+    def _relayout(self):
+        width, height = self.layout_size
+        columns = max(1, (width + TILE_SPACING) // (TILE_WIDTH + TILE_SPACING))
+        rows = max(1, (height + TILE_SPACING) // (TILE_HEIGHT + TILE_SPACING))
+        if (columns, rows) == (self.columns, self.rows): return False
+        first = int(self.adjustment.get_value()) * self.columns
+        self.columns, self.rows = columns, rows
+        for tile in self.tiles: self.tile_grid.remove(tile)
+        while len(self.tiles) < columns * rows:
+            tile = OverviewTile(); tile.connect("button-release-event", self._on_tile_released); tile.connect("clicked", self._on_tile_clicked)
+            self.tiles.append(tile)
+        for tile in self.tiles[columns * rows:]: tile.destroy()
+        del self.tiles[columns * rows:]
+        for i, tile in enumerate(self.tiles):
+            tile.index = -1; self.tile_grid.attach(tile, i % columns, i // columns, 1, 1)
+        self._update_adjustment()
+        self.adjustment.set_value(first // columns)
+        self.refresh()
+        return False
+
+    def _update_adjustment(self):
+        total_rows = (self.count + self.columns - 1) // self.columns if self.columns else 0
+        page = max(1, self.rows)
+        self.adjustment.configure(min(self.adjustment.get_value(), max(0, total_rows - page)), 0, max(total_rows, page), 1, page, page)
+
+    # --- Scrolling and images ---
+
+    def _on_scrolled(self, adjustment):
+        # Dragging the scrollbar moves by fractions of a row; only whole rows change what is shown
+        if int(adjustment.get_value()) != self.top_row: self.refresh()
+
+    def _on_scroll_event(self, widget, event):
+        # Touchpads send fractions of a row; they add up until a whole row is scrolled
+        if event.direction == Gdk.ScrollDirection.SMOOTH: self.scroll_remainder += event.get_scroll_deltas()[2]
+        else: self.scroll_remainder += {Gdk.ScrollDirection.UP: -1, Gdk.ScrollDirection.DOWN: 1}.get(event.direction, 0)
+        rows = int(self.scroll_remainder)
+        if rows:
+            self.scroll_remainder -= rows
+            upper = self.adjustment.get_upper() - self.adjustment.get_page_size()
+            self.adjustment.set_value(max(0, min(upper, self.adjustment.get_value() + rows)))
+        return True
+
+    def _schedule_image_load(self):
+        if self.image_load_id is not None: GLib.source_remove(self.image_load_id)
+        self.image_load_id = GLib.timeout_add(IMAGE_LOAD_DELAY_MS, self._load_images)
+
+    def _load_images(self):
+        self.image_load_id = None
+        for tile in self.tiles:
+            if tile.index < 0 or not tile.needs_image: continue
+            tile.needs_image = False
+            tile.set_image(self.load_image(tile.index, IMAGE_WIDTH, IMAGE_HEIGHT))
+        return False
+
+    def _tile_for(self, index):
+        offset = index - int(self.adjustment.get_value()) * self.columns
+        return self.tiles[offset] if 0 <= offset < len(self.tiles) and self.tiles[offset].index == index else None
+
+    # --- Activation ---
+
+    def _on_tile_released(self, tile, event):
+        # Remember the modifiers for the following "clicked"
+        tile.event_state = event.state
+        return False
+
+    def _on_tile_clicked(self, tile):
+        if tile.index < 0: return
+        state = tile.event_state; tile.event_state = 0
+        self.on_activate(tile.index, state)
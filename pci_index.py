@@ -0,0 +1,91 @@
+import os
+
+# Default sysfs; tests/test_pci_index.py passes a fixture tree laid out like it instead
+SYSFS_ROOT = '/sys'
+# Drivers a passed-through device may be bound to before libvirt takes it over, besides none at all
+PASSTHROUGH_DRIVERS = ('vfio-pci', 'pci-stub')
+# PCI-to-PCI bridges share IOMMU groups with endpoints but are never assigned to a guest
+PCI_BRIDGE_CLASS = 0x0604
+
+
+def pci_address(domain, bus, slot, function):
+    # From a <hostdev> <address domain='0x0000' bus='0x01' slot='0x00' function='0x0'/>
+    return f"{int(domain, 16):04x}:{int(bus, 16):02x}:{int(slot, 16):02x}.{int(function, 16):x}"
+
+
+def hostdev_addresses(hostdevs):
+    # Skips hostdevs whose address libvirt would reject anyway
+    addresses = []
+    for hostdev in hostdevs:
+        try: addresses.append(pci_address(*hostdev))
+        except (TypeError, ValueError): pass
+    return addresses
+
+
+def pci_driver(address, sysfs_root=SYSFS_ROOT):
+    try: return os.path.basename(os.readlink(os.path.join(sysfs_root, 'bus/pci/devices', address, 'driver')))
+    except OSError: return None
+
+
+def _read_hex(path):
+    try:
+        with open(path) as f: return int(f.read().strip(), 16)
+    except (OSError, ValueError): return None
+
+
+class PCIDevice:
+    __slots__ = ('address', 'vendor', 'device', 'class_code', 'driver', 'iommu_group')
+
+    def __init__(self, address, vendor, device, class_code, driver, iommu_group):
+        self.address = address
+        self.vendor = vendor
+        self.device = device
+        self.class_code = class_code
+        self.driver = driver
+        self.iommu_group = iommu_group
+
+    @property
+    def is_bridge(self):
+        return self.class_code is not None and self.class_code >> 8 == PCI_BRIDGE_CLASS
+
+
+class PCIIndex:
+    # Host PCI devices with their IOMMU group and current driver, read from sysfs in one pass
+    def __init__(self, devices):
+        self.devices = {device.address: device for device in devices}
+        self.groups = {}
+        for device in devices:
+            if device.iommu_group is not None: self.groups.setdefault(device.iommu_group, []).append(device)
+
+    @classmethod
+    def scan(cls, sysfs_root=SYSFS_ROOT):
+        devices_dir = os.path.join(sysfs_root, 'bus/pci/devices')
+        # None when sysfs cannot be read: nothing is known, so nothing is rejected
+        try: addresses = sorted(os.listdir(devices_dir))
+        except OSError: return None
+        devices = []
+        for address in addresses:
+            path = os.path.join(devices_dir, address)
+            try: group = os.path.basename(os.readlink(os.path.join(path, 'iommu_group')))
+            except OSError: group = None
+            devices.append(PCIDevice(address, _read_hex(os.path.join(path, 'vendor')), _read_hex(os.path.join(path, 'device')),
+                                     _read_hex(os.path.join(path, 'class')), pci_driver(address, sysfs_root), group))
+        return cls(devices)
+
+    def conflicts(self, addresses, claims):
+        # addresses: the PCI devices a VM passes through. claims: {address: name of another running VM using it}.
+        # Returns why the VM cannot start now, or an empty list.
+        reasons = []; own = set(addresses)
+        for address in addresses:
+            device = self.devices.get(address)
+            if device is None: reasons.append(f"PCI device {address} is not present on this host"); continue
+            if address in claims: reasons.append(f"PCI device {address} is in use by {claims[address]}")
+            if device.iommu_group is None: reasons.append(f"PCI device {address} has no IOMMU group; is the IOMMU enabled?"); continue
+            for member in self.groups[device.iommu_group]:
+                if member.address in own or member.is_bridge: continue
+                if member.address in claims:
+                    reasons.append(f"IOMMU group {device.iommu_group} of {address} is shared with {member.address}, in use by {claims[member.address]}")
+                elif member.driver is not None and member.driver not in PASSTHROUGH_DRIVERS:
+                    reasons.append(f"IOMMU group {device.iommu_group} of {address} also contains {member.address} (driver {member.driver}), which is not assigned to this VM")
+        # A group listed twice (e.g. GPU and its audio function) reports shared members once
+        return list(dict.fromkeys(reasons))
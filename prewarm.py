@@ -0,0 +1,163 @@
+import ctypes
+import errno
+import os
+import platform
+import struct
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+# settings.ini [VMLauncher] prewarm_budget_mb: page cache one prewarm may fill; 0 turns prewarming off
+DEFAULT_BUDGET_MB = 1024
+# Never take more than this share of MemAvailable, so prewarming does not push out the host's own working set
+MAX_AVAILABLE_FRACTION = 0.5
+CHUNK_BYTES = 8 * 1024 * 1024
+MAX_CHAIN_DEPTH = 16
+# A VM prewarmed this recently is not read again when it is selected again
+RECENT_SECONDS = 600
+# Guests opening their images with O_DIRECT never use the host page cache
+UNCACHED_MODES = ('none', 'directsync')
+
+QCOW2_MAGIC = b'QFI\xfb'
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+SYS_IOPRIO_SET = {'x86_64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30, 'riscv64': 30, 'armv7l': 314, 'ppc64le': 273, 's390x': 282}
+
+
+def options_from_settings(settings):
+    if 'VMLauncher' not in settings: return {}
+    return {'budget_bytes': max(0, settings['VMLauncher'].getint('prewarm_budget_mb', DEFAULT_BUDGET_MB)) * 1024 * 1024}
+
+
+def disk_sources(xml_desc):
+    # Local image files and block devices of a domain's disks, in device order; CD-ROMs and network disks are left out
+    root = ET.fromstring(xml_desc); paths = []
+    for disk in root.findall('devices/disk'):
+        if disk.get('device', 'disk') != 'disk' or disk.get('type') not in ('file', 'block'): continue
+        driver = disk.find('driver')
+        if driver is not None and driver.get('cache') in UNCACHED_MODES: continue
+        source = disk.find('source')
+        path = source.get('file') or source.get('dev') if source is not None else None
+        if path: paths.append(path)
+    return paths
+
+
+def backing_file(path):
+    # The backing file named in a qcow2 header, or None for raw images and the end of a chain
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(20)
+            if len(header) < 20 or header[:4] != QCOW2_MAGIC: return None
+            offset, size = struct.unpack('>QI', header[8:20])
+            if not offset or not size: return None
+            f.seek(offset); name = f.read(size).decode('utf-8', 'replace')
+    except OSError: return None
+    # Relative names are relative to the overlay; protocol URLs (nbd:, json:) are not local files
+    name = os.path.join(os.path.dirname(path), name)
+    return name if os.path.exists(name) else None
+
+
+def backing_chain(path):
+    chain = []
+    while path and path not in chain and len(chain) < MAX_CHAIN_DEPTH:
+        chain.append(path); path = backing_file(path)
+    return chain
+
+
+def mem_available():
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'): return int(line.split()[1]) * 1024
+    except (OSError, ValueError): pass
+    return None
+
+
+def set_idle_io_priority():
+    # I/O priority is per thread on Linux; who=process with id 0 means the calling thread
+    nr = SYS_IOPRIO_SET.get(platform.machine())
+    if nr is None: return False
+    try: libc = ctypes.CDLL(None, use_errno=True)
+    except OSError: return False
+    return libc.syscall(nr, IOPRIO_WHO_PROCESS, 0, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT) == 0
+
+
+def _data_extents(fd, size):
+    # (offset, end) of the allocated parts of a sparse image; holes would only fill the cache with zeros
+    offset = 0
+    while offset < size:
+        try: start = os.lseek(fd, offset, os.SEEK_DATA); end = os.lseek(fd, start, os.SEEK_HOLE)
+        except OSError as e:
+            if e.errno == errno.ENXIO: return  # no data past offset
+            yield offset, size; return  # no SEEK_DATA support (block devices, some filesystems)
+        yield start, end; offset = end
+
+
+class Prewarmer:
+    # Reads the images of the VM the user is likely to start next into the page cache on one background
+    # thread at idle I/O priority. A new request cancels the one in flight.
+    def __init__(self, budget_bytes=DEFAULT_BUDGET_MB * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self._current = None
+        self._warmed = {}
+        self._lock = threading.Lock()
+
+    def prewarm(self, key, load_paths):
+        # load_paths() runs on the prewarm thread and returns the files to read, top overlay first
+        if self.budget_bytes <= 0: return
+        with self._lock:
+            if self._current is not None:
+                if self._current[0] == key: return
+                self._current[1].set()
+            if time.monotonic() - self._warmed.get(key, -RECENT_SECONDS) < RECENT_SECONDS: self._current = None; return
+            cancelled = threading.Event(); self._current = (key, cancelled)
+        threading.Thread(target=self._run, args=(key, load_paths, cancelled), name="prewarm", daemon=True).start()
+
+    def cancel(self):
+        with self._lock:
+            if self._current is not None: self._current[1].set(); self._current = None
+
+    def _run(self, key, load_paths, cancelled):
+        set_idle_io_priority()
+        started = time.monotonic(); done = 0; failed = False
+        try:
+            paths = [p for top in load_paths() for p in backing_chain(top)]
+            available = mem_available()
+            budget = min(self.budget_bytes, int(available * MAX_AVAILABLE_FRACTION)) if available else self.budget_bytes
+            for path in dict.fromkeys(paths):
+                if cancelled.is_set() or done >= budget: break
+                done += self._read(path, budget - done, cancelled)
+        except Exception as e:
+            print(f"Error prewarming {key}: {e}", file=sys.stderr); failed = True
+        with self._lock:
+            if not cancelled.is_set() and not failed: self._warmed[key] = time.monotonic()
+            if self._current is not None and self._current[1] is cancelled: self._current = None
+        if done: print(f"Prewarmed {done / (1024 * 1024):.0f} MiB for {key} in {time.monotonic() - started:.1f}s{' (cancelled)' if cancelled.is_set() else ''}", file=sys.stderr)
+
+    def _read(self, path, budget, cancelled):
+        # Plain reads rather than WILLNEED hints alone: they finish before returning, so the budget counts
+        # what is really cached and the idle priority paces them behind the guests' I/O
+        try: fd = os.open(path, os.O_RDONLY | os.O_NOATIME if os.geteuid() == 0 else os.O_RDONLY)
+        except OSError as e: print(f"Cannot prewarm {path}: {e}", file=sys.stderr); return 0
+        done = 0; buffer = bytearray(CHUNK_BYTES)
+        try:
+            size = os.lseek(fd, 0, os.SEEK_END)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            for start, end in _data_extents(fd, size):
+                offset = start
+                while offset < end and done < budget:
+                    if cancelled.is_set(): return done
+                    length = min(CHUNK_BYTES, end - offset, budget - done)
+                    # Let the kernel start on this chunk's readahead in one go
+                    os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+                    read = os.preadv(fd, [memoryview(buffer)[:length]], offset) if hasattr(os, 'preadv') else len(os.pread(fd, length, offset))
+                    if read <= 0: break
+                    offset += read; done += read
+                if done >= budget: break
+        except OSError as e:
+            print(f"Error prewarming {path}: {e}", file=sys.stderr)
+        finally:
+            os.close(fd)
+        return done
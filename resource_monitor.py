@@ -0,0 +1,111 @@
+import sys
+import threading
+import time
+from array import array
+
+import libvirt
+
+# Sampling period while the launcher is on screen, and while a fullscreen viewer hides it
+SAMPLE_INTERVAL_SECONDS = 2
+HIDDEN_SAMPLE_INTERVAL_SECONDS = 10
+# Samples kept per metric and VM: four minutes at the on-screen rate, a fixed 1 KiB per series
+HISTORY_SAMPLES = 120
+MONITOR_STATS = (libvirt.VIR_DOMAIN_STATS_CPU_TOTAL | libvirt.VIR_DOMAIN_STATS_BALLOON |
+                 libvirt.VIR_DOMAIN_STATS_INTERFACE | libvirt.VIR_DOMAIN_STATS_BLOCK)
+
+CPU = 'cpu'              # percent of the VM's vCPUs
+MEMORY_RSS = 'rss'       # KiB resident on the host
+MEMORY_BALLOON = 'balloon'  # KiB currently given to the guest
+DISK = 'disk'            # bytes/s read + written
+NETWORK = 'net'          # bytes/s received + sent
+METRICS = (CPU, MEMORY_RSS, MEMORY_BALLOON, DISK, NETWORK)
+
+
+class RingBuffer:
+    __slots__ = ('_values', '_start', '_size')
+
+    def __init__(self, capacity=HISTORY_SAMPLES):
+        self._values = array('d', bytes(8 * capacity))
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, value):
+        capacity = len(self._values)
+        self._values[(self._start + self._size) % capacity] = value
+        if self._size < capacity: self._size += 1
+        else: self._start = (self._start + 1) % capacity
+
+    def last(self):
+        return self._values[(self._start + self._size - 1) % len(self._values)] if self._size else None
+
+    def values(self):
+        # Oldest first
+        end = self._start + self._size
+        if end <= len(self._values): return self._values[self._start:end].tolist()
+        return self._values[self._start:].tolist() + self._values[:end - len(self._values)].tolist()
+
+
+class VMSeries:
+    __slots__ = ('history', 'counters', 'sampled_at')
+
+    def __init__(self, capacity=HISTORY_SAMPLES):
+        self.history = {metric: RingBuffer(capacity) for metric in METRICS}
+        self.counters = None
+        self.sampled_at = 0.0
+
+
+def _counters(stats):
+    disk = sum(stats.get(f'block.{i}.rd.bytes', 0) + stats.get(f'block.{i}.wr.bytes', 0) for i in range(stats.get('block.count', 0)))
+    net = sum(stats.get(f'net.{i}.rx.bytes', 0) + stats.get(f'net.{i}.tx.bytes', 0) for i in range(stats.get('net.count', 0)))
+    return stats.get('cpu.time', 0), disk, net
+
+
+class ResourceMonitor:
+    # One getAllDomainStats per host and interval for every running VM; rates land in per-VM ring buffers.
+    # sample() runs on a worker thread; series() and latest() are read on the UI thread.
+    def __init__(self, connections, capacity=HISTORY_SAMPLES):
+        self.connections = connections
+        self.capacity = capacity
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def sample(self):
+        now = time.monotonic()
+        try: results = self.connections.collect_stats(MONITOR_STATS, libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE)
+        except libvirt.libvirtError as e: print(f"Error sampling VM statistics: {e}", file=sys.stderr); return
+        with self._lock:
+            # Stopped VMs drop their history, so memory is bounded by the number of running VMs
+            self._series = {uuid: self._series[uuid] for uuid, _stats in results if uuid in self._series}
+            for uuid, stats in results:
+                series = self._series.get(uuid)
+                if series is None: series = self._series[uuid] = VMSeries(self.capacity)
+                self._record(uuid, series, stats, now)
+
+    def _record(self, uuid, series, stats, now):
+        counters = _counters(stats)
+        previous, elapsed = series.counters, now - series.sampled_at
+        series.counters = counters; series.sampled_at = now
+        if previous is None or elapsed <= 0: return
+        cpu_ns, disk, net = (max(0, c - p) for c, p in zip(counters, previous))
+        record = self.connections.get(uuid)
+        vcpus = max(1, record.vcpus if record is not None else 1)
+        history = series.history
+        history[CPU].append(min(100.0, cpu_ns / (elapsed * 1e9 * vcpus) * 100))
+        history[MEMORY_RSS].append(stats.get('balloon.rss', 0))
+        history[MEMORY_BALLOON].append(stats.get('balloon.current', 0))
+        history[DISK].append(disk / elapsed)
+        history[NETWORK].append(net / elapsed)
+
+    def series(self, uuid, metric):
+        with self._lock:
+            series = self._series.get(uuid)
+            return series.history[metric].values() if series is not None else []
+
+    def latest(self, uuid):
+        with self._lock:
+            series = self._series.get(uuid)
+            if series is None or not len(series.history[CPU]): return None
+            return {metric: ring.last() for metric, ring in series.history.items()}
@@ -1,57 +1,288 @@
-
-import sys
+import argparse
+import json
 import os
+import socket
+import subprocess
+import sys
+import threading
 import time
+
 import libvirt
 
+import domain_model
+import pci_index
+
 # --- Configuration ---
 # IMPORTANT: Change this to your display manager if you are not using GDM
-# Common options: gdm3, lightdm, sddm
-DISPLAY_MANAGER_SERVICE = "gdm3"
+# Common options: gdm3, lightdm, sddm. Can also be set with --display-manager
+# or the VMLAUNCHER_DISPLAY_MANAGER environment variable.
+DISPLAY_MANAGER_SERVICE = os.environ.get("VMLAUNCHER_DISPLAY_MANAGER", "gdm3")
+CONTROL_SOCKET = "/run/vmlauncher-revival.sock"
+# Restore the display manager if a requested VM has not started by then
+STARTUP_TIMEOUT_SECONDS = 120
+# Safety net for missed events; without events this is the polling interval
+FALLBACK_POLL_SECONDS = 30
 POLL_INTERVAL_SECONDS = 5
+RECONNECT_INTERVAL_SECONDS = 5
+# Per-phase timings of each passthrough start, one JSON object per line
+TIMING_LOG = "/var/log/vmlauncher/passthrough-timing.log"
+# Output of a supervisor started on demand; it must not hold on to the launcher's pipe
+SUPERVISOR_LOG = "/var/log/vmlauncher/revival.log"
+GPU_DETACH_POLL_SECONDS = 0.05
 # --- End Configuration ---
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: revival_script.py <vm_name>", file=sys.stderr)
-        sys.exit(1)
 
-    vm_name = sys.argv[1]
-    print(f"Revival script started for VM: {vm_name}")
+class RevivalSupervisor:
+    def __init__(self, display_manager):
+        self.display_manager = display_manager
+        self.conn = None
+        self.events_enabled = False
+        # vm_name -> startup deadline, or None once the VM is running
+        self.watches = {}
+        # vm_name -> {phase: seconds since the launcher asked for the start}
+        self.timings = {}
+        self.lock = threading.Lock()
+
+    def connect(self):
+        self.conn = libvirt.open('qemu:///system')
+        self.events_enabled = False
+        try:
+            self.conn.domainEventRegisterAny(None, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, self._on_lifecycle, None)
+            self.events_enabled = True
+        except libvirt.libvirtError as e:
+            print(f"Revival supervisor: lifecycle events unavailable, polling every {POLL_INTERVAL_SECONDS}s: {e}", file=sys.stderr)
+        try:
+            # A connected guest agent is the closest host-side signal that the guest desktop is up
+            self.conn.domainEventRegisterAny(None, libvirt.VIR_DOMAIN_EVENT_ID_AGENT_LIFECYCLE, self._on_agent_lifecycle, None)
+        except (libvirt.libvirtError, AttributeError):
+            pass
+        # Passthrough VMs already running when we (re)connect
+        for domain in self.conn.listAllDomains(libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE):
+            if self._is_passthrough(domain):
+                with self.lock: self.watches[domain.name()] = None
+        print(f"Revival supervisor: connected, watching {sorted(self.watches) or 'no VMs'}")
+
+    def _is_passthrough(self, domain):
+        try: return domain_model.parse_descriptor(domain.UUIDString(), domain.XMLDesc(0)).vm_type == 'passthrough'
+        except libvirt.libvirtError: return False
+
+    def _on_lifecycle(self, conn, dom, event, detail, opaque):
+        name = dom.name()
+        if event == libvirt.VIR_DOMAIN_EVENT_STARTED:
+            with self.lock: watched = name in self.watches
+            if watched: self._monitor(name)
+            # Reading the XML here would hold up event dispatch for every domain on the host
+            else: threading.Thread(target=self._classify_started, args=(dom,), name="classify", daemon=True).start()
+        elif event in (libvirt.VIR_DOMAIN_EVENT_STOPPED, libvirt.VIR_DOMAIN_EVENT_CRASHED):
+            with self.lock: watched = self.watches.pop(name, False) is None
+            self._finish_timing(name, 'stopped')
+            if watched: self.restore_display_manager(f"VM {name} has shut down")
+
+    def _monitor(self, name):
+        with self.lock: self.watches[name] = None
+        self._mark(name, 'domain_created')
+        print(f"Revival supervisor: VM {name} is active. Monitoring for shutdown.")
+
+    def _classify_started(self, dom):
+        # Worker thread: a passthrough VM started without the launcher; it may have stopped again meanwhile
+        try: active = self._is_passthrough(dom) and dom.isActive()
+        except libvirt.libvirtError: return
+        if active: self._monitor(dom.name())
+
+    def _on_agent_lifecycle(self, conn, dom, state, reason, opaque):
+        if state == libvirt.VIR_CONNECT_DOMAIN_EVENT_AGENT_LIFECYCLE_STATE_CONNECTED:
+            self._mark(dom.name(), 'guest_display_up')
+            self._finish_timing(dom.name(), 'complete')
+
+    def watch(self, vm_name, requested_at=None):
+        with self.lock:
+            self.watches[vm_name] = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+            self.timings[vm_name] = {'vm': vm_name, 'requested_at': requested_at or time.time()}
+        self._mark(vm_name, 'revival_ready')
+        threading.Thread(target=self._wait_for_gpu_detach, args=(vm_name,), name="gpu-detach", daemon=True).start()
+        print(f"Revival supervisor: waiting for VM {vm_name} to start")
+
+    def _mark(self, vm_name, phase):
+        with self.lock:
+            timing = self.timings.get(vm_name)
+            if timing is not None and phase not in timing: timing[phase] = round(time.time() - timing['requested_at'], 3)
+
+    def _finish_timing(self, vm_name, outcome):
+        with self.lock: timing = self.timings.pop(vm_name, None)
+        if timing is None: return
+        timing['outcome'] = outcome
+        phases = ", ".join(f"{p} {timing[p]:.2f}s" for p in ('revival_ready', 'domain_created', 'gpu_detached', 'guest_display_up') if p in timing)
+        print(f"Revival supervisor: passthrough start of {vm_name} ({outcome}): {phases}")
+        try:
+            os.makedirs(os.path.dirname(TIMING_LOG), exist_ok=True)
+            with open(TIMING_LOG, 'a') as log: log.write(json.dumps(timing) + "\n")
+        except OSError as e:
+            print(f"Revival supervisor: could not write {TIMING_LOG}: {e}", file=sys.stderr)
+
+    def _wait_for_gpu_detach(self, vm_name):
+        # Detached once every PCI hostdev of the VM is bound to vfio-pci (or to nothing)
+        try: addresses = [pci_index.pci_address(*hostdev) for hostdev in domain_model.parse_descriptor(None, self.conn.lookupByName(vm_name).XMLDesc(0)).hostdevs]
+        except (libvirt.libvirtError, AttributeError, TypeError, ValueError): return
+        deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+        while time.monotonic() < deadline:
+            with self.lock:
+                if vm_name not in self.timings: return
+            if all(pci_index.pci_driver(address) in (None,) + pci_index.PASSTHROUGH_DRIVERS for address in addresses):
+                self._mark(vm_name, 'gpu_detached'); return
+            time.sleep(GPU_DETACH_POLL_SECONDS)
+
+    def restore_display_manager(self, reason):
+        # Time to bring the host GUI back to life. This command requires root privileges.
+        print(f"Revival supervisor: {reason}. Restarting display manager '{self.display_manager}'...")
+        subprocess.run(["systemctl", "start", self.display_manager])
 
-    conn = None
+    def serve(self, server):
+        server.settimeout(1.0)
+        last_poll = time.monotonic()
+        while True:
+            try:
+                client, _ = server.accept()
+                self._handle_client(client)
+            except socket.timeout:
+                pass
+            try:
+                if self.conn is None or not self.conn.isAlive(): self._reconnect()
+                self._check_startup_deadlines()
+                poll_interval = FALLBACK_POLL_SECONDS if self.events_enabled else POLL_INTERVAL_SECONDS
+                if time.monotonic() - last_poll >= poll_interval:
+                    self._poll_running(); last_poll = time.monotonic()
+            except libvirt.libvirtError as e:
+                print(f"Revival supervisor: libvirt error: {e}", file=sys.stderr)
+
+    def _handle_client(self, client):
+        with client:
+            client.settimeout(2.0)
+            try:
+                # watch <requested_at epoch seconds> <vm_name>
+                command, _, rest = client.makefile('r').readline().strip().partition(' ')
+                requested_at, _, vm_name = rest.partition(' ')
+                if command == 'watch' and vm_name:
+                    self.watch(vm_name, float(requested_at)); client.sendall(b"ok\n")
+                else:
+                    client.sendall(b"error unknown command\n")
+            except (OSError, socket.timeout, ValueError) as e:
+                print(f"Revival supervisor: bad client request: {e}", file=sys.stderr)
+
+    def _reconnect(self):
+        self.conn = None
+        try:
+            self.connect()
+        except libvirt.libvirtError as e:
+            print(f"Revival supervisor: reconnect failed: {e}", file=sys.stderr)
+            time.sleep(RECONNECT_INTERVAL_SECONDS)
+
+    def _check_startup_deadlines(self):
+        now = time.monotonic()
+        with self.lock: expired = [name for name, deadline in self.watches.items() if deadline is not None and deadline < now]
+        for name in expired:
+            if self._is_name_active(name):
+                with self.lock: self.watches[name] = None
+                continue
+            with self.lock: self.watches.pop(name, None)
+            self._finish_timing(name, 'timeout')
+            self.restore_display_manager(f"VM {name} did not start within {STARTUP_TIMEOUT_SECONDS}s")
+
+    def _poll_running(self):
+        with self.lock: running = [name for name, deadline in self.watches.items() if deadline is None]
+        for name in running:
+            if not self._is_name_active(name):
+                with self.lock: self.watches.pop(name, None)
+                self._finish_timing(name, 'stopped')
+                self.restore_display_manager(f"VM {name} has shut down (detected by polling)")
+
+    def _is_name_active(self, name):
+        try: return self.conn.lookupByName(name).isActive()
+        except libvirt.libvirtError: return False
+
+
+def bind_control_socket():
+    # Returns None when another supervisor already owns the socket
+    if os.path.exists(CONTROL_SOCKET):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(CONTROL_SOCKET); return None
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(CONTROL_SOCKET)
+        finally:
+            probe.close()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(CONTROL_SOCKET); os.chmod(CONTROL_SOCKET, 0o600); server.listen(8)
+    return server
+
+
+def run_supervisor(display_manager):
+    server = bind_control_socket()
+    if server is None:
+        print("Revival supervisor already running.")
+        return 0
+    domain_model.start_event_loop()
+    supervisor = RevivalSupervisor(display_manager)
     try:
-        conn = libvirt.open('qemu:///system')
+        supervisor.connect()
     except libvirt.libvirtError as e:
         print(f"Revival script failed to connect to libvirt: {e}", file=sys.stderr)
-        sys.exit(1)
-
+        server.close(); os.unlink(CONTROL_SOCKET)
+        return 1
     try:
-        domain = conn.lookupByName(vm_name)
-    except libvirt.libvirtError:
-        print(f"Revival script could not find VM: {vm_name}", file=sys.stderr)
-        conn.close()
-        sys.exit(1)
+        supervisor.serve(server)
+    finally:
+        server.close(); os.unlink(CONTROL_SOCKET)
 
-    # First, wait for the VM to actually start running
-    while not domain.isActive():
-        print("Revival script: Waiting for VM to become active...")
-        time.sleep(POLL_INTERVAL_SECONDS)
 
-    print(f"Revival script: VM {vm_name} is active. Monitoring for shutdown.")
+def spawn_supervisor(display_manager):
+    try:
+        os.makedirs(os.path.dirname(SUPERVISOR_LOG), exist_ok=True); log = open(SUPERVISOR_LOG, 'a')
+    except OSError as e:
+        print(f"Revival script: could not open {SUPERVISOR_LOG}: {e}", file=sys.stderr); log = subprocess.DEVNULL
+    try:
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), '--daemon', '--display-manager', display_manager],
+                         stdin=subprocess.DEVNULL, stdout=log, stderr=log, close_fds=True, preexec_fn=os.setpgrp)
+    finally:
+        if log is not subprocess.DEVNULL: log.close()
 
-    # Now, monitor until the VM is no longer active
-    while domain.isActive():
-        time.sleep(POLL_INTERVAL_SECONDS)
 
-    print(f"Revival script: VM {vm_name} has shut down.")
-    conn.close()
+def request_watch(vm_name, display_manager, requested_at):
+    # Hand the VM to the running supervisor, starting one first if needed.
+    # Returns once the supervisor has acknowledged the watch.
+    spawned = False
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.settimeout(5.0)
+                client.connect(CONTROL_SOCKET)
+                client.sendall(f"watch {requested_at:.3f} {vm_name}\n".encode('utf-8'))
+                return client.makefile('r').readline().strip() == "ok"
+        except (FileNotFoundError, ConnectionRefusedError):
+            if not spawned:
+                spawn_supervisor(display_manager); spawned = True
+            time.sleep(0.1)
+    return False
 
-    # Time to bring the host GUI back to life
-    print(f"Revival script: Restarting display manager '{DISPLAY_MANAGER_SERVICE}'...")
-    # This command requires root privileges
-    os.system(f"systemctl start {DISPLAY_MANAGER_SERVICE}")
 
+def main():
+    parser = argparse.ArgumentParser(description="Restore the host display manager after GPU passthrough VMs shut down.")
+    parser.add_argument('vm_name', nargs='?', help="passthrough VM about to be started")
+    parser.add_argument('--daemon', action='store_true', help="run the revival supervisor")
+    parser.add_argument('--display-manager', default=DISPLAY_MANAGER_SERVICE, help="systemd unit to restart (default: %(default)s)")
+    parser.add_argument('--requested-at', type=float, default=None, help="epoch time the start was requested, for phase timings")
+    args = parser.parse_args()
+
+    if args.daemon: sys.exit(run_supervisor(args.display_manager))
+    if not args.vm_name:
+        print("Usage: revival_script.py <vm_name> | --daemon", file=sys.stderr)
+        sys.exit(1)
+    print(f"Revival script started for VM: {args.vm_name}")
+    if not request_watch(args.vm_name, args.display_manager, args.requested_at or time.time()):
+        print(f"Revival script could not reach the supervisor for VM: {args.vm_name}", file=sys.stderr)
+        sys.exit(1)
+    # sd_notify-style readiness line the launcher waits for before calling create()
+    print("READY=1", flush=True)
     sys.exit(0)
 
 if __name__ == "__main__":
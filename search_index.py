@@ -0,0 +1,151 @@
+import bisect
+from collections import namedtuple
+
+# Ranking tiers, best first
+TIER_EXACT = 0
+TIER_NAME_PREFIX = 1
+TIER_WORD_PREFIX = 2
+TIER_NAME_SUBSTRING = 3
+TIER_FIELD_SUBSTRING = 4
+TIER_FUZZY = 5
+
+# Typos allowed per query word: none below FUZZY_MIN_LENGTH characters, two from FUZZY_TWO_TYPOS_LENGTH on
+FUZZY_MIN_LENGTH = 3
+FUZZY_TWO_TYPOS_LENGTH = 8
+
+SearchEntry = namedtuple('SearchEntry', ['uuid', 'name', 'name_key', 'text', 'words'])
+SearchResult = namedtuple('SearchResult', ['uuid', 'name', 'tier'])
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _words(text):
+    for sep in '-_.:/':
+        text = text.replace(sep, ' ')
+    return tuple(text.split())
+
+
+def _prefix_distance(token, word, limit):
+    # Fewest edits (adjacent transpositions count as one) turning token into some prefix of word, so
+    # "wni1" is one edit from "win10"; gives up with limit + 1 as soon as no prefix can be within limit
+    before, previous = None, list(range(len(word) + 1))
+    for i in range(1, len(token) + 1):
+        current = [i] + [0] * len(word)
+        for j in range(1, len(word) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (token[i - 1] != word[j - 1]))
+            if i > 1 and j > 1 and token[i - 1] == word[j - 2] and token[i - 2] == word[j - 1]: current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit: return limit + 1
+        before, previous = previous, current
+    return min(previous)
+
+
+def _typo_limit(token):
+    # Numbers are never typos: seat 0042 is not seat 0043
+    if len(token) < FUZZY_MIN_LENGTH or token.isdigit(): return 0
+    return 2 if len(token) >= FUZZY_TWO_TYPOS_LENGTH else 1
+
+
+class SearchIndex:
+    def __init__(self):
+        self._entries = {}
+        self._sorted_names = []  # (name_key, uuid), for prefix lookups via bisect
+        self._postings = {}  # trigram -> set of uuids
+        self._word_postings = {}  # word of any field -> set of uuids, for typo matching
+        self._fuzzy_cache = {}  # query word -> uuids, while the index is unchanged; typing repeats earlier words
+
+    def __len__(self):
+        return len(self._entries)
+
+    def update(self, uuid, name, title='', description='', metadata=()):
+        name_key = name.lower()
+        text = '\n'.join([name_key, (title or '').lower(), (description or '').lower()] + [m.lower() for m in metadata if m])
+        current = self._entries.get(uuid)
+        if current is not None and current.name == name and current.text == text: return False
+        if current is not None: self.remove(uuid)
+        self._fuzzy_cache = {}
+        entry = SearchEntry(uuid, name, name_key, text, _words(name_key))
+        self._entries[uuid] = entry
+        bisect.insort(self._sorted_names, (name_key, uuid))
+        for trigram in _trigrams(text):
+            self._postings.setdefault(trigram, set()).add(uuid)
+        for word in set(_words(text)):
+            self._word_postings.setdefault(word, set()).add(uuid)
+        return True
+
+    def remove(self, uuid):
+        entry = self._entries.pop(uuid, None)
+        if entry is None: return
+        self._fuzzy_cache = {}
+        i = bisect.bisect_left(self._sorted_names, (entry.name_key, uuid))
+        if i < len(self._sorted_names) and self._sorted_names[i] == (entry.name_key, uuid): del self._sorted_names[i]
+        for trigram in _trigrams(entry.text):
+            uuids = self._postings.get(trigram)
+            if uuids is None: continue
+            uuids.discard(uuid)
+            if not uuids: del self._postings[trigram]
+        for word in set(_words(entry.text)):
+            uuids = self._word_postings.get(word)
+            if uuids is None: continue
+            uuids.discard(uuid)
+            if not uuids: del self._word_postings[word]
+
+    def retain(self, uuids):
+        for uuid in set(self._entries) - set(uuids):
+            self.remove(uuid)
+
+    def search(self, query, limit=None):
+        query = query.strip().lower()
+        if not query: return []
+        tiers = {}
+
+        # Name prefixes straight from the sorted list
+        i = bisect.bisect_left(self._sorted_names, (query,))
+        while i < len(self._sorted_names) and self._sorted_names[i][0].startswith(query):
+            name_key, uuid = self._sorted_names[i]
+            tiers[uuid] = TIER_EXACT if name_key == query else TIER_NAME_PREFIX
+            i += 1
+
+        query_trigrams = _trigrams(query)
+        if query_trigrams:
+            # Substring candidates contain every query trigram; intersect the smallest postings first
+            postings = sorted((self._postings.get(t, set()) for t in query_trigrams), key=len)
+            candidates = set.intersection(*postings) if postings[0] else set()
+        else:
+            # Queries shorter than a trigram fall back to a scan
+            candidates = self._entries
+        for uuid in candidates:
+            if uuid in tiers: continue
+            tier = self._rank(self._entries[uuid], query)
+            if tier is not None: tiers[uuid] = tier
+
+        if limit is None or len(tiers) < limit:
+            # Typos: every word of the query is within a few edits of the start of some word of the VM
+            for uuid in self._fuzzy_matches(_words(query)):
+                if uuid not in tiers: tiers[uuid] = TIER_FUZZY
+
+        ranked = sorted(tiers.items(), key=lambda item: (item[1], len(self._entries[item[0]].name), self._entries[item[0]].name_key))
+        if limit is not None: ranked = ranked[:limit]
+        return [SearchResult(uuid, self._entries[uuid].name, tier) for uuid, tier in ranked]
+
+    def _fuzzy_matches(self, tokens):
+        matches = None
+        for token in tokens:
+            uuids = self._fuzzy_cache.get(token)
+            if uuids is None:
+                limit = _typo_limit(token); uuids = set()
+                for word, owners in self._word_postings.items():
+                    if word.startswith(token): uuids |= owners
+                    # No prefix of a word that much shorter is within limit edits
+                    elif limit and len(word) >= len(token) - limit and _prefix_distance(token, word, limit) <= limit: uuids |= owners
+                self._fuzzy_cache[token] = uuids
+            matches = uuids if matches is None else matches & uuids
+            if not matches: return set()
+        return matches or set()
+
+    def _rank(self, entry, query):
+        if any(word.startswith(query) for word in entry.words): return TIER_WORD_PREFIX
+        if query in entry.name_key: return TIER_NAME_SUBSTRING
+        if query in entry.text: return TIER_FIELD_SUBSTRING
+        return None
@@ -0,0 +1,41 @@
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = 4
+
+
+class TaskRunner:
+    def __init__(self, dispatch, max_workers=MAX_WORKERS):
+        # dispatch(callback, *args) hands results back to the UI thread, e.g. GLib.idle_add.
+        self.dispatch = dispatch
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="vmlauncher-worker")
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, key=None, on_done=None, on_error=None):
+        # Tasks sharing a key never overlap: returns False if one is still running.
+        if key is not None:
+            with self._lock:
+                if key in self._in_flight: return False
+                self._in_flight.add(key)
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(lambda f: self.dispatch(self._finish, f, key, on_done, on_error))
+        return True
+
+    def is_running(self, key):
+        with self._lock: return key in self._in_flight
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def _finish(self, future, key, on_done, on_error):
+        if key is not None:
+            with self._lock: self._in_flight.discard(key)
+        error = future.exception()
+        if error is not None:
+            if on_error: on_error(error)
+            else: print(f"Background task {key or ''} failed: {error}", file=sys.stderr)
+        elif on_done:
+            on_done(future.result())
+        return False
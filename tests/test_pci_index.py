@@ -0,0 +1,88 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pci_index
+
+GPU = '0000:01:00.0'
+GPU_AUDIO = '0000:01:00.1'
+BRIDGE = '0000:00:01.0'
+USB = '0000:02:00.0'
+NIC = '0000:03:00.0'
+
+
+class FixtureTreeTest(unittest.TestCase):
+    # A sysfs tree laid out like /sys: bus/pci/devices/<address> with vendor, device, class, and
+    # driver and iommu_group symlinks into bus/pci/drivers and kernel/iommu_groups
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        # Group 1: GPU, its audio function and the root port bridge. Group 2: a USB controller still on xhci_hcd.
+        self.add_device(GPU, '0x030000', 'vfio-pci', 1)
+        self.add_device(GPU_AUDIO, '0x040300', 'snd_hda_intel', 1)
+        self.add_device(BRIDGE, '0x060400', 'pcieport', 1)
+        self.add_device(USB, '0x0c0330', 'xhci_hcd', 2)
+        self.add_device(NIC, '0x020000', None, None)
+
+    def add_device(self, address, class_code, driver, group):
+        path = os.path.join(self.root, 'bus/pci/devices', address)
+        os.makedirs(path)
+        for name, value in (('vendor', '0x10de'), ('device', '0x1b80'), ('class', class_code)):
+            with open(os.path.join(path, name), 'w') as f: f.write(value + '\n')
+        if driver is not None:
+            driver_dir = os.path.join(self.root, 'bus/pci/drivers', driver)
+            os.makedirs(driver_dir, exist_ok=True)
+            os.symlink(driver_dir, os.path.join(path, 'driver'))
+        if group is not None:
+            group_dir = os.path.join(self.root, 'kernel/iommu_groups', str(group))
+            os.makedirs(group_dir, exist_ok=True)
+            os.symlink(group_dir, os.path.join(path, 'iommu_group'))
+
+    def test_scan(self):
+        index = pci_index.PCIIndex.scan(self.root)
+        self.assertEqual(sorted(index.devices), sorted([GPU, GPU_AUDIO, BRIDGE, USB, NIC]))
+        gpu = index.devices[GPU]
+        self.assertEqual((gpu.vendor, gpu.device, gpu.class_code, gpu.driver, gpu.iommu_group), (0x10de, 0x1b80, 0x030000, 'vfio-pci', '1'))
+        self.assertTrue(index.devices[BRIDGE].is_bridge)
+        self.assertEqual(sorted(d.address for d in index.groups['1']), [BRIDGE, GPU, GPU_AUDIO])
+        self.assertIsNone(index.devices[NIC].driver)
+
+    def test_unreadable_sysfs(self):
+        self.assertIsNone(pci_index.PCIIndex.scan(os.path.join(self.root, 'missing')))
+
+    def test_whole_group_passed_through(self):
+        index = pci_index.PCIIndex.scan(self.root)
+        # The bridge shares the group but is skipped
+        self.assertEqual(index.conflicts([GPU, GPU_AUDIO], {}), [])
+
+    def test_group_member_on_host_driver(self):
+        index = pci_index.PCIIndex.scan(self.root)
+        reasons = index.conflicts([GPU], {})
+        self.assertEqual(len(reasons), 1)
+        self.assertIn(GPU_AUDIO, reasons[0]); self.assertIn('snd_hda_intel', reasons[0])
+        self.assertEqual(len(index.conflicts([USB], {})), 0)
+
+    def test_claimed_by_another_vm(self):
+        index = pci_index.PCIIndex.scan(self.root)
+        reasons = index.conflicts([GPU, GPU_AUDIO], {GPU: 'gaming'})
+        self.assertEqual(reasons, [f"PCI device {GPU} is in use by gaming"])
+        reasons = index.conflicts([GPU], {GPU_AUDIO: 'gaming'})
+        self.assertEqual(len(reasons), 1); self.assertIn('in use by gaming', reasons[0]); self.assertIn(GPU_AUDIO, reasons[0])
+
+    def test_missing_device_and_group(self):
+        index = pci_index.PCIIndex.scan(self.root)
+        self.assertEqual(index.conflicts(['0000:09:00.0'], {}), ["PCI device 0000:09:00.0 is not present on this host"])
+        self.assertEqual(len(index.conflicts([NIC], {})), 1)
+        self.assertIn('no IOMMU group', index.conflicts([NIC], {})[0])
+
+    def test_hostdev_addresses(self):
+        self.assertEqual(pci_index.hostdev_addresses([('0x0000', '0x01', '0x00', '0x1'), (None, '0x01', '0x00', '0x0'), ('0x0000', 'zz', '0x00', '0x0')]),
+                         [GPU_AUDIO])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,235 @@
+import os
+import socket
+import sys
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import gi
+
+import libvirt
+
+# Warm display sessions kept connected for instant switching
+POOL_CAPACITY = 4
+POOL_IDLE_SECONDS = 300
+POOL_MEMORY_CAP_BYTES = 256 * 1024 * 1024
+DEFAULT_FRAMEBUFFER_SIZE = (1920, 1080)
+
+# TCP is only used for remote hypervisors or when no local transport works
+WILDCARD_HOSTS = ('', '0.0.0.0', '::')
+LOOPBACK_HOSTS = ('localhost', '127.0.0.1', '::1')
+SPICE_CA_FILE = '/etc/pki/libvirt-spice/ca-cert.pem'
+
+# SPICE and VNC client stacks are only loaded when the first display of that type is opened
+_viewer_modules = {}
+
+
+def load_viewer_modules(graphics_type):
+    if graphics_type not in _viewer_modules:
+        if graphics_type == 'spice':
+            gi.require_version('SpiceClientGLib', '2.0')
+            gi.require_version('SpiceClientGtk', '3.0')
+            from gi.repository import SpiceClientGLib, SpiceClientGtk
+            _viewer_modules['spice'] = (SpiceClientGLib, SpiceClientGtk)
+        elif graphics_type == 'vnc':
+            gi.require_version('GtkVnc', '2.0')
+            from gi.repository import GtkVnc
+            _viewer_modules['vnc'] = (GtkVnc,)
+        else:
+            return None
+    return _viewer_modules[graphics_type]
+
+
+def remote_host_for_uri(uri):
+    # None for a hypervisor on this machine, otherwise the host its TCP displays are reached on
+    host = urlsplit(uri).hostname
+    return host if host and host not in LOOPBACK_HOSTS else None
+
+
+def _port(value):
+    try: port = int(value)
+    except (TypeError, ValueError): return None
+    return port if port > 0 else None
+
+
+def resolve_transports(graphics, remote_host=None, can_open_fd=False):
+    # Candidate transports, best first: ('unix', path), ('fd', None), ('tcp', (host, port, tls_port))
+    transports = []
+    if remote_host is None:
+        path = graphics.get('socket')
+        if path and os.access(path, os.R_OK | os.W_OK): transports.append(('unix', path))
+        # libvirt hands out a connected socket regardless of listen type or socket permissions
+        if can_open_fd: transports.append(('fd', None))
+    # GL scanout hands dmabufs to a client on the same machine; QEMU serves those displays over no TCP port
+    if graphics.get('listenType') in ('socket', 'none') or graphics.get('gl') == 'yes': return transports
+    host = graphics.get('listen', '')
+    if host in WILDCARD_HOSTS or (remote_host is not None and host in LOOPBACK_HOSTS): host = remote_host or '127.0.0.1'
+    # Ports stay -1 in the inactive XML until autoport assigns them at start
+    port, tls_port = _port(graphics.get('port')), _port(graphics.get('tlsPort'))
+    if graphics.get('type') == 'spice' and graphics.get('defaultMode') == 'secure': port = None
+    if graphics.get('type') != 'spice': tls_port = None
+    if port or tls_port: transports.append(('tcp', (host, port, tls_port)))
+    return transports
+
+
+def open_graphics_fd(domain):
+    return domain.openGraphicsFD(0, libvirt.VIR_DOMAIN_OPEN_GRAPHICS_SKIPAUTH)
+
+
+def _on_spice_channel_new(session, channel, domain):
+    # Sessions opened from an fd ask for one connected socket per channel
+    channel.connect('open-fd', _on_spice_channel_open_fd, domain)
+
+
+def _on_spice_channel_open_fd(channel, with_tls, domain):
+    try: channel.open_fd(open_graphics_fd(domain))
+    except libvirt.libvirtError as e: print(f"Could not open SPICE channel: {e}", file=sys.stderr)
+
+
+def _open_spice(modules, mode, target, domain):
+    SpiceClientGLib, SpiceClientGtk = modules
+    session = SpiceClientGLib.Session()
+    if mode == 'fd':
+        fd = open_graphics_fd(domain)
+        session.connect('channel-new', _on_spice_channel_new, domain)
+    display_widget = SpiceClientGtk.Display(session=session)
+    if mode == 'unix':
+        session.set_property('unix-path', target); session.connect()
+    elif mode == 'fd':
+        session.open_fd(fd)
+    else:
+        host, port, tls_port = target
+        session.set_property('host', host)
+        if port: session.set_property('port', str(port))
+        if tls_port:
+            session.set_property('tls-port', str(tls_port))
+            if os.path.exists(SPICE_CA_FILE): session.set_property('ca-file', SPICE_CA_FILE)
+        session.connect()
+    return display_widget
+
+
+def _open_vnc(modules, mode, target, domain):
+    GtkVnc, = modules
+    if mode == 'unix':
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try: sock.connect(target)
+        except OSError: sock.close(); raise
+        fd = sock.detach()
+    elif mode == 'fd':
+        fd = open_graphics_fd(domain)
+    display_widget = GtkVnc.Display()
+    if mode == 'tcp': display_widget.open_host(target[0], str(target[1]))
+    else: display_widget.open_fd(fd)
+    return display_widget
+
+
+def create_display_widget(graphics, domain=None, remote_host=None):
+    # Returns a connecting SPICE/VNC display widget, or None for unsupported or unreachable graphics.
+    # Local guests are reached over a UNIX socket, which also lets SPICE use GL/dmabuf scanout when <gl> is on.
+    graphics_type = graphics.get('type')
+    modules = load_viewer_modules(graphics_type)
+    if modules is None: return None
+    can_open_fd = domain is not None and hasattr(domain, 'openGraphicsFD')
+    open_display = _open_spice if graphics_type == 'spice' else _open_vnc
+    for mode, target in resolve_transports(graphics, remote_host, can_open_fd):
+        try:
+            return open_display(modules, mode, target, domain)
+        except (OSError, libvirt.libvirtError) as e:
+            print(f"Could not open {graphics_type} display over {mode}: {e}", file=sys.stderr)
+    if graphics.get('gl') == 'yes' and remote_host is not None: print(f"SPICE GL displays can only be viewed on {remote_host} itself", file=sys.stderr)
+    else: print(f"No reachable {graphics_type} display", file=sys.stderr)
+    return None
+
+
+def close_display_widget(widget, graphics_type):
+    if graphics_type == 'spice':
+        session = widget.get_property('session')
+        if session is not None: session.disconnect()
+    elif graphics_type == 'vnc':
+        widget.close()
+    widget.destroy()
+
+
+class ViewerSession:
+    __slots__ = ('key', 'graphics', 'widget', 'holder', 'last_used')
+
+    def __init__(self, key, graphics, widget):
+        self.key = key
+        self.graphics = graphics
+        self.widget = widget
+        self.holder = None
+        self.last_used = time.monotonic()
+
+    def framebuffer_bytes(self):
+        width, height = self.widget.get_allocated_width(), self.widget.get_allocated_height()
+        if width <= 1 or height <= 1: width, height = DEFAULT_FRAMEBUFFER_SIZE
+        return width * height * 4
+
+
+class ViewerPool:
+    # Connected display widgets kept alive across the carousel, the embedded view and fullscreen windows.
+    # Widgets are reparented between holders instead of reconnecting.
+    def __init__(self, capacity=POOL_CAPACITY, idle_seconds=POOL_IDLE_SECONDS, memory_cap=POOL_MEMORY_CAP_BYTES):
+        self.capacity = capacity
+        self.idle_seconds = idle_seconds
+        self.memory_cap = memory_cap
+        self._sessions = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._sessions
+
+    def keys(self):
+        return list(self._sessions)
+
+    def acquire(self, key, graphics, holder, domain=None, remote_host=None):
+        # Returns an unparented, connected widget for holder, or None for unsupported graphics
+        session = self._sessions.get(key)
+        if session is not None and session.graphics != graphics:
+            self.discard(key); session = None
+        if session is None:
+            widget = create_display_widget(graphics, domain, remote_host)
+            if widget is None: return None
+            session = ViewerSession(key, dict(graphics), widget)
+            self._sessions[key] = session
+        self._sessions.move_to_end(key)
+        self._detach(session)
+        session.holder = holder; session.last_used = time.monotonic()
+        self._enforce_limits()
+        return session.widget
+
+    def release(self, key, holder=None):
+        # Keep the session connected but unparent it; holder guards against a newer holder's widget being released
+        session = self._sessions.get(key)
+        if session is None or (holder is not None and session.holder != holder): return
+        self._detach(session)
+        session.holder = None; session.last_used = time.monotonic()
+        self._enforce_limits()
+
+    def discard(self, key):
+        session = self._sessions.pop(key, None)
+        if session is None: return
+        self._detach(session)
+        close_display_widget(session.widget, session.graphics.get('type'))
+
+    def evict_idle(self):
+        now = time.monotonic()
+        for key in [k for k, s in self._sessions.items() if s.holder is None and now - s.last_used > self.idle_seconds]:
+            self.discard(key)
+        return True
+
+    def clear(self):
+        for key in list(self._sessions): self.discard(key)
+
+    def _detach(self, session):
+        parent = session.widget.get_parent()
+        if parent is not None: parent.remove(session.widget)
+
+    def _enforce_limits(self):
+        # Evict least recently used idle sessions first; sessions on screen are never evicted
+        while True:
+            idle = [s for s in self._sessions.values() if s.holder is None]
+            if not idle: return
+            over_capacity = len(self._sessions) > self.capacity
+            over_memory = sum(s.framebuffer_bytes() for s in self._sessions.values()) > self.memory_cap
+            if not (over_capacity or over_memory): return
+            self.discard(idle[0].key)
@@ -1,20 +1,35 @@
+import time
+STARTUP_T0 = time.monotonic()
+
 import gi
 gi.require_version('Gtk', '3.0')
-gi.require_version('GtkVnc', '2.0')
-gi.require_version('SpiceClientGLib', '2.0')
-gi.require_version('SpiceClientGtk', '3.0')
-from gi.repository import Gtk, Gdk, GLib, GtkVnc, SpiceClientGLib, SpiceClientGtk, Pango
+from gi.repository import Gtk, Gdk, GLib, Pango
 
 import libvirt
 import os
 import sys
 import subprocess
-import xml.etree.ElementTree as ET
-import time
 import configparser
 import gettext
 import locale
 
+import audio_backend
+import bulk_actions
+import connection_manager
+import control_api
+import domain_model
+import host_shutdown
+import image_cache
+import launch_profiles
+import launcher_service
+import metrics
+import overview_grid
+import prewarm
+import resource_monitor
+import search_index
+import task_runner
+import viewers
+
 # i18n
 APP_NAME = "vmlauncher"
 if os.path.exists('/usr/share/locale'):
@@ -33,8 +48,16 @@ _ = trans.gettext
 
 # --- Configuration ---
 REFRESH_INTERVAL_SECONDS = 3
+# With libvirt domain events the periodic refresh is only a safety net
+SAFETY_REFRESH_INTERVAL_SECONDS = 60
+SEARCH_DEBOUNCE_MS = 120
+# A control socket refresh waits this long between tries while another refresh is running
+API_REFRESH_RETRY_MS = 100
+SEARCH_RESULT_LIMIT = 50
 CONFIG_DIR = os.path.expanduser('~/.config/vmlauncher')
 CONFIG_FILE = os.path.join(CONFIG_DIR, 'settings.ini')
+# Last known domain list, painted before libvirt answers
+WARM_START_FILE = os.path.join(CONFIG_DIR, 'warm_start.json')
 IMAGE_DIR = '/usr/share/vmlauncher/images' if os.path.exists('/usr/share/vmlauncher/images') else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images')
 
 IMAGE_MAPPINGS = {
@@ -43,34 +66,29 @@ IMAGE_MAPPINGS = {
     'linux': 'linux.png',
 }
 PLACEHOLDER_IMAGE = 'placeholder.png'
+# Live guest thumbnails (settings.ini: live_thumbnails = True)
+THUMBNAIL_INTERVAL_SECONDS = 5
+# Idle warm viewer sessions are checked for eviction this often (settings.ini: warm_viewers = N caps the pool)
+VIEWER_EVICT_INTERVAL_SECONDS = 60
+# A VM shown in the carousel this long has its disk images prewarmed (settings.ini: prewarm_budget_mb)
+PREWARM_DELAY_MS = 1500
 # --- End Configuration ---
 
 
 class VMViewerWindow(Gtk.Window):
-    def __init__(self, vm_name, graphics):
+    def __init__(self, vm_name, graphics, viewer_pool, domain=None, remote_host=None):
         super().__init__(title=_("Viewer for {}").format(vm_name))
         self.set_default_size(1024, 768)
         self.vm_name = vm_name
         self.is_fullscreen = True
         self.fullscreen()
         self.connect("key-press-event", self._on_key_press)
+        self.connect("delete-event", self._on_delete)
 
-        self.display_widget = None
         self.graphics_type = graphics.get('type')
-        
-        if self.graphics_type == 'spice':
-            session = SpiceClientGLib.Session()
-            session.set_property('host', graphics.get('listen', '127.0.0.1'))
-            port = graphics.get('port')
-            if port: session.set_property('port', port)
-            tls_port = graphics.get('tlsPort')
-            if tls_port: session.set_property('tls-port', tls_port)
-            self.display_widget = SpiceClientGtk.Display(session=session)
-            session.connect()
-        elif self.graphics_type == 'vnc':
-            self.display_widget = GtkVnc.Display()
-            self.display_widget.open_host(graphics.get('listen', '127.0.0.1'), graphics.get('port'))
-        
+        self.viewer_pool = viewer_pool
+        self.display_widget = viewer_pool.acquire(vm_name, graphics, self, domain, remote_host)
+
         if self.display_widget:
             self.add(self.display_widget)
             self.display_widget.show()
@@ -79,6 +97,11 @@ class VMViewerWindow(Gtk.Window):
             self.add(label)
             label.show()
 
+    def _on_delete(self, widget, event):
+        # Hand the connected display back to the pool before the window destroys its children
+        if self.display_widget: self.viewer_pool.release(self.vm_name, self)
+        return False
+
     def _on_key_press(self, widget, event):
         ctrl_pressed = (event.state & Gdk.ModifierType.CONTROL_MASK) != 0
         alt_pressed = (event.state & Gdk.ModifierType.MOD1_MASK) != 0
@@ -93,35 +116,279 @@ class VMViewerWindow(Gtk.Window):
         self.is_fullscreen = not self.is_fullscreen
 
 
+def _state_row(name, state_text):
+    # A name on the left, a state that may carry an error message on the right
+    row_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+    row_box.pack_start(Gtk.Label(label=name, xalign=0), True, True, 0)
+    state_label = Gtk.Label(label=state_text, xalign=1); state_label.set_ellipsize(Pango.EllipsizeMode.END)
+    row_box.pack_start(state_label, True, True, 0)
+    return row_box, state_label
+
+
+class BulkActionDialog(Gtk.Dialog):
+    # Pick a group and an action, then follow every VM's progress; failures are collected here, not one dialog each
+    ALL_VMS = ""
+
+    def __init__(self, launcher):
+        super().__init__(title=_("Group Actions"), transient_for=launcher, modal=True)
+        self.set_default_size(560, 480)
+        self.launcher = launcher
+        self.bulk_run = None
+        self.finished = False
+        self.state_labels = {}
+        self.action_labels = {"start": _("Start"), "shutdown": _("Shutdown"), "reboot": _("Reboot"), "destroy": _("Destroy")}
+        self.state_names = {bulk_actions.PENDING: _("Pending"), bulk_actions.RUNNING: _("Running…"), bulk_actions.DONE: _("Done"),
+                            bulk_actions.SKIPPED: _("Skipped"), bulk_actions.FAILED: _("Failed")}
+        self.close_button = self.add_button(_("Cancel"), Gtk.ResponseType.CANCEL)
+        self.run_button = self.add_button(_("Run"), Gtk.ResponseType.OK)
+        self.connect("response", self._on_response)
+        self.connect("delete-event", self._on_delete)
+
+        content = self.get_content_area(); content.set_spacing(10); content.set_border_width(10)
+        picker_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        content.pack_start(picker_box, False, False, 0)
+        self.group_combo = Gtk.ComboBoxText()
+        self.group_combo.append(self.ALL_VMS, _("All VMs"))
+        for name in sorted(launcher.service.groups): self.group_combo.append(name, name)
+        self.group_combo.set_active(0)
+        self.action_combo = Gtk.ComboBoxText()
+        for action in launcher_service.VM_ACTIONS: self.action_combo.append(action, self.action_labels[action])
+        self.action_combo.set_active(0)
+        picker_box.pack_start(self.group_combo, True, True, 0); picker_box.pack_start(self.action_combo, True, True, 0)
+
+        self.summary_label = Gtk.Label(xalign=0)
+        content.pack_start(self.summary_label, False, False, 0)
+        self.progress_bar = Gtk.ProgressBar()
+        content.pack_start(self.progress_bar, False, False, 0)
+        self.vm_listbox = Gtk.ListBox(); self.vm_listbox.set_selection_mode(Gtk.SelectionMode.NONE)
+        scrolled_win = Gtk.ScrolledWindow(); scrolled_win.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
+        scrolled_win.add(self.vm_listbox)
+        content.pack_start(scrolled_win, True, True, 0)
+
+        self.group_combo.connect("changed", self._on_selection_changed); self.action_combo.connect("changed", self._on_selection_changed)
+        self._on_selection_changed(None)
+
+    def _members(self):
+        group = self.group_combo.get_active_id()
+        if group == self.ALL_VMS: return list(self.launcher.vm_domains)
+        return self.launcher.service.group_members(group, self.launcher.vm_domains)
+
+    def _on_selection_changed(self, combo):
+        action = self.action_combo.get_active_id(); members = self._members()
+        for row in self.vm_listbox.get_children(): self.vm_listbox.remove(row)
+        self.state_labels = {}; affected = 0
+        for domain in members:
+            reason = self.launcher._bulk_skip_reason(domain, action)
+            if reason is None: affected += 1
+            self._add_row(domain, _("Skipped: {}").format(reason) if reason else self.state_names[bulk_actions.PENDING])
+        self.vm_listbox.show_all()
+        self.summary_label.set_text(_("{} of {} VMs will be affected.").format(affected, len(members)))
+        self.run_button.set_sensitive(affected > 0)
+
+    def _add_row(self, domain, state_text):
+        row_box, state_label = _state_row(domain.name(), state_text)
+        self.vm_listbox.add(row_box); self.state_labels[domain.UUIDString()] = state_label
+
+    def _on_response(self, dialog, response):
+        if response == Gtk.ResponseType.OK and self.bulk_run is None:
+            self.bulk_run = self.launcher._start_bulk(self.action_combo.get_active_id(), self._members(), self._on_progress, self._on_finished)
+            self.group_combo.set_sensitive(False); self.action_combo.set_sensitive(False); self.run_button.set_sensitive(False)
+        elif self.bulk_run is not None and not self.finished:
+            self.bulk_run.cancel(); self.close_button.set_sensitive(False)
+        else:
+            self.destroy()
+
+    def _on_delete(self, widget, event):
+        # Closing mid-run cancels what has not been launched yet; the dialog stays up until the rest has finished
+        if self.bulk_run is None or self.finished: return False
+        self.bulk_run.cancel(); self.close_button.set_sensitive(False)
+        return True
+
+    def _on_progress(self, result):
+        state_label = self.state_labels.get(result.uuid)
+        if state_label is not None:
+            text = self.state_names[result.state]
+            if result.error: text = f"{text}: {result.error}"
+            state_label.set_text(text); state_label.set_tooltip_text(result.error)
+            if result.state == bulk_actions.FAILED: state_label.get_style_context().add_class("bulk-failed")
+        results = self.bulk_run.results
+        finished = sum(1 for r in results if r.state in bulk_actions.FINISHED_STATES)
+        self.progress_bar.set_fraction(finished / len(results) if results else 1.0)
+        self.launcher._on_bulk_progress(result)
+
+    def _on_finished(self, results):
+        self.finished = True
+        counts = self.bulk_run.summary()
+        self.summary_label.set_text(_("{} done, {} skipped, {} failed.").format(counts[bulk_actions.DONE], counts[bulk_actions.SKIPPED], counts[bulk_actions.FAILED]))
+        if counts[bulk_actions.FAILED]: self.summary_label.get_style_context().add_class("bulk-failed")
+        self.progress_bar.set_fraction(1.0)
+        self.close_button.set_label(_("Close")); self.close_button.set_sensitive(True)
+        self.launcher._on_bulk_finished(self.bulk_run)
+
+
+class HostShutdownDialog(Gtk.Dialog):
+    # Running guests shut down in parallel before the host goes down; past the timeout they are saved or forced off
+    def __init__(self, launcher, shutdown, action):
+        super().__init__(title=_("Shutting Down Host") if action == "poweroff" else _("Rebooting Host"), transient_for=launcher, modal=True)
+        self.set_default_size(560, 420)
+        self.set_deletable(False)
+        self.launcher = launcher
+        self.shutdown = shutdown
+        self.action = action
+        self.state_labels = {}
+        self.state_names = {host_shutdown.SHUTTING_DOWN: _("Shutting down…"), host_shutdown.ESCALATING: _("Saving…") if shutdown.escalation == host_shutdown.ESCALATE_SAVE else _("Forcing off…"),
+                            host_shutdown.STOPPED: _("Shut down"), host_shutdown.SAVED: _("Saved"), host_shutdown.DESTROYED: _("Forced off"), host_shutdown.FAILED: _("Failed")}
+        self.cancel_button = self.add_button(_("Cancel"), Gtk.ResponseType.CANCEL)
+        self.now_button = self.add_button(_("Stop Waiting"), Gtk.ResponseType.OK)
+        self.now_button.set_tooltip_text(_("Save or force off the remaining VMs now"))
+        self.connect("response", self._on_response)
+        self.connect("delete-event", lambda widget, event: True)
+
+        content = self.get_content_area(); content.set_spacing(10); content.set_border_width(10)
+        self.summary_label = Gtk.Label(label=_("Waiting up to {} seconds for {} VM(s) to shut down…").format(shutdown.timeout_seconds, len(shutdown.jobs)), xalign=0)
+        content.pack_start(self.summary_label, False, False, 0)
+        self.progress_bar = Gtk.ProgressBar()
+        content.pack_start(self.progress_bar, False, False, 0)
+        vm_listbox = Gtk.ListBox(); vm_listbox.set_selection_mode(Gtk.SelectionMode.NONE)
+        for result in shutdown.results:
+            row_box, self.state_labels[result.uuid] = _state_row(result.name, self.state_names[result.state]); vm_listbox.add(row_box)
+        scrolled_win = Gtk.ScrolledWindow(); scrolled_win.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
+        scrolled_win.add(vm_listbox)
+        content.pack_start(scrolled_win, True, True, 0)
+
+        shutdown.on_progress = self._on_progress
+        shutdown.start(self._on_finished)
+
+    def _on_response(self, dialog, response):
+        if response == Gtk.ResponseType.OK: self.shutdown.escalate_now()
+        else: self.shutdown.cancel(); self.cancel_button.set_sensitive(False)
+        self.now_button.set_sensitive(False)
+
+    def _on_progress(self, result):
+        state_label = self.state_labels[result.uuid]
+        text = self.state_names[result.state]
+        if result.error and result.state in (host_shutdown.DESTROYED, host_shutdown.FAILED): text = f"{text}: {result.error}"
+        state_label.set_text(text); state_label.set_tooltip_text(result.error)
+        if result.state == host_shutdown.FAILED: state_label.get_style_context().add_class("bulk-failed")
+        results = self.shutdown.results
+        self.progress_bar.set_fraction(sum(1 for r in results if r.state in host_shutdown.FINISHED_STATES) / len(results))
+
+    def _on_finished(self, results):
+        self.destroy()
+        self.launcher._on_host_shutdown_finished(self.shutdown, self.action)
+
+
 class VMLauncher(Gtk.Window):
     def __init__(self):
         super().__init__(title=_("VM Launcher"))
-        self.connect("destroy", Gtk.main_quit)
+        self.connect("destroy", self._on_main_window_destroy)
         self.fullscreen()
         
         # State Management
         self.vm_domains = []
+        self.vm_index_by_uuid = {}
         self.current_vm_index = -1
+        self.is_programmatic_combo_change = False
         self.open_viewers = {}
         self.last_vm_name_to_restore = None
         self.settings = configparser.ConfigParser()
         self.vms_in_view_mode = set()
         self.embedded_display_widget = None
         self.active_embedded_vm_name = None
+        self.viewer_pool = viewers.ViewerPool()
         self.restore_embedded_view_after_fullscreen = None
         self.is_first_load = True
-
-        try:
-            self.conn = libvirt.open('qemu:///system')
-        except libvirt.libvirtError as e:
-            print(f"Failed to open connection: {e}", file=sys.stderr)
-            sys.exit(1)
+        self.is_programmatic_volume_change = False
+        self.search_index = search_index.SearchIndex()
+        self.search_result_uuids = []
+        self.search_debounce_id = None
+        self.pixbufs = image_cache.PixbufCache()
+        self.image_paths = {}
+        self.image_size = (0, 0)
+        self.live_thumbnails = False
+        self.tasks = task_runner.TaskRunner(GLib.idle_add)
+        self.thumbnails = image_cache.ThumbnailCapturer(self.tasks)
+        self.audio = audio_backend.AudioBackend(self.tasks, self._on_audio_volume)
+        self.exit_code = 0
+        self.startup_marks = [("imports", time.monotonic())]
+        self.is_warm_start = False
+
+        self.hosts = [('', connection_manager.DEFAULT_URI)]
+        self.bulk_options = {}
+        self.bulk_run = None
+        self.shutdown_options = {}
+        self.guest_shutdown = None
+        self.launch_options = {}
+        self.prewarm_options = {}
+        self.prewarm_uuid = None
+        self.prewarm_id = None
 
         self._build_ui()
         self.apply_css()
         self._load_settings()
+
+        # Connections are opened in the background; until then the UI serves the warm-start snapshot
+        self.service = launcher_service.LauncherService(self.hosts, GLib.idle_add, shutdown_options=self.shutdown_options,
+                                                      launch_options=self.launch_options, prewarm_options=self.prewarm_options, **self.bulk_options)
+        self.connections = self.service.connections
+        self.descriptors = self.service.descriptors
+        self.connections.add_listener(self._on_domain_change)
+        self.resources = resource_monitor.ResourceMonitor(self.connections)
+        self.control_server = control_api.ControlServer(self.service, {'select': self._api_select, 'view': self._api_view,
+                                                                        'action': self._api_action, 'refresh': self._api_refresh})
+        try: self.control_server.start()
+        except OSError as e: print(f"Control API unavailable: {e}", file=sys.stderr)
+        self._mark_startup("ui")
+        self._load_warm_start()
+        self.first_frame_handler_id = self.connect("draw", self._on_first_frame)
+        GLib.timeout_add_seconds(VIEWER_EVICT_INTERVAL_SECONDS, self.viewer_pool.evict_idle)
+        self.tasks.submit(self._open_connection, on_done=self._on_connected, on_error=self._on_connect_failed)
+
+    def _mark_startup(self, phase):
+        if self.startup_marks is not None: self.startup_marks.append((phase, time.monotonic()))
+
+    def _report_startup(self):
+        if self.startup_marks is None: return
+        phases = ", ".join(f"{phase} {t - STARTUP_T0:.2f}s" for phase, t in self.startup_marks)
+        print(f"Startup timing: {phases}", file=sys.stderr)
+        self.startup_marks = None
+
+    def _on_first_frame(self, widget, cr):
+        self.disconnect(self.first_frame_handler_id)
+        self._mark_startup("first frame")
+        return False
+
+    def _load_warm_start(self):
+        records, descriptors = domain_model.load_warm_snapshot(WARM_START_FILE)
+        if not records: return
+        self.is_warm_start = True
+        self.connections.seed(records)
+        self.descriptors.seed(descriptors)
+        self._apply_vm_list([domain_model.CachedDomain(r.uuid, r.name) for r in records], warm=True)
+        self._mark_startup("warm paint")
+
+    def _save_warm_start(self):
+        if not self.vm_domains: return
+        records = [self.connections.record_for(d) for d in self.vm_domains]
+        self.tasks.submit(domain_model.save_warm_snapshot, WARM_START_FILE, records, self.descriptors, key="warm-start",
+                          on_error=lambda e: print(f"Error saving warm-start snapshot: {e}", file=sys.stderr))
+
+    def _open_connection(self):
+        # Worker thread
+        return self.service.connect()
+
+    def _on_connected(self, connected_hosts):
+        self._mark_startup("connected")
+        self._update_connection_status()
         self._refresh_vm_list()
-        GLib.timeout_add_seconds(REFRESH_INTERVAL_SECONDS, self._refresh_vm_list)
+        refresh_interval = SAFETY_REFRESH_INTERVAL_SECONDS if self.connections.events_enabled else REFRESH_INTERVAL_SECONDS
+        GLib.timeout_add_seconds(refresh_interval, self._refresh_vm_list)
+        if self.live_thumbnails: GLib.timeout_add_seconds(THUMBNAIL_INTERVAL_SECONDS, self._on_thumbnail_tick)
+        self._on_resource_tick()
+
+    def _on_connect_failed(self, error):
+        print(f"Failed to open connection: {error}", file=sys.stderr)
+        self.exit_code = 1; Gtk.main_quit()
 
     def _build_ui(self):
         main_vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
@@ -132,6 +399,30 @@ class VMLauncher(Gtk.Window):
         self.vm_name_label.set_use_markup(True)
         self.vm_name_label.get_style_context().add_class("header")
         main_vbox.pack_start(self.vm_name_label, False, False, 0)
+
+        self.vm_info_label = Gtk.Label(label="")
+        self.vm_info_label.get_style_context().add_class("counter")
+        main_vbox.pack_start(self.vm_info_label, False, False, 0)
+
+        # Live usage of the current VM: a rate and a sparkline per metric
+        self.resource_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=20)
+        self.resource_box.set_halign(Gtk.Align.CENTER)
+        self.resource_box.set_no_show_all(True)
+        self.resource_labels = {}
+        for metric in (resource_monitor.CPU, resource_monitor.MEMORY_RSS, resource_monitor.DISK, resource_monitor.NETWORK):
+            cell = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=2)
+            label = Gtk.Label(label=""); label.get_style_context().add_class("counter")
+            sparkline = Gtk.DrawingArea(); sparkline.set_size_request(140, 28)
+            sparkline.connect("draw", self._on_sparkline_draw, metric)
+            cell.pack_start(label, False, False, 0); cell.pack_start(sparkline, False, False, 0); cell.show_all()
+            self.resource_box.pack_start(cell, False, False, 0)
+            self.resource_labels[metric] = (label, sparkline)
+        main_vbox.pack_start(self.resource_box, False, False, 0)
+
+        self.connection_status_label = Gtk.Label(label="")
+        self.connection_status_label.get_style_context().add_class("status-warning")
+        self.connection_status_label.set_no_show_all(True)
+        main_vbox.pack_start(self.connection_status_label, False, False, 0)
         
         nav_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
         main_vbox.pack_start(nav_box, False, False, 10)
@@ -142,7 +433,7 @@ class VMLauncher(Gtk.Window):
 
         self.search_entry = Gtk.SearchEntry()
         self.search_entry.set_placeholder_text(_("Enter keyword..."))
-        self.search_entry.connect("search-changed", self._on_search_changed)
+        self.search_entry.connect("changed", self._on_search_text_changed)
         self.search_entry.connect("key-press-event", self._on_search_key_press)
         nav_box.pack_start(self.search_entry, True, True, 0)
 
@@ -150,7 +441,12 @@ class VMLauncher(Gtk.Window):
         combo_label.get_style_context().add_class("nav-label")
         nav_box.pack_start(combo_label, False, False, 10)
 
-        self.vm_combo_box = Gtk.ComboBoxText()
+        # Columns: UUID, name. Rows are diffed in place on refresh, never rebuilt.
+        self.vm_store = Gtk.ListStore(str, str)
+        self.vm_combo_box = Gtk.ComboBox.new_with_model(self.vm_store)
+        name_renderer = Gtk.CellRendererText()
+        self.vm_combo_box.pack_start(name_renderer, True)
+        self.vm_combo_box.add_attribute(name_renderer, "text", 1)
         self.combo_box_handler_id = self.vm_combo_box.connect("changed", self._on_combo_box_changed)
         nav_box.pack_start(self.vm_combo_box, True, True, 0)
 
@@ -158,19 +454,35 @@ class VMLauncher(Gtk.Window):
         self.vm_counter_label.get_style_context().add_class("counter")
         nav_box.pack_start(self.vm_counter_label, False, False, 0)
 
+        self.overview_button = Gtk.ToggleButton(label=_("Overview"))
+        self.overview_button.connect("toggled", self._on_overview_toggled)
+        nav_box.pack_start(self.overview_button, False, False, 0)
+
         # Search results popup
         self.search_results_window = Gtk.Window(type=Gtk.WindowType.POPUP)
         self.search_results_listbox = Gtk.ListBox()
         self.search_results_listbox.connect("row-activated", self._on_search_result_selected)
+        # A fixed pool of rows, relabelled for each query instead of destroyed and recreated
+        self.search_result_rows = []
+        for _i in range(SEARCH_RESULT_LIMIT):
+            row = Gtk.ListBoxRow(); row.set_no_show_all(True)
+            label = Gtk.Label(xalign=0); label.show(); row.add(label)
+            self.search_results_listbox.add(row); self.search_result_rows.append(row)
         scrolled_win = Gtk.ScrolledWindow()
         scrolled_win.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
         scrolled_win.add(self.search_results_listbox)
         self.search_results_window.add(scrolled_win)
         self.search_results_window.set_size_request(400, 200)
 
+        # The carousel shows one VM at a time; the overview grid all of them
+        self.view_stack = Gtk.Stack()
+        self.view_stack.set_transition_type(Gtk.StackTransitionType.CROSSFADE)
+        main_vbox.pack_start(self.view_stack, True, True, 0)
         carousel_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=20)
         carousel_box.set_valign(Gtk.Align.FILL)
-        main_vbox.pack_start(carousel_box, True, True, 0)
+        self.view_stack.add_named(carousel_box, "carousel")
+        self.overview = overview_grid.OverviewGrid(self._bind_overview_tile, self._load_overview_image, self._on_overview_tile_activated)
+        self.view_stack.add_named(self.overview, "overview")
 
         self.prev_button = Gtk.Button.new_from_icon_name("go-previous-symbolic", Gtk.IconSize.DIALOG)
         self.prev_button.set_valign(Gtk.Align.CENTER)
@@ -186,6 +498,7 @@ class VMLauncher(Gtk.Window):
         event_box.add(self.vm_image)
         event_box.connect("button-press-event", self._on_image_clicked)
         event_box.connect("realize", self._on_event_box_realize)
+        event_box.connect("size-allocate", self._on_image_size_allocate)
         self.main_stack.add_named(event_box, "image")
 
         self.viewer_container = Gtk.Box()
@@ -233,6 +546,10 @@ class VMLauncher(Gtk.Window):
         host_system_box.pack_start(self.volume_scale, False, False, 0)
         self.update_volume_slider()
 
+        self.group_action_button = Gtk.Button.new_with_label(_("Group Actions…"))
+        self.group_action_button.connect("clicked", self._on_group_action)
+        host_system_box.pack_start(self.group_action_button, False, False, 10)
+
         spacer = Gtk.Box(hexpand=True)
         host_system_box.pack_start(spacer, True, True, 0)
 
@@ -264,7 +581,7 @@ class VMLauncher(Gtk.Window):
             return False
 
         if keyval == Gdk.KEY_Down or keyval == Gdk.KEY_Up:
-            rows = self.search_results_listbox.get_children()
+            rows = self.search_result_rows[:len(self.search_result_uuids)]
             if not rows: return True
 
             selected_row = self.search_results_listbox.get_selected_row()
@@ -295,25 +612,27 @@ class VMLauncher(Gtk.Window):
 
         return False # Allow other keys (like text input) to be processed normally
 
-    def _on_search_changed(self, search_entry):
-        search_text = search_entry.get_text().lower()
-        if not search_text:
-            self.search_results_window.hide()
-            return
+    def _on_search_text_changed(self, search_entry):
+        if self.search_debounce_id is not None: GLib.source_remove(self.search_debounce_id)
+        self.search_debounce_id = GLib.timeout_add(SEARCH_DEBOUNCE_MS, self._on_search_debounced)
 
-        matching_domains = [d for d in self.vm_domains if search_text in d.name().lower()]
+    def _on_search_debounced(self):
+        self.search_debounce_id = None
+        self._on_search_changed(self.search_entry)
+        return False
 
-        for child in self.search_results_listbox.get_children():
-            child.destroy()
-        
-        if not matching_domains:
+    def _on_search_changed(self, search_entry):
+        search_text = search_entry.get_text()
+        results = self.search_index.search(search_text, SEARCH_RESULT_LIMIT) if search_text.strip() else []
+        self.search_result_uuids = [r.uuid for r in results]
+        self.search_results_listbox.unselect_all()
+        if not results:
             self.search_results_window.hide()
             return
 
-        for domain in matching_domains:
-            row = Gtk.ListBoxRow()
-            row.add(Gtk.Label(label=domain.name(), xalign=0))
-            self.search_results_listbox.add(row)
+        for i, row in enumerate(self.search_result_rows):
+            if i < len(results): row.get_child().set_text(results[i].name); row.show()
+            else: row.hide()
 
         x, y = self.search_entry.get_allocation().x, self.search_entry.get_allocation().y
         w, h = self.search_entry.get_allocated_width(), self.search_entry.get_allocated_height()
@@ -323,12 +642,11 @@ class VMLauncher(Gtk.Window):
 
     def _on_search_result_selected(self, listbox, row):
         if not row: return
-        selected_name = row.get_child().get_text()
-        for i, domain in enumerate(self.vm_domains):
-            if domain.name() == selected_name:
-                self.current_vm_index = i
-                self._update_display()
-                break
+        index = row.get_index()
+        if index < len(self.search_result_uuids) and self.search_result_uuids[index] in self.vm_index_by_uuid:
+            self.current_vm_index = self.vm_index_by_uuid[self.search_result_uuids[index]]
+            self.overview_button.set_active(False)
+            self._update_display()
         self.search_results_window.hide()
         self.search_entry.set_text("")
 
@@ -337,28 +655,91 @@ class VMLauncher(Gtk.Window):
         new_index = combo.get_active()
         if new_index != -1 and new_index != self.current_vm_index:
             self.current_vm_index = new_index
+            self.overview_button.set_active(False)
             self._update_display()
 
+    def _on_domain_change(self, change):
+        if change.kind in (domain_model.CHANGE_ADDED, domain_model.CHANGE_REMOVED):
+            self._refresh_vm_list(); return
+        if change.kind == domain_model.CHANGE_DEFINED and change.uuid in self.vm_index_by_uuid:
+            self._reindex_domain(self.vm_domains[self.vm_index_by_uuid[change.uuid]])
+        if change.kind == domain_model.CHANGE_DISCONNECTED:
+            print(f"Lost connection to libvirt host '{change.name}' (reason {change.detail})", file=sys.stderr)
+            self._update_connection_status(); self._refresh_vm_list(); return
+        if change.kind == domain_model.CHANGE_CONNECTED:
+            print(f"Reconnected to {change.detail}", file=sys.stderr)
+            self._update_connection_status(); self._refresh_vm_list(); return
+        if change.kind == domain_model.CHANGE_LIFECYCLE and not self.connections.is_name_active(change.name):
+            if change.name in self.open_viewers: self.open_viewers[change.name].close()
+            self._discard_viewer_session(change.name)
+            self.vms_in_view_mode.discard(change.name); self.thumbnails.discard(change.uuid)
+        if self.current_vm_index != -1 and self.vm_index_by_uuid.get(change.uuid) == self.current_vm_index: self._update_display()
+        elif self.overview_button.get_active() and change.uuid in self.vm_index_by_uuid: self.overview.refresh_index(self.vm_index_by_uuid[change.uuid])
+
+    def _refresh_vm_list_once(self):
+        self._refresh_vm_list(); return False
+
+    def _on_main_window_destroy(self, widget):
+        if self.bulk_run is not None: self.bulk_run.cancel()
+        self.audio.stop(); self.control_server.stop(); self.viewer_pool.clear(); self.service.stop(); self.tasks.shutdown(); Gtk.main_quit()
+
     def _refresh_vm_list(self):
-        for vm_name in list(self.open_viewers.keys()):
-            try:
-                domain = self.conn.lookupByName(vm_name)
-                if not domain.isActive(): GLib.idle_add(self.open_viewers[vm_name].close)
-            except libvirt.libvirtError:
-                GLib.idle_add(self.open_viewers[vm_name].close)
-        for vm_name in list(self.vms_in_view_mode):
-            try:
-                domain = self.conn.lookupByName(vm_name)
-                if not domain.isActive(): self.vms_in_view_mode.discard(vm_name)
-            except libvirt.libvirtError:
-                self.vms_in_view_mode.discard(vm_name)
+        self.tasks.submit(self._collect_vm_list, key="refresh", on_done=self._apply_vm_list, on_error=self._on_refresh_failed)
+        return True
+
+    def _collect_vm_list(self):
+        # Worker thread
+        return self.service.refresh()
+
+    def _on_refresh_failed(self, error):
+        print(f"Error refreshing VM list: {error}", file=sys.stderr); self.vm_domains = []; self.vm_index_by_uuid = {}; self.current_vm_index = -1
+        self._sync_vm_store()
+        self._update_display()
+
+    def _sync_vm_store(self):
+        wanted = [(d.UUIDString(), d.name()) for d in self.vm_domains]
+        wanted_uuids = {uuid for uuid, _ in wanted}
+        for i in reversed(range(len(self.vm_store))):
+            if self.vm_store[i][0] not in wanted_uuids: self.vm_store.remove(self.vm_store.get_iter(i))
+        for i, (uuid, name) in enumerate(wanted):
+            if i < len(self.vm_store) and self.vm_store[i][0] == uuid:
+                if self.vm_store[i][1] != name: self.vm_store[i][1] = name
+                continue
+            j = next((j for j in range(i + 1, len(self.vm_store)) if self.vm_store[j][0] == uuid), None)
+            if j is None: self.vm_store.insert(i, [uuid, name])
+            else:
+                self.vm_store.move_before(self.vm_store.get_iter(j), self.vm_store.get_iter(i))
+                if self.vm_store[i][1] != name: self.vm_store[i][1] = name
+
+    def _sync_search_index(self):
+        for domain in self.vm_domains: self._index_domain(domain)
+        self.search_index.retain(self.vm_index_by_uuid)
+
+    def _index_domain(self, domain):
+        uuid = domain.UUIDString(); descriptor = self.descriptors.peek(uuid)
+        if descriptor is None: self.search_index.update(uuid, domain.name())
+        else: self.search_index.update(uuid, domain.name(), descriptor.title, descriptor.description, descriptor.os_hints.values())
+
+    def _reindex_domain(self, domain):
+        # Title/description may have changed; re-read the descriptor off the main thread
+        self.tasks.submit(self.descriptors.get, domain, on_done=lambda descriptor: self._index_domain(domain))
+
+    def _apply_vm_list(self, domains, warm=False):
         try:
-            self.vm_domains = self.conn.listAllDomains(0)
+            current_uuid = self.vm_domains[self.current_vm_index].UUIDString() if self.current_vm_index != -1 else None
+            self.vm_domains = sorted(domains, key=lambda d: d.name().lower())
+            self.vm_index_by_uuid = {d.UUIDString(): i for i, d in enumerate(self.vm_domains)}
+            if current_uuid in self.vm_index_by_uuid: self.current_vm_index = self.vm_index_by_uuid[current_uuid]
+            for vm_name in list(self.open_viewers.keys()):
+                if not self.connections.is_name_active(vm_name): GLib.idle_add(self.open_viewers[vm_name].close)
+            for vm_name in list(self.vms_in_view_mode):
+                if not self.connections.is_name_active(vm_name): self.vms_in_view_mode.discard(vm_name)
+            for vm_name in self.viewer_pool.keys():
+                if not self.connections.is_name_active(vm_name): self._discard_viewer_session(vm_name)
             self.is_programmatic_combo_change = True
-            self.vm_combo_box.remove_all()
-            for domain in self.vm_domains:
-                self.vm_combo_box.append_text(domain.name())
+            self._sync_vm_store()
             self.is_programmatic_combo_change = False
+            self._sync_search_index()
             if self.last_vm_name_to_restore and self.vm_domains:
                 names = [d.name() for d in self.vm_domains]
                 if self.last_vm_name_to_restore in names: self.current_vm_index = names.index(self.last_vm_name_to_restore)
@@ -366,55 +747,162 @@ class VMLauncher(Gtk.Window):
             if not self.vm_domains: self.current_vm_index = -1
             elif self.current_vm_index == -1: self.current_vm_index = 0
             if self.current_vm_index >= len(self.vm_domains): self.current_vm_index = len(self.vm_domains) - 1 if self.vm_domains else -1
-            if self.is_first_load and self.vm_domains:
+            if self.is_first_load and self.vm_domains and not warm:
                 self.is_first_load = False
                 for domain in self.vm_domains:
-                    vm_type, _ = self.get_vm_type(domain.XMLDesc(0))
-                    if domain.isActive() and vm_type == 'virtual': self.vms_in_view_mode.add(domain.name())
+                    if self.connections.is_active(domain) and self.descriptors.cached(domain.UUIDString()).vm_type == 'virtual': self.vms_in_view_mode.add(domain.name())
         except libvirt.libvirtError as e:
-            print(f"Error refreshing VM list: {e}", file=sys.stderr); self.vm_domains = []; self.current_vm_index = -1
-        self._update_display(); return True
+            print(f"Error refreshing VM list: {e}", file=sys.stderr); self.vm_domains = []; self.vm_index_by_uuid = {}; self.current_vm_index = -1
+            self._sync_vm_store()
+        if not warm:
+            if self.is_warm_start: self.is_warm_start = False
+            self._save_warm_start()
+        self._update_display()
+        if not warm and self.startup_marks is not None:
+            self._mark_startup("reconciled"); self._report_startup()
 
     def _update_display(self):
         has_vms = bool(self.vm_domains)
-        for w in [self.prev_button, self.next_button, self.vm_control_box, self.search_entry, self.vm_combo_box]: w.set_sensitive(has_vms)
+        for w in [self.prev_button, self.next_button, self.vm_control_box, self.search_entry, self.vm_combo_box, self.group_action_button, self.overview_button]: w.set_sensitive(has_vms)
+        if self.overview_button.get_active(): self.overview.set_count(len(self.vm_domains))
         if not has_vms:
-            self.vm_name_label.set_text(_("No VMs Found")); self.vm_counter_label.set_text(""); self.vm_image.set_from_file(os.path.join(IMAGE_DIR, PLACEHOLDER_IMAGE)); return
+            self.vm_name_label.set_text(_("No VMs Found")); self.vm_counter_label.set_text(""); self.vm_info_label.set_text(""); self.resource_box.hide(); self._set_carousel_image(os.path.join(IMAGE_DIR, PLACEHOLDER_IMAGE)); return
         
-        domain = self.vm_domains[self.current_vm_index]; vm_name = domain.name(); is_active = domain.isActive()
-        xml_desc = domain.XMLDesc(0); vm_type, graphics = self.get_vm_type(xml_desc); is_passthrough = (vm_type == 'passthrough')
+        domain = self.vm_domains[self.current_vm_index]; record = self.connections.record_for(domain); vm_name = record.name; is_active = record.active
+        if self._is_offline(domain): self.vm_control_box.set_sensitive(False)
+        descriptor = self._descriptor_for(domain); graphics = descriptor.graphics; is_passthrough = (descriptor.vm_type == 'passthrough')
         
-        escaped_name = GLib.markup_escape_text(vm_name)
+        host_label = domain_model.host_label(record.uuid)
+        escaped_name = GLib.markup_escape_text(connection_manager.unqualify(vm_name, host_label))
+        if host_label: escaped_name += f" <span foreground='#9E9E9E' size='small'>[{GLib.markup_escape_text(host_label)}]</span>"
+        conflicts = self.service.passthrough_conflicts(domain) if is_passthrough else []
+        if conflicts: escaped_name += f" <span foreground='#dc3545' weight='bold'>{_('[Conflict]')}</span>"
         if is_passthrough: self.vm_name_label.set_markup(f"<span foreground='#FFA500' weight='bold'>{_('[GPU Passthrough]')} </span>{escaped_name}")
         else: self.vm_name_label.set_markup(escaped_name)
+        self.vm_name_label.set_tooltip_text("\n".join(conflicts) or None); self.start_button.set_tooltip_text("\n".join(conflicts) or None)
         total_vms = len(self.vm_domains); self.vm_counter_label.set_text(f"({self.current_vm_index + 1} / {total_vms})")
+        self.vm_info_label.set_text(self._format_vm_info(record))
+        launch_plan = self.service.launch_plans.get(record.uuid) if record.active else None
+        self.vm_info_label.set_tooltip_text(launch_plan.describe() if launch_plan is not None else None)
         
         self.is_programmatic_combo_change = True
         self.vm_combo_box.set_active(self.current_vm_index)
         self.is_programmatic_combo_change = False
+        action_pending = self.tasks.is_running(domain.UUIDString()) or (self.bulk_run is not None and self.bulk_run.is_pending(domain.UUIDString()))
 
         should_show_embedded = vm_name in self.vms_in_view_mode and is_active and not is_passthrough
         if should_show_embedded:
             if self.main_stack.get_visible_child_name() == "image" or self.active_embedded_vm_name != vm_name: self._create_embedded_viewer(domain, graphics); self.active_embedded_vm_name = vm_name
             self.main_stack.set_visible_child_name("viewer")
         else:
-            self.main_stack.set_visible_child_name("image"); self.vm_image.set_from_file(self._get_image_for_vm(vm_name))
+            self.main_stack.set_visible_child_name("image")
+            thumbnail = self.thumbnails.get(record.uuid) if self.live_thumbnails and is_active and not is_passthrough else None
+            if thumbnail is not None: self._set_carousel_pixbuf(thumbnail)
+            else: self._set_carousel_image(self._get_image_for_vm(vm_name))
         
         self.close_view_button.set_visible(should_show_embedded); self.start_button.set_visible(not should_show_embedded)
         self.shutdown_button.set_visible(not is_passthrough); self.reboot_button.set_visible(not is_passthrough); self.destroy_button.set_visible(not is_passthrough); self.view_button.set_visible(not is_passthrough)
         if is_passthrough: self.start_button.set_label(_("Start (Passthrough)"))
         else: self.start_button.set_label(_("Start"))
-        self.start_button.set_sensitive(not is_active); self.shutdown_button.set_sensitive(is_active); self.reboot_button.set_sensitive(is_active); self.destroy_button.set_sensitive(is_active)
+        self.start_button.set_sensitive(not is_active and not action_pending); self.shutdown_button.set_sensitive(is_active and not action_pending); self.reboot_button.set_sensitive(is_active and not action_pending); self.destroy_button.set_sensitive(is_active and not action_pending)
         self.view_button.set_sensitive(is_active and not is_passthrough and graphics is not None)
+        self._update_resource_panel()
+        self._schedule_prewarm(domain, is_active)
+
+    def _schedule_prewarm(self, domain, is_active):
+        # The VM restored from last_vm_name at startup is the first one shown, so it is the first prewarmed
+        uuid = domain.UUIDString()
+        if uuid == self.prewarm_uuid: return
+        if self.prewarm_id is not None: GLib.source_remove(self.prewarm_id); self.prewarm_id = None
+        # Warm-start entries are offline until their host answers; the same VM is scheduled once it does
+        if self._is_offline(domain): return
+        self.prewarm_uuid = uuid
+        if not is_active: self.prewarm_id = GLib.timeout_add(PREWARM_DELAY_MS, self._on_prewarm_due, domain)
+
+    def _on_prewarm_due(self, domain):
+        self.prewarm_id = None
+        if not self.connections.is_active(domain): self.service.prewarm(domain)
+        return False
+
+    def _is_offline(self, domain):
+        # Warm-start entries and VMs of disconnected hosts are painted from the cached model; no RPCs possible
+        return isinstance(domain, domain_model.CachedDomain)
+
+    def _descriptor_for(self, domain):
+        # Never block the UI on XMLDesc: serve the cached descriptor and re-read stale ones in the background
+        uuid = domain.UUIDString()
+        if self.descriptors.is_stale(uuid) and not self._is_offline(domain):
+            self.tasks.submit(self.descriptors.get, domain, key=('descriptor', uuid), on_done=lambda descriptor: self._on_descriptor_loaded(uuid),
+                              on_error=lambda e: print(f"Error reading XML for {domain.name()}: {e}", file=sys.stderr))
+        return self.descriptors.cached(uuid)
+
+    def _on_descriptor_loaded(self, uuid):
+        if self.current_vm_index != -1 and self.vm_index_by_uuid.get(uuid) == self.current_vm_index: self._update_display()
+
+    def _update_connection_status(self):
+        hosts = self.connections.disconnected_hosts
+        if hosts: self.connection_status_label.set_text(_("Reconnecting to {}…").format(", ".join(host.uri for host in hosts))); self.connection_status_label.show()
+        else: self.connection_status_label.hide()
+
+    # --- Resource monitor ---
+
+    def _on_resource_tick(self):
+        self.tasks.submit(self.resources.sample, key="resource-sample", on_done=lambda result: self._update_resource_panel())
+        # Nobody reads the panel while a fullscreen viewer covers the launcher
+        hidden = any(viewer.is_fullscreen for viewer in self.open_viewers.values())
+        GLib.timeout_add_seconds(resource_monitor.HIDDEN_SAMPLE_INTERVAL_SECONDS if hidden else resource_monitor.SAMPLE_INTERVAL_SECONDS, self._on_resource_tick)
+        return False
+
+    def _update_resource_panel(self):
+        latest = self.resources.latest(self.vm_domains[self.current_vm_index].UUIDString()) if self.current_vm_index != -1 and self.vm_domains else None
+        if latest is None: self.resource_box.hide(); return
+        balloon_kib = latest[resource_monitor.MEMORY_BALLOON]
+        texts = {resource_monitor.CPU: _("CPU {:.0f}%").format(latest[resource_monitor.CPU]),
+                 resource_monitor.MEMORY_RSS: _("RAM {:.1f} / {:.1f} GiB").format(latest[resource_monitor.MEMORY_RSS] / (1024 * 1024), balloon_kib / (1024 * 1024)) if balloon_kib else _("RAM {:.1f} GiB").format(latest[resource_monitor.MEMORY_RSS] / (1024 * 1024)),
+                 resource_monitor.DISK: _("Disk {}").format(self._format_rate(latest[resource_monitor.DISK])),
+                 resource_monitor.NETWORK: _("Net {}").format(self._format_rate(latest[resource_monitor.NETWORK]))}
+        for metric, (label, sparkline) in self.resource_labels.items(): label.set_text(texts[metric]); sparkline.queue_draw()
+        self.resource_box.show()
+
+    def _format_rate(self, bytes_per_second):
+        for unit, size in (("GiB/s", 1024 ** 3), ("MiB/s", 1024 ** 2), ("KiB/s", 1024)):
+            if bytes_per_second >= size: return f"{bytes_per_second / size:.1f} {unit}"
+        return f"{bytes_per_second:.0f} B/s"
+
+    def _on_sparkline_draw(self, area, cr, metric):
+        if self.current_vm_index == -1 or not self.vm_domains: return False
+        values = self.resources.series(self.vm_domains[self.current_vm_index].UUIDString(), metric)
+        if len(values) < 2: return False
+        width, height = area.get_allocated_width(), area.get_allocated_height()
+        # CPU has a fixed scale; the others scale to their own peak. The newest sample is at the right edge.
+        peak = 100.0 if metric == resource_monitor.CPU else max(max(values), 1.0)
+        step = width / (resource_monitor.HISTORY_SAMPLES - 1); x0 = width - step * (len(values) - 1)
+        cr.set_source_rgb(0.30, 0.69, 0.31); cr.set_line_width(1.5)
+        for i, value in enumerate(values):
+            x = x0 + i * step; y = height - 1 - (height - 2) * min(value, peak) / peak
+            if i == 0: cr.move_to(x, y)
+            else: cr.line_to(x, y)
+        cr.stroke()
+        return False
+
+    def _format_vm_info(self, record):
+        parts = []
+        if record.vcpus: parts.append(_("{} vCPU").format(record.vcpus))
+        memory_kib = record.memory_kib or record.max_memory_kib
+        if memory_kib: parts.append(_("{:.1f} GiB RAM").format(memory_kib / (1024 * 1024)))
+        if record.disks: parts.append(_("{} disk(s), {:.0f} GiB").format(len(record.disks), sum(d[2] for d in record.disks) / (1024 ** 3)))
+        launch_plan = self.service.launch_plans.get(record.uuid) if record.active else None
+        if launch_plan is not None and launch_plan.vcpu_pins: parts.append(_("pinned to CPUs {}").format(launch_profiles.format_cpulist(launch_plan.vcpu_pins)))
+        return "  ·  ".join(parts)
 
     def _on_vm_view(self, widget):
-        if self.current_vm_index == -1: return
+        if self.current_vm_index == -1 or self._is_offline(self.vm_domains[self.current_vm_index]): return
         domain = self.vm_domains[self.current_vm_index]; vm_name = domain.name()
         if vm_name in self.vms_in_view_mode: self.restore_embedded_view_after_fullscreen = vm_name; self._on_close_view_clicked(None)
         if vm_name in self.open_viewers: self.open_viewers[vm_name].present(); return
-        if not domain.isActive(): self.show_error_dialog(_("VM {} is not running.").format(vm_name)); return
-        xml_desc = domain.XMLDesc(0); vm_type, graphics = self.get_vm_type(xml_desc)
-        if vm_type == 'virtual' and graphics: viewer = VMViewerWindow(vm_name, graphics); self.open_viewers[vm_name] = viewer; viewer.connect("destroy", self._on_viewer_destroyed, vm_name); viewer.show_all()
+        if not self.connections.is_active(domain): self.show_error_dialog(_("VM {} is not running.").format(vm_name)); return
+        descriptor = self._descriptor_for(domain); graphics = descriptor.graphics
+        if descriptor.vm_type == 'virtual' and graphics: viewer = VMViewerWindow(vm_name, graphics, self.viewer_pool, domain, self.connections.host_for(domain).remote_host); self.open_viewers[vm_name] = viewer; viewer.connect("destroy", self._on_viewer_destroyed, vm_name); viewer.show_all()
         else: self.show_error_dialog(_("VM {} has no graphical display to view.").format(vm_name))
 
     def _on_viewer_destroyed(self, widget, vm_name):
@@ -422,47 +910,124 @@ class VMLauncher(Gtk.Window):
         if vm_name == self.restore_embedded_view_after_fullscreen: self.restore_embedded_view_after_fullscreen = None; self.vms_in_view_mode.add(vm_name); self._update_display()
 
     def _on_close_view_clicked(self, widget):
-        if self.current_vm_index == -1: return
+        if self.current_vm_index == -1 or self.is_warm_start: return
         vm_name = self.vm_domains[self.current_vm_index].name()
         self.vms_in_view_mode.discard(vm_name)
         if self.active_embedded_vm_name == vm_name: self._destroy_embedded_viewer()
         self._update_display()
 
     def _destroy_embedded_viewer(self):
-        if self.embedded_display_widget: self.embedded_display_widget.destroy()
+        # The session stays connected in the pool so reopening or going fullscreen is instant
+        if self.active_embedded_vm_name: self.viewer_pool.release(self.active_embedded_vm_name, "embedded")
         self.embedded_display_widget = None; self.active_embedded_vm_name = None
 
     def _create_embedded_viewer(self, domain, graphics):
-        if self.embedded_display_widget: self.embedded_display_widget.destroy()
-        if graphics.get('type') == 'spice':
-            session = SpiceClientGLib.Session(); session.set_property('host', graphics.get('listen', '127.0.0.1'))
-            port = graphics.get('port');
-            if port: session.set_property('port', port)
-            tls_port = graphics.get('tlsPort');
-            if tls_port: session.set_property('tls-port', tls_port)
-            self.embedded_display_widget = SpiceClientGtk.Display(session=session); session.connect()
-        elif graphics.get('type') == 'vnc':
-            self.embedded_display_widget = GtkVnc.Display(); self.embedded_display_widget.open_host(graphics.get('listen', '127.0.0.1'), graphics.get('port'))
+        vm_name = domain.name()
+        if self.active_embedded_vm_name and self.active_embedded_vm_name != vm_name: self.viewer_pool.release(self.active_embedded_vm_name, "embedded")
+        self.embedded_display_widget = self.viewer_pool.acquire(vm_name, graphics, "embedded", domain, self.connections.host_for(domain).remote_host)
         if self.embedded_display_widget:
-            for child in self.viewer_container.get_children(): child.destroy()
+            for child in self.viewer_container.get_children(): self.viewer_container.remove(child)
             self.viewer_container.pack_start(self.embedded_display_widget, True, True, 0); self.embedded_display_widget.show()
 
+    def _discard_viewer_session(self, vm_name):
+        # The guest is gone: drop its connection instead of keeping it warm
+        self.viewer_pool.discard(vm_name)
+        if vm_name == self.active_embedded_vm_name: self.embedded_display_widget = None; self.active_embedded_vm_name = None
+
     def _on_image_clicked(self, widget, event):
-        if self.current_vm_index == -1: return
+        if self.current_vm_index == -1 or self._is_offline(self.vm_domains[self.current_vm_index]): return
         domain = self.vm_domains[self.current_vm_index]
-        vm_name = domain.name(); xml_desc = domain.XMLDesc(0); vm_type, _ = self.get_vm_type(xml_desc)
-        if vm_type == 'passthrough': self._on_vm_action(widget, "start"); return
-        if domain.isActive(): self.vms_in_view_mode.add(vm_name)
+        vm_name = domain.name()
+        if self._descriptor_for(domain).vm_type == 'passthrough': self._on_vm_action(widget, "start"); return
+        if self.connections.is_active(domain): self.vms_in_view_mode.add(vm_name)
         else: self.vms_in_view_mode.add(vm_name); self._on_vm_action(widget, "start")
         self._update_display()
 
     def _get_image_for_vm(self, vm_name):
-        vm_name_lower = vm_name.lower()
+        path = self.image_paths.get(vm_name)
+        if path is not None: return path
+        vm_name_lower = vm_name.lower(); path = os.path.join(IMAGE_DIR, PLACEHOLDER_IMAGE)
         for keyword, filename in IMAGE_MAPPINGS.items():
-            if keyword in vm_name_lower:
-                path = os.path.join(IMAGE_DIR, filename)
-                if os.path.exists(path): return path
-        return os.path.join(IMAGE_DIR, PLACEHOLDER_IMAGE)
+            if keyword in vm_name_lower and os.path.exists(os.path.join(IMAGE_DIR, filename)):
+                path = os.path.join(IMAGE_DIR, filename); break
+        self.image_paths[vm_name] = path
+        return path
+
+    def _set_carousel_image(self, path):
+        pixbuf = self.pixbufs.get(path, *self.image_size)
+        if pixbuf is None: self.vm_image.set_from_file(path)
+        else: self._set_carousel_pixbuf(pixbuf)
+
+    def _set_carousel_pixbuf(self, pixbuf):
+        if self.vm_image.get_pixbuf() is not pixbuf: self.vm_image.set_from_pixbuf(pixbuf)
+
+    def _on_image_size_allocate(self, widget, allocation):
+        size = image_cache.bucket_size(allocation.width, allocation.height)
+        if size != self.image_size:
+            self.image_size = size
+            GLib.idle_add(self._refresh_carousel_image)
+
+    def _refresh_carousel_image(self):
+        if self.main_stack.get_visible_child_name() == "image": self._update_display()
+        return False
+
+    def _on_thumbnail_tick(self):
+        if not self.vm_domains or not self.is_visible(): return True
+        if self.overview_button.get_active(): indexes = self.overview.visible_range()
+        elif self.main_stack.get_visible_child_name() == "image":
+            # The current VM first, then its carousel neighbours
+            indexes = [(self.current_vm_index + offset) % len(self.vm_domains) for offset in (0, 1, -1)]
+        else: return True
+        for index in indexes:
+            domain = self.vm_domains[index]
+            descriptor = self.descriptors.peek(domain.UUIDString())
+            if self._is_offline(domain) or not self.connections.is_active(domain) or descriptor is None or descriptor.vm_type != 'virtual': continue
+            self.thumbnails.request(domain, self.image_size[0], self.image_size[1], THUMBNAIL_INTERVAL_SECONDS, self._on_thumbnail_ready)
+        return True
+
+    def _on_thumbnail_ready(self, uuid):
+        if self.overview_button.get_active() and uuid in self.vm_index_by_uuid: self.overview.refresh_index(self.vm_index_by_uuid[uuid])
+        elif self.current_vm_index != -1 and self.vm_index_by_uuid.get(uuid) == self.current_vm_index: self._update_display()
+
+    # --- Overview grid ---
+
+    def _on_overview_toggled(self, button):
+        if button.get_active():
+            self.search_results_window.hide()
+            self.view_stack.set_visible_child_name("overview")
+            self.overview.set_count(len(self.vm_domains)); self.overview.scroll_to(self.current_vm_index)
+        else:
+            self.view_stack.set_visible_child_name("carousel")
+
+    def _bind_overview_tile(self, tile, index):
+        # Cached model only: binding runs for every visible tile on each scroll step
+        domain = self.vm_domains[index]; uuid = domain.UUIDString(); record = self.connections.record_for(domain)
+        descriptor = self.descriptors.peek(uuid)
+        if self._is_offline(domain): badge, badge_class = _("Offline"), "badge-offline"
+        elif self.tasks.is_running(uuid) or (self.bulk_run is not None and self.bulk_run.is_pending(uuid)): badge, badge_class = _("Working…"), "badge-busy"
+        elif record.active: badge, badge_class = _("Running"), "badge-running"
+        else: badge, badge_class = _("Shut off"), "badge-stopped"
+        if descriptor is not None and descriptor.vm_type == 'passthrough':
+            badge = _("GPU") + " · " + badge
+            if self.service.passthrough_conflicts(domain): badge, badge_class = _("GPU conflict"), "badge-conflict"
+        tile.set_content(record.name, badge, badge_class)
+        thumbnail = self.thumbnails.get(uuid) if self.live_thumbnails and record.active else None
+        return (uuid, thumbnail)
+
+    def _load_overview_image(self, index, width, height):
+        domain = self.vm_domains[index]; uuid = domain.UUIDString()
+        thumbnail = self.thumbnails.get(uuid) if self.live_thumbnails and self.connections.is_active(domain) else None
+        if thumbnail is not None: return image_cache.scale_to_fit(thumbnail, width, height)
+        return self.pixbufs.get(self._get_image_for_vm(domain.name()), width, height)
+
+    def _on_overview_tile_activated(self, index, state):
+        if index >= len(self.vm_domains): return
+        self.current_vm_index = index
+        self.overview_button.set_active(False)
+        # Ctrl+click opens the fullscreen viewer, a plain click behaves like clicking the carousel image
+        self._update_display()
+        if state & Gdk.ModifierType.CONTROL_MASK and self.connections.is_active(self.vm_domains[index]): self._on_vm_view(None)
+        else: self._on_image_clicked(None, None)
 
     def _on_next_vm_clicked(self, widget):
         if not self.vm_domains: return
@@ -476,36 +1041,108 @@ class VMLauncher(Gtk.Window):
         cursor = Gdk.Cursor.new_for_display(Gdk.Display.get_default(), Gdk.CursorType.HAND2); widget.get_window().set_cursor(cursor)
 
     def _on_vm_action(self, widget, action):
-        if self.current_vm_index == -1: return
-        domain = self.vm_domains[self.current_vm_index]; xml_desc = domain.XMLDesc(0); vm_type, _ = self.get_vm_type(xml_desc)
-        if action == "start" and vm_type == "passthrough": self._start_passthrough_vm(domain); return
-        try:
-            if action == "start": domain.create()
-            elif action == "shutdown": domain.shutdown()
-            elif action == "reboot": domain.reboot()
-            elif action == "destroy": domain.destroy()
-        except libvirt.libvirtError as e: self.show_error_dialog(_("Error on action '{}' for {}: {}").format(action, domain.name(), e))
-        GLib.timeout_add(500, self._refresh_vm_list)
+        if self.current_vm_index == -1 or self._is_offline(self.vm_domains[self.current_vm_index]): return
+        domain = self.vm_domains[self.current_vm_index]
+        if action == "start" and self._descriptor_for(domain).vm_type == "passthrough": self._start_passthrough_vm(domain); return
+        # Keyed by UUID so a double-click cannot queue a second create()/shutdown() for the same VM
+        if self.tasks.submit(self.service.run_action, domain, action, key=domain.UUIDString(),
+                             on_done=self._on_vm_action_done, on_error=lambda e: self._on_vm_action_failed(domain, action, e)):
+            self._update_display()
+
+    def _on_vm_action_done(self, result):
+        if self.connections.events_enabled: self._update_display()
+        else: GLib.timeout_add(500, self._refresh_vm_list_once)
+
+    def _on_vm_action_failed(self, domain, action, error):
+        self._on_vm_action_done(None)
+        if isinstance(error, (libvirt.libvirtError, launcher_service.ServiceError)): self.show_error_dialog(_("Error on action '{}' for {}: {}").format(action, domain.name(), error))
+        else: print(f"Unexpected error on action '{action}' for {domain.name()}: {error}", file=sys.stderr)
 
     def _start_passthrough_vm(self, domain):
+        if not self.service.can_start_passthrough(domain):
+            self.show_error_dialog(_("Passthrough VM {} can only be started on its own host.").format(domain.name())); return
+        # Rejected before the revival supervisor takes the display manager down; the worker re-checks against fresh sysfs
+        conflicts = self.service.passthrough_conflicts(domain)
+        if conflicts: self.show_error_dialog(_("Passthrough VM {} cannot start:\n{}").format(domain.name(), "\n".join(conflicts))); return
         self._save_settings()
-        try:
-            script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'revival_script.py')
-            subprocess.Popen([sys.executable, script_path, domain.name()], preexec_fn=os.setpgrp); time.sleep(1); domain.create()
-        except (libvirt.libvirtError, FileNotFoundError) as e: self.show_error_dialog(_("Error starting passthrough VM {}: {}").format(domain.name(), e))
-
-    def get_vm_type(self, xml_desc):
-        root = ET.fromstring(xml_desc); devices = root.find('devices')
-        for hostdev in devices.findall('hostdev'):
-            if hostdev.get('type') == 'pci':
-                source = hostdev.find('source')
-                if source is not None and source.find('address') is not None: return 'passthrough', None
-        graphics = devices.find('graphics');
-        if graphics is not None: return 'virtual', graphics.attrib
-        return 'headless', None
+        if self.tasks.submit(self.service.start_passthrough, domain, key=domain.UUIDString(), on_done=self._on_vm_action_done,
+                             on_error=lambda e: self._on_passthrough_failed(domain, e)):
+            self._update_display()
+
+    def _on_passthrough_failed(self, domain, error):
+        self._on_vm_action_done(None)
+        if isinstance(error, (libvirt.libvirtError, launcher_service.ServiceError, FileNotFoundError, subprocess.SubprocessError)): self.show_error_dialog(_("Error starting passthrough VM {}: {}").format(domain.name(), error))
+        else: print(f"Unexpected error starting passthrough VM {domain.name()}: {error}", file=sys.stderr)
+
+    # --- Group actions ---
+
+    def _on_group_action(self, widget):
+        if self.bulk_run is not None and self.bulk_run.pending: self.show_error_dialog(_("A group action is still running.")); return
+        BulkActionDialog(self).show_all()
+
+    def _bulk_skip_reason(self, domain, action):
+        if self.tasks.is_running(domain.UUIDString()): return "Action already pending"
+        # Runs on the GTK thread; the worker re-checks each VM against its XML before acting
+        return self.service.skip_reason(domain, action, fresh=False)
+
+    def _start_bulk(self, action, domains, on_progress, on_finished):
+        self.bulk_run = self.service.bulk_run(action, domains, GLib.idle_add, on_progress, self._bulk_skip_reason)
+        self.bulk_run.start(on_finished)
+        self._update_display()
+        return self.bulk_run
+
+    def _on_bulk_progress(self, result):
+        if result.state in bulk_actions.FINISHED_STATES and self.vm_index_by_uuid.get(result.uuid) == self.current_vm_index: self._on_vm_action_done(None)
+
+    def _on_bulk_finished(self, bulk_run):
+        failed = [r for r in bulk_run.results if r.state == bulk_actions.FAILED]
+        for result in failed: print(f"Group action '{bulk_run.action}' failed for {result.name}: {result.error}", file=sys.stderr)
+        if bulk_run is self.bulk_run: self.bulk_run = None
+        self._on_vm_action_done(None)
+
+    # --- Control API handlers (run on the GTK thread via control_api.call_in_ui or call_as_task) ---
+
+    def _api_select(self, domain):
+        return control_api.call_in_ui(GLib.idle_add, self._select_domain, domain)
+
+    def _api_view(self, domain):
+        return control_api.call_in_ui(GLib.idle_add, self._view_domain, domain)
+
+    def _api_action(self, domain, action):
+        return control_api.call_as_task(GLib.idle_add, lambda on_done, on_error: self._submit_api_action(domain, action, on_done, on_error))
+
+    def _submit_api_action(self, domain, action, on_done, on_error):
+        # Same key as the buttons: the carousel shows "Working…" and a click cannot queue a second create()
+        uuid = domain.UUIDString()
+        if self.bulk_run is not None and self.bulk_run.is_pending(uuid): raise launcher_service.ServiceError(f"A group action is still running for {domain.name()}")
+        if not self.tasks.submit(self.service.run_action, domain, action, key=uuid,
+                                 on_done=lambda result: (self._on_vm_action_done(result), on_done(result)),
+                                 on_error=lambda error: (self._on_vm_action_done(None), on_error(error))):
+            raise launcher_service.ServiceError(f"An action on {domain.name()} is already running")
+        self._update_display()
+
+    def _api_refresh(self):
+        return control_api.call_as_task(GLib.idle_add, self._submit_api_refresh)
+
+    def _submit_api_refresh(self, on_done, on_error):
+        # Queued behind a refresh in flight rather than refused: the caller asked for a list read after its request
+        if not self.tasks.submit(self._collect_vm_list, key="refresh", on_done=lambda domains: (self._apply_vm_list(domains), on_done(None)),
+                                 on_error=lambda error: (self._on_refresh_failed(error), on_error(error))):
+            GLib.timeout_add(API_REFRESH_RETRY_MS, self._submit_api_refresh, on_done, on_error)
+        return False
+
+    def _select_domain(self, domain):
+        index = self.vm_index_by_uuid.get(domain.UUIDString())
+        if index is None: raise launcher_service.ServiceError(f"VM {domain.name()} is not in the carousel yet")
+        self.current_vm_index = index; self._update_display(); self.present()
+
+    def _view_domain(self, domain):
+        self._select_domain(domain)
+        if not self.connections.is_active(domain): raise launcher_service.ServiceError(f"VM {domain.name()} is not running")
+        self._on_vm_view(None)
 
     def apply_css(self):
-        css_provider = Gtk.CssProvider(); css = b".nav-label { font-weight: bold; font-size: 16px; } .header { font-size: 32px; font-weight: bold; } .counter { font-size: 18px; font-style: italic; color: #888; } .destructive-action { background-color: #dc3545; color: white; }"; css_provider.load_from_data(css); Gtk.StyleContext.add_provider_for_screen(Gdk.Screen.get_default(), css_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
+        css_provider = Gtk.CssProvider(); css = b".nav-label { font-weight: bold; font-size: 16px; } .header { font-size: 32px; font-weight: bold; } .counter { font-size: 18px; font-style: italic; color: #888; } .destructive-action { background-color: #dc3545; color: white; } .status-warning { font-size: 16px; color: #FFA500; } .bulk-failed { color: #dc3545; } .tile-badge { font-size: 12px; border-radius: 4px; padding: 1px 6px; color: white; } .badge-running { background-color: #28a745; } .badge-stopped { background-color: #6c757d; } .badge-offline { background-color: #FFA500; } .badge-busy { background-color: #17a2b8; } .badge-conflict { background-color: #dc3545; }"; css_provider.load_from_data(css); Gtk.StyleContext.add_provider_for_screen(Gdk.Screen.get_default(), css_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
 
     def _save_settings(self):
         try:
@@ -522,85 +1159,59 @@ class VMLauncher(Gtk.Window):
             self.settings.read(CONFIG_FILE)
             if 'VMLauncher' in self.settings:
                 s = self.settings['VMLauncher']; self.silent_mode_checkbox.set_active(s.getboolean('silent_mode', False)); self.last_vm_name_to_restore = s.get('last_vm_name', None)
+                self.live_thumbnails = s.getboolean('live_thumbnails', False)
+                self.viewer_pool.capacity = max(0, s.getint('warm_viewers', viewers.POOL_CAPACITY))
+            self.hosts = launcher_service.hosts_from_settings(self.settings)
+            self.bulk_options = bulk_actions.options_from_settings(self.settings)
+            self.shutdown_options = host_shutdown.options_from_settings(self.settings)
+            self.launch_options = launch_profiles.options_from_settings(self.settings)
+            self.prewarm_options = prewarm.options_from_settings(self.settings)
         except Exception as e: print(f"Error loading settings: {e}", file=sys.stderr)
 
     def on_silent_toggle(self, widget): self._save_settings()
 
     def on_volume_changed(self, scale):
-        value = int(scale.get_value())
-        try:
-            # First, get the name of the default sink for robustness
-            my_env = os.environ.copy()
-            my_env["LANG"] = "C"
-            result = subprocess.run(["pactl", "info"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, env=my_env)
-            if result.returncode == 0:
-                default_sink_name = ""
-                for line in result.stdout.splitlines():
-                    if line.startswith("Default Sink: "):
-                        default_sink_name = line.split("Default Sink: ")[1]
-                        break
-                if default_sink_name:
-                    # Now, set the volume for that specific sink
-                    subprocess.run(["pactl", "set-sink-volume", default_sink_name, f"{value}%"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        except FileNotFoundError:
-            print("pactl command not found. Please ensure pulseaudio-utils is installed.", file=sys.stderr)
-        except Exception as e:
-            print(f"Error changing volume with pactl: {e}", file=sys.stderr)
+        if self.is_programmatic_volume_change: return
+        self.audio.set_volume(int(scale.get_value()))
 
     def update_volume_slider(self):
-        try:
-            # Get the default sink name
-            my_env = os.environ.copy()
-            my_env["LANG"] = "C"
-            result = subprocess.run(["pactl", "info"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, env=my_env)
-            if result.returncode != 0:
-                self.volume_scale.set_sensitive(False)
-                return
-
-            default_sink_name = ""
-            for line in result.stdout.splitlines():
-                if line.startswith("Default Sink: "):
-                    default_sink_name = line.split("Default Sink: ")[1]
-                    break
-
-            if not default_sink_name:
-                self.volume_scale.set_sensitive(False)
-                return
-
-            # Get the volume for the default sink
-            result = subprocess.run(["pactl", "list", "sinks"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, env=my_env)
-            if result.returncode != 0:
-                self.volume_scale.set_sensitive(False)
-                return
-
-            output = result.stdout
-            sinks = output.split('Sink #')
-            for sink in sinks:
-                if default_sink_name in sink:
-                    for line in sink.split('\n'):
-                        if 'Volume:' in line and '%' in line:
-                            percent_str = line.split('%')[0].split('/')[-1].strip()
-                            if percent_str.isdigit():
-                                self.volume_scale.set_value(int(percent_str))
-                                return # Found it, exit
-            # If we reach here, we didn't find the volume for the default sink
-            self.volume_scale.set_sensitive(False)
-
-        except Exception as e:
-            print(f"Could not get initial volume with pactl: {e}", file=sys.stderr)
-            self.volume_scale.set_sensitive(False)
+        self.audio.start()
+
+    def _on_audio_volume(self, value):
+        if value is None: self.volume_scale.set_sensitive(False); return
+        self.volume_scale.set_sensitive(True)
+        self.is_programmatic_volume_change = True
+        self.volume_scale.set_value(value)
+        self.is_programmatic_volume_change = False
 
     def on_host_shutdown(self, widget):
-        if self.silent_mode_checkbox.get_active(): os.system("systemctl poweroff"); return
+        if self.silent_mode_checkbox.get_active(): self._shut_down_guests_then("poweroff"); return
         dialog = Gtk.MessageDialog(transient_for=self, flags=0, message_type=Gtk.MessageType.WARNING, buttons=Gtk.ButtonsType.OK_CANCEL, text=_("Confirm Host Shutdown")); dialog.format_secondary_text(_("Are you sure you want to shut down the physical machine?"));
-        if dialog.run() == Gtk.ResponseType.OK: os.system("systemctl poweroff")
+        confirmed = dialog.run() == Gtk.ResponseType.OK
         dialog.destroy()
+        if confirmed: self._shut_down_guests_then("poweroff")
 
     def on_host_reboot(self, widget):
-        if self.silent_mode_checkbox.get_active(): os.system("systemctl reboot"); return
+        if self.silent_mode_checkbox.get_active(): self._shut_down_guests_then("reboot"); return
         dialog = Gtk.MessageDialog(transient_for=self, flags=0, message_type=Gtk.MessageType.WARNING, buttons=Gtk.ButtonsType.OK_CANCEL, text=_("Confirm Host Reboot")); dialog.format_secondary_text(_("Are you sure you want to reboot the physical machine?"));
-        if dialog.run() == Gtk.ResponseType.OK: os.system("systemctl reboot")
+        confirmed = dialog.run() == Gtk.ResponseType.OK
         dialog.destroy()
+        if confirmed: self._shut_down_guests_then("reboot")
+
+    def _shut_down_guests_then(self, action):
+        # Guests of this machine are shut down (or saved) first so none is killed mid-write by the host going away
+        if self.guest_shutdown is not None: return
+        if self.bulk_run is not None: self.bulk_run.cancel()
+        self.guest_shutdown = self.service.host_shutdown(GLib.idle_add)
+        if not self.guest_shutdown.jobs: self._on_host_shutdown_finished(self.guest_shutdown, action); return
+        HostShutdownDialog(self, self.guest_shutdown, action).show_all()
+
+    def _on_host_shutdown_finished(self, shutdown, action):
+        self.service.end_host_shutdown(shutdown); self.guest_shutdown = None
+        if shutdown.cancelled: self._on_vm_action_done(None); return
+        for result in shutdown.results:
+            if result.state == host_shutdown.FAILED: print(f"Could not stop {result.name} before host {action}: {result.error}", file=sys.stderr)
+        os.system(f"systemctl {action}")
 
     def show_error_dialog(self, message):
         dialog = Gtk.MessageDialog(transient_for=self, flags=0, message_type=Gtk.MessageType.ERROR, buttons=Gtk.ButtonsType.CANCEL, text=_("An Error Occurred")); dialog.format_secondary_text(message); dialog.run(); dialog.destroy()
@@ -608,6 +1219,8 @@ class VMLauncher(Gtk.Window):
 if __name__ == "__main__":
     if os.geteuid() != 0 and 'libvirt' not in os.popen('groups').read():
          print(_("Error: This program must be run as root or by a user in the 'libvirt' group."), file=sys.stderr); sys.exit(1)
+    metrics.install_from_env()
     win = VMLauncher()
     win.show_all()
-    Gtk.main()
\ No newline at end of file
+    Gtk.main()
+    sys.exit(win.exit_code)
\ No newline at end of file
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# Query and drive the VM launcher from scripts. Talks to the running kiosk over its control socket,
+# or opens libvirt itself (no GTK) when no launcher is running or --direct is given.
+import argparse
+import json
+import sys
+
+import bulk_actions
+import control_api
+import launch_profiles
+import launcher_service
+
+STATE_NAMES = {0: "no state", 1: "running", 2: "blocked", 3: "paused", 4: "shutting down", 5: "shut off", 6: "crashed", 7: "suspended"}
+
+
+def run_direct(request):
+    settings = launcher_service.load_settings()
+    service = launcher_service.LauncherService(launcher_service.hosts_from_settings(settings), lambda callback, *args: None,
+                                               launch_options=launch_profiles.options_from_settings(settings), **bulk_actions.options_from_settings(settings))
+    try:
+        if not service.connect(): return {'ok': False, 'error': "Could not connect to libvirt"}
+        service.refresh()
+        try: return {'ok': True, 'result': control_api.execute(service, request)}
+        except control_api.REQUEST_ERRORS as e: return {'ok': False, 'error': str(e)}
+    finally:
+        service.stop()
+
+
+def print_result(command, result):
+    if command in ('list', 'refresh'):
+        for vm in result:
+            state = "offline" if vm['offline'] else STATE_NAMES.get(vm['state'], str(vm['state']))
+            print(f"{vm['name']:<32} {state:<14} {vm['vm_type']:<12} {vm['host'] or '-'}")
+    elif command == 'plan':
+        print(result['summary'] if result else "No launch profile")
+    elif isinstance(result, list):
+        # Per-VM outcome of a group action
+        for vm in result: print(f"{vm['name']:<32} {vm['state']:<10} {vm['error'] or ''}".rstrip())
+    elif isinstance(result, dict):
+        for key, value in result.items(): print(f"{key}: {', '.join(value) if isinstance(value, list) else value}")
+    elif result is not None:
+        print(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Control the VM launcher without its window.")
+    parser.add_argument('--direct', action='store_true', help="talk to libvirt directly instead of the running launcher")
+    parser.add_argument('--json', action='store_true', help="print the raw JSON response")
+    parser.add_argument('--socket', default=control_api.SOCKET_PATH, help="control socket (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('list', help="list VMs and their state")
+    subparsers.add_parser('refresh', help="re-read all hosts, then list")
+    subparsers.add_parser('groups', help="list the VM groups from settings.ini and their members")
+    for command, help_text in (('start', "start a VM (passthrough VMs go through the revival supervisor)"), ('shutdown', "ask a VM to shut down"),
+                               ('reboot', "reboot a VM"), ('destroy', "force a VM off")):
+        action_parser = subparsers.add_parser(command, help=help_text)
+        action_parser.add_argument('vm', nargs='?')
+        action_parser.add_argument('--group', help="act on every VM of a group, a few at a time")
+    for command, help_text in (('status', "show one VM"), ('display', "show a running VM's graphics settings"),
+                               ('plan', "show the CPU pinning and memory plan a VM runs with, or would start with"),
+                               ('select', "show a VM in the launcher carousel"), ('view', "open a VM fullscreen in the launcher")):
+        subparsers.add_parser(command, help=help_text).add_argument('vm')
+    volume_parser = subparsers.add_parser('volume', help="print or set the host volume in percent")
+    volume_parser.add_argument('value', nargs='?', type=int)
+    args = parser.parse_args()
+    if not args.command: parser.print_help(); return 2
+
+    request = {'command': args.command, 'vm': getattr(args, 'vm', None), 'value': getattr(args, 'value', None), 'group': getattr(args, 'group', None)}
+    response = None
+    if not args.direct:
+        try: response = control_api.request(request['command'], request['vm'], request['value'], path=args.socket, group=request['group'])
+        except (FileNotFoundError, ConnectionRefusedError): pass
+        except OSError as e: response = {'ok': False, 'error': f"Control socket error: {e}"}
+    if response is None: response = run_direct(request)
+
+    if args.json: print(json.dumps(response, indent=2))
+    elif response['ok']: print_result(args.command, response.get('result'))
+    else: print(f"Error: {response['error']}", file=sys.stderr)
+    if not response['ok']: return 1
+    # A group action succeeds only if every member did
+    return 1 if request['group'] and any(vm['state'] == bulk_actions.FAILED for vm in response['result']) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())